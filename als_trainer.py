@@ -0,0 +1,104 @@
+"""
+Alternating least squares matrix factorization over the observed ratings only
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+
+
+def solve_factors(ratings, factors, regularization, n_threads=1, block_size=256):
+    """Solve the regularized least squares factors of every row of a sparse ratings matrix
+
+    Each row u gets (F_u^T F_u + lambda n_u I)^-1 F_u^T r_u, where F_u holds
+    the factor rows of the columns u rated, so unrated cells play no part.
+    Rows are taken in order of their rating counts and solved in blocks: a
+    block's F_u are zero-padded into one (rows x max count x factors) array,
+    so its Gram matrices and right-hand sides are two batched matrix
+    products, and its systems are solved together. Blocks run on a thread
+    pool; the BLAS products and LAPACK solves release the GIL.
+    """
+    ratings = sp.csr_matrix(ratings, dtype=np.float32)
+    factors = np.ascontiguousarray(factors, dtype=np.float32)
+    n_rows, n_factors = ratings.shape[0], factors.shape[1]
+
+    counts = np.diff(ratings.indptr)
+    order = np.argsort(counts, kind='stable')
+    identity = np.eye(n_factors)
+    solved = np.zeros((n_rows, n_factors), dtype=np.float32)
+
+    def solve_block(start):
+        rows = order[start:start + block_size]
+        block = ratings[rows]
+        block_counts = counts[rows]
+
+        # Scatter each row's rated factor rows and ratings into padded arrays
+        row_of_entry = np.repeat(np.arange(len(rows)), block_counts)
+        position = np.arange(block.nnz) - block.indptr[row_of_entry]
+        padded = np.zeros((len(rows), max(int(block_counts.max()), 1), n_factors), dtype=np.float32)
+        padded[row_of_entry, position] = factors[block.indices]
+        values = np.zeros(padded.shape[:2], dtype=np.float32)
+        values[row_of_entry, position] = block.data
+
+        gram = np.matmul(padded.transpose(0, 2, 1), padded).astype(np.float64)
+        # Rows with no ratings get lambda I and a zero right-hand side, so zero factors
+        gram += regularization * np.maximum(block_counts, 1)[:, None, None] * identity
+        rhs = np.matmul(padded.transpose(0, 2, 1), values[:, :, None]).astype(np.float64)
+        solved[rows] = np.linalg.solve(gram, rhs)[:, :, 0]
+
+    starts = range(0, n_rows, block_size)
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(solve_block, starts))
+    else:
+        for start in starts:
+            solve_block(start)
+    return solved
+
+
+class AlternatingLeastSquares:
+    """Explicit-feedback matrix factorization trained by alternating least squares
+
+    Fits R ~ U V on the stored ratings of a sparse users x items matrix,
+    treating missing cells as missing rather than as zeros, with the
+    weighted-lambda regularization of ALS-WR. Follows the scikit-learn
+    decomposition API: after fit, components_ holds the item factors
+    (n_factors x n_items) and transform solves user factors for rows of
+    ratings against them.
+    """
+
+    def __init__(self, n_factors=50, n_iter=15, regularization=0.05, n_threads=None, random_state=42):
+        self.n_factors = n_factors
+        self.n_iter = n_iter
+        self.regularization = regularization
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.random_state = random_state
+
+    def fit(self, ratings):
+        """Fit user and item factors to a sparse users x items ratings matrix"""
+        ratings = sp.csr_matrix(ratings, dtype=np.float32)
+        ratings_by_item = ratings.T.tocsr()
+        rng = np.random.default_rng(self.random_state)
+        item_factors = rng.normal(0, 1 / np.sqrt(self.n_factors),
+                                  (ratings.shape[1], self.n_factors)).astype(np.float32)
+
+        for _ in range(self.n_iter):
+            user_factors = solve_factors(ratings, item_factors, self.regularization, self.n_threads)
+            item_factors = solve_factors(ratings_by_item, user_factors, self.regularization, self.n_threads)
+
+        self.user_factors_ = solve_factors(ratings, item_factors, self.regularization, self.n_threads)
+        self.components_ = item_factors.T
+        return self
+
+    def transform(self, ratings):
+        """Solve user factors for rows of ratings against the fitted item factors"""
+        return solve_factors(ratings, self.components_.T, self.regularization, self.n_threads)
+
+    def fit_transform(self, ratings):
+        return self.fit(ratings).user_factors_
+
+    def rmse(self, ratings):
+        """Root mean squared error of the fitted model on the stored ratings of a matrix"""
+        ratings = sp.coo_matrix(ratings)
+        predicted = np.einsum('ij,ji->i', self.user_factors_[ratings.row], self.components_[:, ratings.col])
+        return float(np.sqrt(np.mean((predicted - ratings.data) ** 2)))
@@ -0,0 +1,138 @@
+"""
+Approximate maximum inner product search over item factor vectors
+"""
+import numpy as np
+from recommender_engine import top_k
+
+
+class InnerProductIndex:
+    """Inverted-file (IVF) index that finds the items with the largest dot product with a query
+
+    Item vectors get one extra coordinate so they all have the same norm;
+    the largest dot product then becomes the nearest neighbor on a sphere,
+    which k-means clusters well. A search scores every item in the n_probe
+    lists whose centroids best match the query and keeps the top k of those.
+
+    A loaded index can search int8 item vectors instead: from_arrays takes
+    item_scales alongside them, and each item's dot product is scaled back.
+    """
+
+    item_scales = None
+
+    # Arrays that fully describe a built index
+    ARRAYS = ('item_vectors', 'centroids', 'list_items', 'list_offsets')
+
+    def __init__(self, item_vectors, n_lists=None, n_probe=8, n_iter=10, random_state=42):
+        self.item_vectors = np.ascontiguousarray(item_vectors, dtype=np.float32)
+        n_items, n_dims = self.item_vectors.shape
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(n_items)), n_items))
+        self.n_probe = n_probe
+
+        # Lift every vector onto the sphere of radius max_norm, then scale to unit length
+        norms = np.linalg.norm(self.item_vectors, axis=1)
+        max_norm = max(float(norms.max()) if n_items else 0.0, 1e-12)
+        extra = np.sqrt(np.maximum(max_norm ** 2 - norms ** 2, 0))
+        augmented = np.column_stack([self.item_vectors, extra]) / max_norm
+
+        self.centroids = self._spherical_kmeans(augmented, n_iter, np.random.default_rng(random_state))
+        assignments = np.argmax(augmented @ self.centroids.T, axis=1)
+
+        # Lists are stored back to back: list i holds list_items[list_offsets[i]:list_offsets[i + 1]]
+        self.list_items = np.argsort(assignments, kind='stable')
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))])
+
+        # Queries have 0 in the extra coordinate, so only the factor part of a centroid matters
+        self.query_centroids = np.ascontiguousarray(self.centroids[:, :n_dims])
+
+    def to_arrays(self):
+        """Get the index's arrays for saving"""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe=8):
+        """Rebuild an index from arrays saved with to_arrays"""
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        index.item_scales = arrays.get('item_scales')
+        index.n_lists = len(index.centroids)
+        index.n_probe = n_probe
+        index.query_centroids = np.ascontiguousarray(index.centroids[:, :index.item_vectors.shape[1]])
+        return index
+
+    def _spherical_kmeans(self, vectors, n_iter, rng):
+        """Cluster unit vectors by cosine similarity; returns unit-length centroids"""
+        centroids = vectors[rng.choice(len(vectors), self.n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+
+            # Re-seed empty clusters with random items
+            empty = np.flatnonzero(np.bincount(assignments, minlength=self.n_lists) == 0)
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        return centroids
+
+    def candidates(self, query, n_probe=None):
+        """Get the items in the n_probe lists whose centroids best match the query"""
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probed = np.argpartition(-(self.query_centroids @ query), n_probe - 1)[:n_probe]
+        return np.concatenate([self.list_items[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probed])
+
+    def scores(self, items, query):
+        """Dot products of a query with the given items' vectors"""
+        scores = self.item_vectors[items] @ query
+        if self.item_scales is not None:
+            scores *= self.item_scales[items]
+        return scores
+
+    def search(self, query, k, seen_mask=None, exclude=None, n_probe=None):
+        """Get the approximate top k (item indexes, scores) for a query vector
+
+        Seen and excluded items are skipped. If the probed lists hold fewer
+        than k usable items, more lists are probed until k are found or the
+        whole catalog has been scanned.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        while True:
+            items = self.candidates(query, n_probe)
+            skip = seen_mask[items] if seen_mask is not None else np.zeros(len(items), dtype=bool)
+            if exclude is not None and len(exclude):
+                skip |= np.isin(items, exclude)
+
+            top, scores = top_k(self.scores(items, query), k, seen_mask=skip)
+            if len(top) >= k or n_probe >= self.n_lists:
+                return items[top], scores
+            n_probe = min(n_probe * 2, self.n_lists)
+
+
+def exact_search(item_vectors, query, k, seen_mask=None):
+    """Exact top k (item indexes, scores) by brute-force dot products, skipping seen items"""
+    return top_k(np.asarray(item_vectors, dtype=np.float32) @ np.asarray(query, dtype=np.float32), k, seen_mask)
+
+
+def measure_recall(index, queries, k=10, n_probe=None, seen_masks=None):
+    """Compare approximate search against exact search for a set of query vectors
+
+    seen_masks holds each query's rated items, which both searches skip,
+    as serving does. Returns the mean recall@k and the average fraction of
+    the catalog scored per query.
+    """
+    recalls = []
+    scanned = []
+    for row, query in enumerate(np.asarray(queries, dtype=np.float32)):
+        seen = seen_masks[row] if seen_masks is not None else None
+        exact_items, _ = exact_search(index.item_vectors, query, k, seen)
+        approximate_items, _ = index.search(query, k, seen_mask=seen, n_probe=n_probe)
+        recalls.append(len(np.intersect1d(exact_items, approximate_items)) / max(len(exact_items), 1))
+        scanned.append(len(index.candidates(query, n_probe)) / len(index.item_vectors))
+    return {
+        'recall_at_k': float(np.mean(recalls)) if recalls else 0.0,
+        'fraction_scanned': float(np.mean(scanned)) if scanned else 0.0,
+        'k': k,
+        'n_probe': min(n_probe or index.n_probe, index.n_lists),
+        'n_lists': index.n_lists
+    }
@@ -1,15 +1,22 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from werkzeug.routing import BaseConverter
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
 from sklearn.decomposition import TruncatedSVD, NMF
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
 import os
 import re
 import random
+import time
+import threading
+import multiprocessing
+import contextvars
+import hmac
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from collections import defaultdict
 import warnings
 warnings.filterwarnings('ignore')
@@ -17,29 +24,258 @@ import re
 import random
 from tmdb_client import TMDBClient
 from rating_db import RatingDatabase
+from ratings_store import RatingsStore, parse_user_id
+from ann_index import InnerProductIndex, measure_recall
+from user_neighbors import UserNeighborIndex
+from quantization import quantize_rows, dequantize_rows, quantized_scores, precision_report
+from model_store import bundle_key, latest_bundle_key, save_bundle, load_bundle, memory_usage
+from als_trainer import AlternatingLeastSquares, solve_factors
+from biased_mf import BiasedMatrixFactorization, fold_in_biased_user
+from popularity import PopularityModel
+from recommender_engine import (build_item_neighbors_blocked, similar_items, item_knn_scores, user_knn_scores,
+                                align_item_features, content_profile, content_scores, combine_scores,
+                                item_knn_scores_block, content_scores_block, top_k, top_k_per_row,
+                                fold_in_user, user_neighbors_for_vector)
 
 app = Flask(__name__)
 CORS(app)
 
+class UserIdConverter(BaseConverter):
+    """User ids in routes: integers, like u.data's, or strings, like Firebase uids"""
+
+    def to_python(self, value):
+        return parse_user_id(value)
+
+    def to_url(self, value):
+        return str(value)
+
+app.url_map.converters['user_id'] = UserIdConverter
+
 # Initialize TMDB client and rating database
 tmdb_client = TMDBClient()
 rating_db = RatingDatabase()
 
-# Global variables to store multiple trained models and data
-models = {
-    'svd': None,
-    'nmf': None,
-    'item_knn': None,
-    'user_knn': None,
-    'content': None
+MODEL_NAMES = ('svd', 'nmf', 'als', 'biased_mf', 'item_knn', 'user_knn', 'content')
+
+class ServingBundle:
+    """Everything requests are served from: the trained models with the ratings and catalog they were built on
+
+    models maps each model name to its model, or None until it is ready;
+    info describes the bundle for /status. popularity (over u.data and the
+    app ratings, for top-rated and cold-start lists) and data_timestamps
+    (the u.data ratings' timestamps laid out like all_ratings, for the ones
+    app ratings replace) are rebuilt with each bundle. folded_users caches
+    the fold-ins of users who only have app ratings, until they rate again;
+    dirty_users are the users who have rated since the bundle was built,
+    whose stored top-N lists are stale.
+
+    A bundle is never changed field by field once it is live, apart from
+    get_popularity swapping in a popularity model rebuilt from the database:
+    a new one replaces it, so a request that takes it once sees one bundle
+    throughout.
+    """
+
+    def __init__(self, models=None, train_ratings=None, all_ratings=None, data=None, movie_titles=None,
+                 movie_genres=None, info=None, popularity=None, data_timestamps=None):
+        self.models = models if models is not None else dict.fromkeys(MODEL_NAMES)
+        self.train_ratings = train_ratings
+        self.all_ratings = all_ratings
+        self.data = data
+        self.movie_titles = movie_titles if movie_titles is not None else {}
+        self.movie_genres = movie_genres if movie_genres is not None else {}
+        self.info = info if info is not None else {}
+        self.popularity = popularity
+        self.data_timestamps = data_timestamps
+        self.folded_users = {}
+        self.dirty_users = set()
+
+    def with_model(self, model_name, model):
+        """Get a copy of the bundle with one model replaced, sharing its ratings and dirty users"""
+        bundle = ServingBundle(dict(self.models, **{model_name: model}), self.train_ratings, self.all_ratings,
+                               self.data, self.movie_titles, self.movie_genres, self.info, self.popularity,
+                               self.data_timestamps)
+        bundle.dirty_users = self.dirty_users
+        return bundle
+
+# The live bundle. Swaps replace the reference; each request takes it once, when
+# it starts (see current_bundle), so a swap neither waits for requests nor lands
+# in the middle of one
+live = ServingBundle()
+request_bundle = contextvars.ContextVar('request_bundle', default=None)
+
+# Held while ratings are added to the live bundle and while it is replaced, so a
+# swap carries over every rating added to the bundle it replaces
+publish_lock = threading.Lock()
+
+training_times = {}
+
+# Readiness of each model: state ('pending', 'training', 'ready' or 'failed'),
+# where it came from and the seconds it took to train or load
+model_states = {model_name: {'state': 'pending'} for model_name in MODEL_NAMES}
+
+retrain_lock = threading.Lock()
+retrain_status = {'running': False, 'started_at': None, 'finished_at': None, 'last_error': None}
+
+# Top-N store for the live bundle as (bundle version, arrays, meta)
+top_n_store = None
+top_n_checked_at = 0
+
+# Every movie's (average app rating, count) for the user_rating stats movie
+# listings show, read from the ratings database when last refreshed
+rating_stats = {}
+rating_stats_loaded_at = 0
+
+# When the live popularity model was last rebuilt from the ratings database
+popularity_loaded_at = 0
+
+# Whether the thread refreshing the neighbor lists of users who rated has been started
+neighbor_refresh_started = False
+neighbor_refresh_lock = threading.Lock()
+
+# Models served from precomputed user and item factor matrices
+FACTOR_MODELS = ('svd', 'nmf', 'als', 'biased_mf')
+
+# Item-KNN neighborhood size and minimum similarity for a neighbor to count
+ITEM_KNN_NEIGHBORS = 20
+ITEM_KNN_MIN_SIMILARITY = 0.1
+
+# Fewest users two items must share to be neighbors, and the shrinkage that
+# discounts similarities resting on few of them (0 = plain cosine)
+ITEM_KNN_MIN_SUPPORT = 1
+ITEM_KNN_SHRINKAGE = 0.0
+
+# Items whose similarities are computed at once when building the item
+# neighbors, and threads that build blocks side by side; only block x items
+# similarities are held at a time, and the neighbors do not depend on either
+ITEM_KNN_BLOCK_SIZE = 256
+ITEM_KNN_THREADS = int(os.environ.get('ITEM_KNN_THREADS', os.cpu_count() or 1))
+
+# User-KNN neighbor list size, minimum similarity, and raters used per item
+USER_KNN_NEIGHBORS = 20
+USER_KNN_MIN_SIMILARITY = 0.1
+USER_KNN_MAX_RATERS = 10
+
+# Users whose similarities are computed at once when building the user
+# neighbor index, and threads that build blocks side by side; only block x
+# users similarities are held at a time, and the index does not depend on either
+USER_KNN_BLOCK_SIZE = 256
+USER_KNN_THREADS = int(os.environ.get('USER_KNN_THREADS', os.cpu_count() or 1))
+
+# Default model weights for the ensemble
+ENSEMBLE_WEIGHTS = {'svd': 0.35, 'nmf': 0.25, 'item_knn': 0.15, 'content': 0.25}
+
+# Users scored per matrix multiply in batch recommendations
+BATCH_BLOCK_SIZE = 256
+
+# Most fold-ins kept in memory; the oldest are dropped first
+FOLD_IN_CACHE_SIZE = 10000
+
+# Approximate retrieval index over the SVD/NMF item factors: number of
+# lists (None = sqrt of the catalog size), lists scanned per query, and
+# users sampled to measure recall against exact search at train time
+ANN_N_LISTS = None
+ANN_N_PROBE = 16
+ANN_RECALL_SAMPLE = 200
+
+# Precision of the item factors the factor models score with: 'float32', or 'int8'
+# for per-item scaled int8 vectors (a quarter of the memory) in exact and ANN scoring.
+# int8 saves memory only: its rows are widened to float32 in blocks to score, a little slower.
+# Both are saved in every bundle and compared against float64 at train time
+SERVING_PRECISION = os.environ.get('SERVING_PRECISION', 'float32')
+
+# Default retrieval for SVD/NMF recommendations: 'exact' or 'ann'
+DEFAULT_RETRIEVAL = os.environ.get('RECOMMENDER_RETRIEVAL', 'exact')
+
+# Trained models are saved as versioned bundles under ARTIFACT_DIR, keyed by a
+# hash of the data files and the training config, and loaded on startup as
+# read-only memory maps so every worker shares one copy of the arrays
+ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', 'artifacts')
+DATA_FILES = ['ml-100k/u.data', 'ml-100k/u.item']
+
+# How /recommendations is answered: 'online' scores every request, 'precomputed'
+# reads the top N from the store precompute_recommendations.py writes for the live
+# bundle and only scores users it does not cover or who have rated since
+SERVING_MODE = os.environ.get('RECOMMENDATION_SERVING_MODE', 'online')
+
+# Precomputed top-N store: directory, list length per user and model, processes the
+# job scores blocks of users on, and seconds between looks for a store for a new bundle
+TOP_N_DIR = os.path.join(ARTIFACT_DIR, 'top_n')
+TOP_N_SIZE = int(os.environ.get('TOP_N_SIZE', '50'))
+TOP_N_PROCESSES = int(os.environ.get('TOP_N_PROCESSES', os.cpu_count() or 1))
+TOP_N_RELOAD_SECONDS = 30
+
+# Names models carry in their recommendations
+MODEL_LABELS = {'svd': 'SVD', 'nmf': 'NMF', 'als': 'ALS', 'biased_mf': 'Biased-MF', 'item_knn': 'Item-KNN',
+                'user_knn': 'User-KNN', 'content': 'Content-Based', 'ensemble': 'Ensemble'}
+
+# Models whose recommendations search TMDB for posters missing from the metadata
+# cache; every other model only shows cached posters
+POSTER_SEARCH_MODELS = ('svd', 'ensemble')
+
+# Popularity rankings damp each movie's mean towards the global mean as if it had
+# POPULARITY_PRIOR_COUNT more ratings at it; the recent ranking halves a rating's
+# weight for every POPULARITY_HALF_LIFE_DAYS of its age
+POPULARITY_PRIOR_COUNT = 10
+POPULARITY_HALF_LIFE_DAYS = 90
+
+# Seconds between rereads of the app rating stats and rebuilds of the popularity
+# rankings, so every worker shows ratings saved through the others this soon
+RATING_STATS_REFRESH_SECONDS = 10
+
+# Seconds between background refreshes of the user-KNN neighbor lists of users who
+# rated since the last one, all refreshed together; until then they keep their old lists
+USER_NEIGHBOR_REFRESH_SECONDS = 2
+
+# Seconds between background retrains that pick up new app ratings (0 = only on request)
+RETRAIN_INTERVAL = int(os.environ.get('RETRAIN_INTERVAL_SECONDS', '0'))
+
+# Bearer token the /admin routes require; they are disabled when it is not set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Worker processes that fit the models side by side (1 = one after another in this
+# process); the fitted models do not depend on it
+TRAINING_PROCESSES = int(os.environ.get('TRAINING_PROCESSES', '1'))
+
+# Order models are trained in when serving starts before they are ready: quickest
+# first, so requests are answered early. A request for a model that is not ready
+# is served by the first ready model in this order instead
+MODEL_PRIORITY = ('content', 'svd', 'item_knn', 'user_knn', 'nmf', 'als', 'biased_mf')
+
+# When no bundle can be loaded at startup, start serving right away and train
+# the models in the background rather than waiting for all of them
+BACKGROUND_TRAINING = os.environ.get('BACKGROUND_MODEL_TRAINING', 'true').lower() == 'true'
+
+# Threads used to solve ALS factor blocks; the result does not depend on it
+ALS_THREADS = int(os.environ.get('ALS_THREADS', os.cpu_count() or 1))
+
+# /compare runs its models side by side on a pool of COMPARE_WORKERS threads
+# shared by all requests, and gives each model COMPARE_DEADLINE_SECONDS (or its
+# entry in COMPARE_MODEL_DEADLINES) before reporting it as timed out
+COMPARE_WORKERS = int(os.environ.get('COMPARE_WORKERS', '4'))
+COMPARE_DEADLINE_SECONDS = float(os.environ.get('COMPARE_DEADLINE_SECONDS', '5'))
+COMPARE_MODEL_DEADLINES = {}
+
+# Threads /compare runs its models on; a model past its deadline keeps its thread until it finishes
+compare_executor = ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix='compare')
+
+# Settings for the train/test split and the factor and content models
+TRAINING_CONFIG = {
+    'test_size': 0.2,
+    'random_state': 42,
+    'factor_components': 50,
+    'nmf_max_iter': 200,
+    'als_factors': 50,
+    'als_iterations': 10,
+    'als_regularization': 0.1,
+    'mf_factors': 50,
+    'mf_learning_rate': 0.02,
+    'mf_regularization': 0.1,
+    'mf_batch_size': 1024,
+    'mf_max_epochs': 50,
+    'mf_patience': 3,
+    'mf_validation_fraction': 0.1,
+    'tfidf_max_features': 100
 }
-train_user_item_matrix = None
-data = None
-user_item_matrix = None
-movie_titles = {}
-movie_genres = {}
-item_similarity_matrix = None
-user_similarity_matrix = None
 
 def load_movie_titles():
     """Load movie titles and genres from u.item file"""
@@ -84,276 +320,1135 @@ def load_movie_titles():
     
     return movie_titles, movie_genres
 
-def load_and_train_model():
-    """Load data and train multiple recommendation models"""
-    global models, train_user_item_matrix, data, user_item_matrix, movie_titles, movie_genres
-    global item_similarity_matrix, user_similarity_matrix
-    
-    # Load movie titles and genres
-    movie_titles, movie_genres = load_movie_titles()
+def build_factor_model(estimator, ratings_matrix):
+    """Precompute user and item factors so serving a user is one row x factor-matrix product"""
+    return {
+        'user_factors': estimator.transform(ratings_matrix).astype(np.float32),
+        'item_factors': estimator.components_.astype(np.float32)
+    }
+
+def fold_in_factors(model_name, user_vector):
+    """Get a factor model's user vector for ratings outside the training data
+
+    ALS and biased MF solve against the observed ratings only, as in
+    training; SVD and NMF use least squares over the zero-filled vector.
+    """
+    item_factors = get_item_factors(model_name)
+    if model_name == 'als':
+        return solve_factors(user_vector[None, :], item_factors.T, TRAINING_CONFIG['als_regularization'])[0]
+    if model_name == 'biased_mf':
+        return fold_in_biased_user(item_factors, user_vector, TRAINING_CONFIG['mf_regularization'])
+    return fold_in_user(item_factors, user_vector, nonnegative=(model_name == 'nmf'))
+
+def current_bundle():
+    """Get the bundle to serve from: the one the current request started on, or else the live one"""
+    return request_bundle.get() or live
+
+def get_item_factors(model_name):
+    """Get a factor model's item factors (factors x items) as floats, dequantizing int8 ones"""
+    live = current_bundle()
+    factors = live.models[model_name]
+    if factors.get('item_factors') is not None:
+        return factors['item_factors']
+    return dequantize_rows(factors['item_codes'], factors['item_scales']).T
+
+def get_item_vectors(model_name, item_indices):
+    """Get the vectors of the given items from a factor model at the serving precision (items x factors)"""
+    live = current_bundle()
+    factors = live.models[model_name]
+    if SERVING_PRECISION == 'int8' and factors.get('item_codes') is not None:
+        return factors['item_codes'][item_indices] * factors['item_scales'][item_indices, None]
+    return factors['item_factors'][:, item_indices].T
+
+def score_items(model_name, user_factors):
+    """Dot products of a user vector, or a block of user rows, with every item at the serving precision"""
+    live = current_bundle()
+    factors = live.models[model_name]
+    if SERVING_PRECISION == 'int8' and factors.get('item_codes') is not None:
+        return quantized_scores(factors['item_codes'], factors['item_scales'], user_factors)
+    return np.dot(user_factors, factors['item_factors'])
+
+def quantize_item_factors(model_name, factors):
+    """Add int8 item factors with per-item scales and report their accuracy against float64"""
+    factors['item_codes'], factors['item_scales'] = quantize_rows(factors['item_factors'].T)
+    
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(factors['user_factors']), min(ANN_RECALL_SAMPLE, len(factors['user_factors'])), replace=False)
+    report = precision_report(factors['user_factors'][sample], factors['item_factors'].T, k=10)
+    print(f"{model_name.upper()} precision vs float64: float32 RMSE {report['float32']['rmse']:.2e}, "
+          f"int8 RMSE {report['int8']['rmse']:.4f}, int8 top-10 overlap {report['int8']['top_k_overlap']:.3f}")
+    
+    factors['precision_report'] = report
+    return factors
+
+def build_ann_index(model_name, factors, ratings_matrix):
+    """Index a factor model's item vectors for approximate retrieval and measure its recall
+
+    Recall is measured on the sampled users' unrated items, the ones they
+    are recommended from.
+    """
+    index = InnerProductIndex(factors['item_factors'].T, n_lists=ANN_N_LISTS, n_probe=ANN_N_PROBE)
+    
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(factors['user_factors']), min(ANN_RECALL_SAMPLE, len(factors['user_factors'])), replace=False)
+    report = measure_recall(index, factors['user_factors'][sample], k=10,
+                            seen_masks=ratings_matrix[sample].toarray() > 0)
+    print(f"{model_name.upper()} ANN index: {index.n_lists} lists, recall@10 {report['recall_at_k']:.3f} "
+          f"scanning {report['fraction_scanned']:.1%} of items")
+    
+    factors['ann_index'] = index
+    factors['ann_recall'] = report
+    return factors
+
+def get_folded_user(user_id):
+    """Fold in a user who is not in the trained models from their app ratings
+
+    Their ratings become a vector over the training items, and each factor
+    model gets a user vector by least squares against its item factors.
+    Returns None if the user has no ratings on known items.
+    """
+    live = current_bundle()
+    folded = live.folded_users.get(user_id)
+    if folded is not None:
+        return folded
+    
+    user_vector = np.zeros(live.train_ratings.n_items, dtype=np.float32)
+    for rating in rating_db.get_user_ratings(user_id):
+        if live.train_ratings.has_item(rating['movie_id']):
+            user_vector[live.train_ratings.item_index[rating['movie_id']]] = rating['rating']
+    if not user_vector.any():
+        return None
+    
+    folded = {
+        'user_vector': user_vector,
+        'seen': user_vector > 0,
+        'factors': {model_name: fold_in_factors(model_name, user_vector)
+                    for model_name in FACTOR_MODELS if live.models[model_name] is not None}
+    }
     
+    if len(live.folded_users) >= FOLD_IN_CACHE_SIZE:
+        live.folded_users.pop(next(iter(live.folded_users)), None)
+    live.folded_users[user_id] = folded
+    return folded
+
+def resolve_user(user_id):
+    """Get (user_idx, folded) for a user: their training row, or else a fold-in of their app ratings
+
+    Exactly one of the two is set for a known user; both are None for a
+    user with no ratings anywhere.
+    """
+    live = current_bundle()
+    if live.train_ratings.has_user(user_id):
+        return live.train_ratings.user_index[user_id], None
+    return None, get_folded_user(user_id)
+
+def is_model_ready(model_name):
+    """Whether a model (or, for the ensemble, any of its members) can serve requests"""
+    live = current_bundle()
+    if model_name == 'ensemble':
+        return any(live.models.get(name) is not None for name in ENSEMBLE_WEIGHTS)
+    return live.models.get(model_name) is not None
+
+def resolve_model(model_name, supported=None):
+    """Get (model to serve, fallback info) for a request for model_name
+
+    A model that is not ready yet is replaced by the first ready model in
+    MODEL_PRIORITY (limited to supported, if given), and the fallback info
+    says so; it is None when the requested model serves. Unknown names pass
+    through for the caller to report. The model is None if nothing is ready.
+    """
+    live = current_bundle()
+    if is_model_ready(model_name) or (model_name not in live.models and model_name != 'ensemble'):
+        return model_name, None
+    
+    served_model = next((name for name in MODEL_PRIORITY
+                         if is_model_ready(name) and (supported is None or name in supported)), None)
+    state = model_states.get(model_name, {}).get('state', 'pending')
+    return served_model, {'requested_model': model_name, 'served_model': served_model,
+                          'reason': f"{model_name} is {'not ready yet' if state in ('pending', 'training') else state}"}
+
+def get_user_vector(user_idx, folded=None):
+    """Get a training or folded-in user's ratings over all items (0 = unrated)"""
+    live = current_bundle()
+    return folded['user_vector'] if folded is not None else live.train_ratings.user_vector(user_idx)
+
+def get_seen_mask(user_idx, folded=None):
+    """Get a training or folded-in user's mask of rated items"""
+    live = current_bundle()
+    return folded['seen'] if folded is not None else live.train_ratings.seen_mask(user_idx)
+
+def get_folded_factors(model_name, folded):
+    """Get a folded-in user's vector for a factor model, folding it in on first use
+
+    A fold-in is cached with vectors for the models ready when it was built;
+    models published since get theirs here.
+    """
+    factors = folded['factors'].get(model_name)
+    if factors is None:
+        factors = folded['factors'][model_name] = fold_in_factors(model_name, folded['user_vector'])
+    return factors
+
+def get_user_factors(model_name, user_idx, folded=None):
+    """Get a training or folded-in user's vector for a factor model"""
+    live = current_bundle()
+    if folded is not None:
+        return get_folded_factors(model_name, folded)
+    return live.models[model_name]['user_factors'][user_idx]
+
+def get_factor_top_items(model_name, user_idx, n_recommendations, exclude_items=None, retrieval='exact', folded=None):
+    """Get a factor model's top N unrated items for a user, by exact scoring or from the ANN index"""
+    live = current_bundle()
+    factors = live.models[model_name]
+    seen = get_seen_mask(user_idx, folded)
+    if retrieval == 'ann' and factors.get('ann_index') is not None:
+        return factors['ann_index'].search(get_user_factors(model_name, user_idx, folded), n_recommendations,
+                                           seen, exclude_items)
+    return top_k(get_model_scores(model_name, user_idx, folded), n_recommendations, seen, exclude_items)
+
+def get_model_scores(model_name, user_idx, folded=None):
+    """Get a model's predicted rating for every item (-inf where it has none)
+
+    Scores the training user at user_idx, or the folded-in user when
+    folded is given.
+    """
+    live = current_bundle()
+    if model_name in FACTOR_MODELS:
+        return score_items(model_name, get_user_factors(model_name, user_idx, folded))
+    elif model_name == 'item_knn':
+        return item_knn_scores(live.models['item_knn']['neighbors'], get_user_vector(user_idx, folded))
+    elif model_name == 'user_knn':
+        if folded is not None:
+            neighbor_indices, neighbor_similarities = user_neighbors_for_vector(live.train_ratings.matrix,
+                                                                                folded['user_vector'],
+                                                                                n_neighbors=USER_KNN_NEIGHBORS)
+        else:
+            neighbor_indices, neighbor_similarities = live.models['user_knn']['index'].neighbors(user_idx)
+        return user_knn_scores(live.train_ratings.rows(neighbor_indices), neighbor_similarities,
+                               min_similarity=USER_KNN_MIN_SIMILARITY,
+                               max_raters=USER_KNN_MAX_RATERS)
+    elif model_name == 'content':
+        similarity_scores = content_scores(live.models['content']['content_matrix'],
+                                           get_user_vector(user_idx, folded),
+                                           live.models['content']['has_features'])
+        return similarity_scores * 5  # Scale similarity to rating
+    raise ValueError(f"Unknown model: {model_name}")
+
+def get_model_scores_block(model_name, user_rows):
+    """Get a model's predicted ratings for a block of training users (users x items)"""
+    live = current_bundle()
+    if model_name in FACTOR_MODELS:
+        return score_items(model_name, live.models[model_name]['user_factors'][user_rows])
+    elif model_name == 'item_knn':
+        return item_knn_scores_block(live.models['item_knn']['neighbors'], live.train_ratings.rows(user_rows))
+    elif model_name == 'user_knn':
+        # Each user has its own neighbor list, so this one is scored row by row
+        return np.vstack([get_model_scores('user_knn', user_idx) for user_idx in user_rows])
+    elif model_name == 'content':
+        similarity_scores = content_scores_block(live.models['content']['content_matrix'],
+                                                 live.train_ratings.rows(user_rows),
+                                                 live.models['content']['has_features'])
+        return similarity_scores * 5  # Scale similarity to rating
+    raise ValueError(f"Unknown model: {model_name}")
+
+def get_excluded_items(user_id, exclude):
+    """Get the item indexes to leave out of a user's recommendations
+
+    exclude lists the sources to use: 'watchlist' and/or 'rated' (movies
+    rated in the app database).
+    """
+    live = current_bundle()
+    excluded_ids = set()
+    if 'watchlist' in exclude:
+        excluded_ids.update(rating_db.get_watchlist(user_id))
+    if 'rated' in exclude:
+        excluded_ids.update(rating['movie_id'] for rating in rating_db.get_user_ratings(user_id))
+    return np.array([live.train_ratings.item_index[item_id] for item_id in excluded_ids
+                     if live.train_ratings.has_item(item_id)], dtype=np.int64)
+
+def get_batch_recommendations(user_ids, n_recommendations=10, model='svd', include_posters=False, exclude=None):
+    """Get recommendations for many users, scoring them in blocks with one matrix multiply per block"""
+    live = current_bundle()
+    if model not in live.models and model != 'ensemble':
+        return {"error": f"Unknown model: {model}. Available models: svd, nmf, als, biased_mf, item_knn, user_knn, content, ensemble"}
+    if model != 'ensemble' and live.models[model] is None:
+        return {"error": f"Model {model} not trained"}
+    
+    model_names = ([model] if model != 'ensemble'
+                   else [name for name in ENSEMBLE_WEIGHTS if live.models.get(name) is not None])
+    if not model_names:
+        return {"error": "No ensemble models trained"}
+    
+    results = {}
+    known_users = []
+    new_users = []
+    for user_id in user_ids:
+        user_id = parse_user_id(user_id)
+        user_idx, folded = resolve_user(user_id)
+        if user_idx is not None:
+            known_users.append(user_id)
+        elif folded is not None:
+            new_users.append((user_id, folded))
+        else:
+            # Users with no ratings anywhere get the most popular movies
+            exclude_items = get_excluded_items(user_id, exclude) if exclude else None
+            results[str(user_id)] = get_popular_recommendations(n_recommendations, exclude_items, include_posters)
+    
+    def scored_blocks():
+        """Yield (users, {model: users x items scores}, seen mask) for blocks of training users, then each folded-in user"""
+        for start in range(0, len(known_users), BATCH_BLOCK_SIZE):
+            block_users = known_users[start:start + BATCH_BLOCK_SIZE]
+            user_rows = np.array([live.train_ratings.user_index[user_id] for user_id in block_users])
+            yield (block_users, {name: get_model_scores_block(name, user_rows) for name in model_names},
+                   live.train_ratings.seen_mask_rows(user_rows))
+        for user_id, folded in new_users:
+            yield ([user_id], {name: get_model_scores(name, None, folded)[None, :] for name in model_names},
+                   folded['seen'][None, :])
+    
+    poster_urls = {}
+    for block_users, model_scores, seen in scored_blocks():
+        # Take each user's top N unrated, non-excluded items from the block's scores
+        if model == 'ensemble':
+            block_scores = combine_scores(model_scores, ENSEMBLE_WEIGHTS, ~seen)
+        else:
+            block_scores = model_scores[model]
+        exclude_items = [get_excluded_items(user_id, exclude) for user_id in block_users] if exclude else None
+        top_items = top_k_per_row(block_scores, n_recommendations, seen, exclude_items)
+        
+        for row, (user_id, (item_indices, scores)) in enumerate(zip(block_users, top_items)):
+            recommendations = []
+            for item_idx, score in zip(item_indices, scores):
+                item_id = int(live.train_ratings.item_ids[item_idx])
+                
+                # Ensemble reports the weighted average of the models' rating-scale scores
+                if model == 'ensemble':
+                    item_scores = {name: float(scores_block[row, item_idx])
+                                   for name, scores_block in model_scores.items()
+                                   if np.isfinite(scores_block[row, item_idx])}
+                    total_weight = sum(ENSEMBLE_WEIGHTS[name] for name in item_scores)
+                    score = (sum(item_score * ENSEMBLE_WEIGHTS[name] for name, item_score in item_scores.items()) / total_weight
+                             if total_weight > 0 else 0.0)
+                
+                # Posters come from cached metadata only, looked up once per item
+                if include_posters and item_id not in poster_urls:
+                    poster_urls[item_id] = get_poster_url(item_id, live.movie_titles.get(item_id), MODEL_LABELS[model])
+                
+                recommendation = {
+                    'id': item_id,
+                    'item_id': item_id,
+                    'title': live.movie_titles.get(item_id, f"Movie {item_id}"),
+                    'predicted_rating': round(float(score), 2),
+                    'model': model
+                }
+                if model == 'ensemble':
+                    recommendation['model_scores'] = {name: round(item_score, 2) for name, item_score in item_scores.items()}
+                if include_posters:
+                    recommendation['poster_url'] = poster_urls[item_id]
+                recommendations.append(recommendation)
+            results[str(user_id)] = recommendations
+    
+    return results
+
+def get_training_config():
+    """Get every setting that changes the trained models (part of the bundle key)"""
+    return dict(TRAINING_CONFIG,
+                item_knn_neighbors=ITEM_KNN_NEIGHBORS,
+                item_knn_min_similarity=ITEM_KNN_MIN_SIMILARITY,
+                item_knn_min_support=ITEM_KNN_MIN_SUPPORT,
+                item_knn_shrinkage=ITEM_KNN_SHRINKAGE,
+                user_knn_neighbors=USER_KNN_NEIGHBORS,
+                ann_n_lists=ANN_N_LISTS,
+                ann_n_probe=ANN_N_PROBE,
+                ann_recall_sample=ANN_RECALL_SAMPLE)
+
+def build_bundle(build_seconds=None):
+    """Collect the trained models, ratings and catalog as (arrays, meta) for saving"""
+    live = current_bundle()
+    arrays = {}
+    for prefix, store in (('train', live.train_ratings), ('all', live.all_ratings)):
+        for name, value in store.to_arrays().items():
+            arrays[f'{prefix}.{name}'] = value
+    for column in live.data.columns:
+        arrays[f'ratings.{column}'] = live.data[column].values
+    
+    ann_recall = {}
+    training_reports = {}
+    precision_reports = {}
+    for model_name in FACTOR_MODELS:
+        factors = live.models[model_name]
+        if factors is None:
+            continue
+        arrays[f'{model_name}.user_factors'] = factors['user_factors']
+        arrays[f'{model_name}.item_factors'] = factors['item_factors']
+        arrays[f'{model_name}.item_codes'] = factors['item_codes']
+        arrays[f'{model_name}.item_scales'] = factors['item_scales']
+        precision_reports[model_name] = factors['precision_report']
+        if factors.get('training_report') is not None:
+            training_reports[model_name] = factors['training_report']
+        if factors.get('ann_index') is not None:
+            for name, value in factors['ann_index'].to_arrays().items():
+                arrays[f'{model_name}.ann.{name}'] = value
+            ann_recall[model_name] = factors['ann_recall']
+    if live.models['item_knn'] is not None:
+        arrays['item_knn.neighbors'] = live.models['item_knn']['neighbors']
+    if live.models['user_knn'] is not None:
+        for name, value in live.models['user_knn']['index'].to_arrays().items():
+            arrays[f'user_knn.{name}'] = value
+    if live.models['content'] is not None:
+        arrays['content.content_matrix'] = live.models['content']['content_matrix']
+        arrays['content.has_features'] = live.models['content']['has_features']
+    
+    meta = {
+        'config': get_training_config(),
+        'data_key': current_data_key(),
+        'models': [model_name for model_name, model in live.models.items() if model is not None],
+        'ann_recall': ann_recall,
+        'training_reports': training_reports,
+        'precision_reports': precision_reports,
+        'model_seconds': dict(training_times),
+        'movie_titles': {str(movie_id): title for movie_id, title in live.movie_titles.items()},
+        'movie_genres': {str(movie_id): genres for movie_id, genres in live.movie_genres.items()},
+        'build_seconds': build_seconds
+    }
+    return arrays, meta
+
+def unpack_bundle(arrays, meta):
+    """Rebuild (models, train_ratings, all_ratings, data, movie_titles, movie_genres, load_seconds) from a loaded bundle"""
+    def group(prefix):
+        return {name[len(prefix) + 1:]: value for name, value in arrays.items() if name.startswith(prefix + '.')}
+    
+    train_ratings = RatingsStore.from_arrays(group('train'))
+    all_ratings = RatingsStore.from_arrays(group('all'))
+    data = pd.DataFrame(group('ratings'), columns=['user_id', 'item_id', 'rating', 'timestamp'], copy=False)
+    movie_titles = {int(movie_id): title for movie_id, title in meta['movie_titles'].items()}
+    movie_genres = {int(movie_id): genres for movie_id, genres in meta['movie_genres'].items()}
+    
+    models = {}
+    load_seconds = {}
+    for model_name in MODEL_NAMES:
+        start_time = time.time()
+        models[model_name] = unpack_model(model_name, arrays, meta, group, train_ratings) if model_name in meta['models'] else None
+        load_seconds[model_name] = round(time.time() - start_time, 4)
+    
+    return models, train_ratings, all_ratings, data, movie_titles, movie_genres, load_seconds
+
+def unpack_model(model_name, arrays, meta, group, train_ratings):
+    """Rebuild one model from a loaded bundle's arrays"""
+    if model_name in FACTOR_MODELS:
+        model = {
+            'user_factors': arrays[f'{model_name}.user_factors'],
+            'item_codes': arrays[f'{model_name}.item_codes'],
+            'item_scales': arrays[f'{model_name}.item_scales'],
+            'precision_report': meta['precision_reports'][model_name]
+        }
+        # At int8 the float item factors are left unmapped; fold-ins dequantize the codes
+        if SERVING_PRECISION != 'int8':
+            model['item_factors'] = arrays[f'{model_name}.item_factors']
+        if model_name in meta['ann_recall']:
+            ann_arrays = group(f'{model_name}.ann')
+            if SERVING_PRECISION == 'int8':
+                ann_arrays.update(item_vectors=model['item_codes'], item_scales=model['item_scales'])
+            model['ann_index'] = InnerProductIndex.from_arrays(ann_arrays, n_probe=ANN_N_PROBE)
+            model['ann_recall'] = meta['ann_recall'][model_name]
+        if model_name in meta['training_reports']:
+            model['training_report'] = meta['training_reports'][model_name]
+        return model
+    if model_name == 'item_knn':
+        return {'neighbors': arrays['item_knn.neighbors']}
+    if model_name == 'user_knn':
+        return {'index': UserNeighborIndex.from_arrays(group('user_knn'))}
+    if model_name == 'content':
+        return {
+            'tfidf': None,  # The vectorizer is only needed for fitting and is not saved
+            'content_matrix': arrays['content.content_matrix'],
+            'has_features': arrays['content.has_features'],
+            'item_index': train_ratings.item_index
+        }
+    raise ValueError(f"Unknown model: {model_name}")
+
+def swap_bundle(arrays, meta, source):
+    """Make a loaded bundle the live one; requests already running finish on the bundle they started with"""
+    global live, top_n_checked_at
+    
+    models, train_ratings, all_ratings, data, movie_titles, movie_genres, load_seconds = unpack_bundle(arrays, meta)
+    info = {'version': meta['key'], 'source': source, 'created_at': meta['created_at'],
+            'build_seconds': meta.get('build_seconds'), 'model_seconds': meta.get('model_seconds')}
+    bundle = ServingBundle(models, train_ratings, all_ratings, data, movie_titles, movie_genres, info,
+                           build_popularity(data, load_app_ratings(), sorted(movie_titles)),
+                           build_data_timestamps(all_ratings, data))
+    
+    with publish_lock:
+        # Carry over ratings added since the old bundle was loaded; their users are not in its top-N store
+        if live.train_ratings is not None:
+            for user_id, item_id, rating in live.train_ratings.pending_ratings():
+                bundle.train_ratings.add_rating(user_id, item_id, rating)
+                bundle.dirty_users.add(user_id)
+                if models['user_knn'] is not None:
+                    models['user_knn']['index'].queue_user(bundle.train_ratings.user_index[user_id])
+        info['swapped_at'] = time.time()
+        live = bundle
+        top_n_checked_at = 0
+    for model_name, model in models.items():
+        model_states[model_name] = ({'state': 'ready', 'source': source, 'seconds': load_seconds[model_name],
+                                     'training_seconds': (meta.get('model_seconds') or {}).get(model_name)}
+                                    if model is not None else {'state': 'failed', 'error': 'Not in the model bundle'})
+
+def compute_top_n_block(model, start, stop, n):
+    """Get the top N items and scores of training users start to stop for one model, for the top-N store
+
+    Returns fixed-width arrays: item ids (-1 past the end of a short list)
+    and the scores the online path reports (NaN past the end); for the
+    ensemble, each member's scores for the listed items as well.
+    """
+    live = current_bundle()
+    user_rows = np.arange(start, stop)
+    seen = live.train_ratings.seen_mask_rows(user_rows)
+    model_names = ([model] if model != 'ensemble'
+                   else [name for name in ENSEMBLE_WEIGHTS if live.models.get(name) is not None])
+    model_scores = {name: get_model_scores_block(name, user_rows) for name in model_names}
+    block_scores = combine_scores(model_scores, ENSEMBLE_WEIGHTS, ~seen) if model == 'ensemble' else model_scores[model]
+    
+    arrays = {'item_ids': np.full((len(user_rows), n), -1, dtype=np.int32),
+              'scores': np.full((len(user_rows), n), np.nan, dtype=np.float32)}
+    if model == 'ensemble':
+        arrays.update({f'model_scores.{name}': np.full((len(user_rows), n), np.nan, dtype=np.float32)
+                       for name in model_names})
+    
+    for row, (item_indices, scores) in enumerate(top_k_per_row(block_scores, n, seen)):
+        arrays['item_ids'][row, :len(item_indices)] = live.train_ratings.item_ids[item_indices]
+        if model != 'ensemble':
+            arrays['scores'][row, :len(item_indices)] = scores
+            continue
+        
+        # Ensemble reports the weighted average of the members' finite rating-scale scores
+        member_scores = np.array([model_scores[name][row, item_indices] for name in model_names], dtype=np.float64)
+        finite = np.isfinite(member_scores)
+        member_weights = np.array([ENSEMBLE_WEIGHTS[name] for name in model_names])[:, None] * finite
+        total_weights = member_weights.sum(axis=0)
+        weighted = np.where(finite, member_scores, 0) * member_weights
+        arrays['scores'][row, :len(item_indices)] = np.divide(weighted.sum(axis=0), total_weights,
+                                                              out=np.zeros(len(item_indices)), where=total_weights > 0)
+        for name, values in zip(model_names, np.where(finite, member_scores, np.nan)):
+            arrays[f'model_scores.{name}'][row, :len(item_indices)] = values
+    return arrays
+
+def init_top_n_worker(key):
+    """Serve the model bundle the top-N store is being built for in a job worker process"""
+    swap_bundle(*load_bundle(ARTIFACT_DIR, key), source='loaded')
+
+def build_top_n_store(n=TOP_N_SIZE, processes=TOP_N_PROCESSES):
+    """Precompute every training user's top N for every trained model and save them as the live bundle's top-N store
+
+    Users are scored in blocks of BATCH_BLOCK_SIZE with one matrix multiply
+    per block, on a process pool that maps the saved bundle when processes > 1.
+    Returns the store's path.
+    """
+    live = current_bundle()
+    key = live.info['version']
+    model_names = [name for name in MODEL_PRIORITY if live.models.get(name) is not None]
+    if any(live.models.get(name) is not None for name in ENSEMBLE_WEIGHTS):
+        model_names.append('ensemble')
+    tasks = [(model, start, min(start + BATCH_BLOCK_SIZE, live.train_ratings.n_users), n)
+             for model in model_names for start in range(0, live.train_ratings.n_users, BATCH_BLOCK_SIZE)]
+    
+    start_time = time.time()
+    print(f"Precomputing top {n} for {live.train_ratings.n_users} users and {len(model_names)} models "
+          f"in {len(tasks)} blocks on {processes} processes...")
+    if processes > 1:
+        with multiprocessing.get_context('spawn').Pool(processes, initializer=init_top_n_worker,
+                                                       initargs=(key,)) as pool:
+            blocks = pool.starmap(compute_top_n_block, tasks)
+    else:
+        blocks = [compute_top_n_block(*task) for task in tasks]
+    
+    arrays = {}
+    for model in model_names:
+        model_blocks = [block for (task_model, *_), block in zip(tasks, blocks) if task_model == model]
+        for name in model_blocks[0]:
+            arrays[f'{model}.{name}'] = np.concatenate([block[name] for block in model_blocks])
+    
+    seconds = round(time.time() - start_time, 3)
+    path = save_bundle(TOP_N_DIR, key, arrays, {'n': n, 'models': model_names, 'build_seconds': seconds})
+    print(f"Precomputed top-N store for bundle {key} in {seconds}s")
+    return path
+
+def load_app_ratings():
+    """Get the ratings saved through the app, shaped like u.data
+
+    User ids are integers where they are one, matching u.data's, and
+    strings such as Firebase uids otherwise.
+    """
+    app_ratings = pd.DataFrame(rating_db.get_all_ratings(), columns=['user_id', 'item_id', 'rating', 'timestamp'])
+    app_ratings['user_id'] = app_ratings['user_id'].map(parse_user_id)
+    app_ratings['timestamp'] = pd.to_datetime(app_ratings['timestamp']).astype('int64') // 10**9
+    return app_ratings
+
+def build_popularity(ratings, app_ratings, item_ids):
+    """Get the popularity model over a catalog for the u.data ratings plus the app ratings"""
+    # App ratings win over u.data ratings of the same user and movie, as in the ratings stores
+    all_data = pd.concat([ratings, app_ratings], ignore_index=True).drop_duplicates(['user_id', 'item_id'], keep='last')
+    return PopularityModel(item_ids, POPULARITY_PRIOR_COUNT, POPULARITY_HALF_LIFE_DAYS).fit(
+        all_data['item_id'].values, all_data['rating'].values, all_data['timestamp'].values)
+
+def build_data_timestamps(ratings_store, ratings):
+    """Get the u.data ratings' unix timestamps as a sparse matrix with a ratings store's rows and columns"""
+    rows = ratings['user_id'].map(ratings_store.user_index).values
+    cols = ratings['item_id'].map(ratings_store.item_index).values
+    return sp.csr_matrix((ratings['timestamp'].values.astype(np.float64), (rows, cols)), shape=ratings_store.shape)
+
+def get_app_rating(user_id, movie_id):
+    """Get a user's saved (rating, unix timestamp) for a movie, or None"""
+    for saved in rating_db.get_user_ratings(user_id):
+        if saved['movie_id'] == movie_id:
+            return saved['rating'], pd.Timestamp(saved['timestamp']).value // 10**9
+    return None
+
+def count_popularity_rating(user_id, movie_id, rating, previous):
+    """Count a new rating in the popularity model; previous is what get_app_rating gave before it was saved"""
+    live = current_bundle()
+    timestamp = time.time()
+    if live.popularity is not None:
+        user_idx, item_idx = live.all_ratings.user_row(user_id), live.all_ratings.item_col(movie_id)
+        if previous is None and live.data_timestamps is not None and user_idx is not None and item_idx is not None:
+            # The rating may replace one from u.data, which all_ratings holds unless an app rating replaced it
+            replaced_at = live.data_timestamps[user_idx, item_idx]
+            if replaced_at:
+                previous = float(live.all_ratings.matrix[user_idx, item_idx]), float(replaced_at)
+        live.popularity.add_rating(movie_id, rating, timestamp, *(previous or ()))
+
+def add_live_rating(user_id, movie_id, rating):
+    """Serve a saved rating from the live bundle
+
+    Training users see it in their next recommendations through the ratings
+    overlay, and in their neighbor lists once the background refresh has
+    run; a folded-in user's fold-in is stale and is rebuilt. It goes to the
+    bundle live now rather than the one the request started on, which a
+    swap carries it over from otherwise.
+    """
+    with publish_lock:
+        added = live.train_ratings.add_rating(user_id, movie_id, rating)
+        live.dirty_users.add(user_id)
+        live.folded_users.pop(user_id, None)
+        if added and live.models['user_knn'] is not None:
+            live.models['user_knn']['index'].queue_user(live.train_ratings.user_index[user_id])
+    if added:
+        start_neighbor_refresh()
+
+def start_neighbor_refresh():
+    """Start the background neighbor list refresh unless it is already running"""
+    global neighbor_refresh_started
+    with neighbor_refresh_lock:
+        if neighbor_refresh_started:
+            return
+        neighbor_refresh_started = True
+    threading.Thread(target=refresh_neighbors_periodically, daemon=True).start()
+
+def refresh_neighbors_periodically():
+    """Refresh the live neighbor lists of users who rated every USER_NEIGHBOR_REFRESH_SECONDS"""
+    while True:
+        time.sleep(USER_NEIGHBOR_REFRESH_SECONDS)
+        refresh_user_neighbors()
+
+def refresh_user_neighbors():
+    """Refresh the live neighbor lists of users queued since the last refresh; returns how many"""
+    bundle = live
+    if bundle.models['user_knn'] is None:
+        return 0
+    try:
+        return bundle.models['user_knn']['index'].refresh(bundle.train_ratings)
+    except Exception as e:
+        print(f"Error refreshing user neighbors: {e}")
+        return 0
+
+def get_rating_stats(movie_id):
+    """Get a movie's (average app rating, app rating count), 0.0 for the average if it has none
+
+    Every movie's stats come from one grouped query, shared through the
+    database by all workers and rerun at most every RATING_STATS_REFRESH_SECONDS.
+    """
+    global rating_stats, rating_stats_loaded_at
+    if time.time() - rating_stats_loaded_at >= RATING_STATS_REFRESH_SECONDS:
+        rating_stats_loaded_at = time.time()
+        rating_stats = rating_db.get_average_ratings()
+    return rating_stats.get(movie_id, (0.0, 0))
+
+def refresh_rating_stats(movie_id):
+    """Reread a movie's stats after it is rated, so the worker that saved the rating shows it at once"""
+    stats = rating_stats[movie_id] = rating_db.get_average_rating(movie_id)
+    return stats
+
+def get_popularity():
+    """Get the live popularity model, or None before the ratings are loaded
+
+    Ratings this worker saves are counted as they come in; the model is
+    rebuilt from u.data and the database at most every
+    RATING_STATS_REFRESH_SECONDS to take in those saved by other workers.
+    """
+    live = current_bundle()
+    global popularity_loaded_at
+    if live.popularity is not None and time.time() - popularity_loaded_at >= RATING_STATS_REFRESH_SECONDS:
+        popularity_loaded_at = time.time()
+        live.popularity = build_popularity(live.data, load_app_ratings(), live.popularity.item_ids)
+    return live.popularity
+
+def get_popular_recommendations(n_recommendations=10, exclude_items=None, include_posters=True):
+    """Get the most popular movies by Bayesian average, for users with no ratings anywhere"""
+    live = current_bundle()
+    popularity = get_popularity()
+    if popularity is None:
+        return {"error": "Popularity rankings are not ready yet"}
+    
+    exclude_ids = live.train_ratings.item_ids[exclude_items] if exclude_items is not None else None
+    item_ids, scores = popularity.top_items(n_recommendations, exclude_ids=exclude_ids)
+    recommendations = []
+    for item_id, score in zip(item_ids.tolist(), scores):
+        title = live.movie_titles.get(item_id, f"Movie {item_id}")
+        recommendation = {
+            'id': item_id,  # MovieCard expects 'id', not 'item_id'
+            'item_id': item_id,
+            'title': title,
+            'predicted_rating': round(float(score), 2),
+            'model': 'Popular'
+        }
+        if include_posters:
+            recommendation['poster_url'] = get_poster_url(item_id, title, 'Popular')
+        recommendations.append(recommendation)
+    return recommendations
+
+def current_data_key():
+    """Get the version of the data files and training config alone, shared by bundles trained on any app ratings"""
+    return bundle_key([path for path in DATA_FILES if os.path.exists(path)], get_training_config())
+
+def replay_app_ratings(app_ratings):
+    """Put app ratings the live bundle was not trained on into the ratings overlay; returns how many
+
+    Only training users' ratings need replaying: other users are folded in
+    from the database when they ask for recommendations.
+    """
+    live = current_bundle()
+    rows = app_ratings['user_id'].map(live.train_ratings.user_index)
+    cols = app_ratings['item_id'].map(live.train_ratings.item_index)
+    known = (rows.notna() & cols.notna()).values
+    if not known.any():
+        return 0
+    rows, cols = rows[known].astype(np.int64).values, cols[known].astype(np.int64).values
+    trained = np.asarray(live.train_ratings.matrix[rows, cols]).ravel()
+    newer = app_ratings[known][trained != app_ratings['rating'].values[known].astype(np.float32)]
+    
+    for user_id, item_id, rating in newer[['user_id', 'item_id', 'rating']].itertuples(index=False):
+        live.train_ratings.add_rating(user_id, item_id, float(rating))
+        live.dirty_users.add(user_id)
+    if live.models['user_knn'] is not None:
+        for user_id in newer['user_id'].unique():
+            live.models['user_knn']['index'].queue_user(live.train_ratings.user_index[user_id])
+        live.models['user_knn']['index'].refresh(live.train_ratings)
+    return len(newer)
+
+def current_bundle_key(app_ratings):
+    """Get the bundle version for the current data files, app ratings and training config"""
+    return bundle_key([path for path in DATA_FILES if os.path.exists(path)], get_training_config(),
+                      pd.util.hash_pandas_object(app_ratings[['user_id', 'item_id', 'rating']], index=False).values.tobytes())
+
+def train_and_save_bundle():
+    """Train and save a bundle for the current data unless one exists; returns its version"""
+    app_ratings = load_app_ratings()
+    key = current_bundle_key(app_ratings)
+    if load_bundle(ARTIFACT_DIR, key) is None:
+        start_time = time.time()
+        train_models(app_ratings)
+        path = save_bundle(ARTIFACT_DIR, key, *build_bundle(build_seconds=round(time.time() - start_time, 3)))
+        print(f"Saved model bundle to {path}")
+    return key
+
+def load_and_train_model(background=False):
+    """Load the model bundle for the current data and config, or train the models and save one
+
+    Without a bundle for the current app ratings, the newest one for the
+    same data files and config is loaded and the app ratings it lacks are
+    replayed through the ratings overlay; the background retrain catches
+    the models up later, so workers never retrain on boot. Models are only
+    trained here when no bundle for the data and config exists. With
+    background, the training data is loaded and the models are trained on
+    a background thread, each one served as soon as it is ready.
+    """
     # Check if data file exists
     data_file = 'ml-100k/u.data'
     if not os.path.exists(data_file):
         raise FileNotFoundError("Data file 'ml-100k/u.data' not found.")
     
+    start_time = time.time()
+    app_ratings = load_app_ratings()
+    key = current_bundle_key(app_ratings)
+    
+    bundle = None
+    try:
+        bundle = load_bundle(ARTIFACT_DIR, key)
+        if bundle is None:
+            latest_key = latest_bundle_key(ARTIFACT_DIR, current_data_key())
+            bundle = load_bundle(ARTIFACT_DIR, latest_key) if latest_key is not None else None
+    except Exception as e:
+        print(f"Error loading model bundle {key}: {e}")
+    
+    if bundle is not None:
+        swap_bundle(*bundle, source='loaded')
+        replayed = replay_app_ratings(app_ratings)
+        live.info['replayed_ratings'] = replayed
+        print(f"Loaded model bundle {bundle[1]['key']} in {time.time() - start_time:.3f}s"
+              + (f", replaying {replayed} newer app ratings" if replayed else ''))
+        return True
+    
+    trainers = load_training_data(app_ratings)
+    if background:
+        threading.Thread(target=finish_training, args=(trainers, key, start_time), daemon=True).start()
+    else:
+        finish_training(trainers, key, start_time)
+    return True
+
+def finish_training(trainers, key, start_time):
+    """Fit the models, then save them as a bundle and serve from it"""
+    failed = fit_models(trainers)
+    if failed:
+        print(f"Not saving a model bundle since {', '.join(failed)} failed to train")
+        return
+    build_seconds = round(time.time() - start_time, 3)
+    live.info.update(version=key, source='trained', created_at=time.time(), build_seconds=build_seconds,
+                     model_seconds=dict(training_times), swapped_at=time.time())
+    
+    try:
+        path = save_bundle(ARTIFACT_DIR, key, *build_bundle(build_seconds))
+        print(f"Saved model bundle to {path}")
+        
+        # Serve from the saved bundle too, so this worker shares the mapped arrays with the others
+        swap_bundle(*load_bundle(ARTIFACT_DIR, key), source='trained')
+    except Exception as e:
+        print(f"Error saving model bundle: {e}")
+
+def run_retrain():
+    """Build a bundle in a separate process off the request path, then swap it in"""
+    try:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            key = pool.apply(train_and_save_bundle)
+        
+        if key == current_bundle().info.get('version'):
+            print(f"Model bundle {key} is already up to date")
+        else:
+            swap_bundle(*load_bundle(ARTIFACT_DIR, key), source='retrained')
+            print(f"Swapped in model bundle {key}")
+    except Exception as e:
+        print(f"Error retraining models: {e}")
+        retrain_status['last_error'] = str(e)
+    finally:
+        retrain_status.update(running=False, finished_at=time.time())
+
+def start_background_retrain():
+    """Start a background retrain unless one is already running; returns whether it started"""
+    with retrain_lock:
+        if retrain_status['running']:
+            return False
+        retrain_status.update(running=True, started_at=time.time(), last_error=None)
+    
+    threading.Thread(target=run_retrain, daemon=True).start()
+    return True
+
+def retrain_periodically():
+    """Retrain in the background every RETRAIN_INTERVAL seconds"""
+    while True:
+        time.sleep(RETRAIN_INTERVAL)
+        start_background_retrain()
+
+def train_models(app_ratings=None):
+    """Load data and train multiple recommendation models"""
+    failed = fit_models(load_training_data(app_ratings))
+    if failed:
+        raise RuntimeError(f"Training failed for {', '.join(failed)}")
+    return True
+
+def load_training_data(app_ratings=None):
+    """Load the ratings and catalog into a new live bundle and get each model's (fit function, args)
+
+    Every model is reset to pending; fit_models trains them.
+    """
+    global live
+    
+    # Load movie titles and genres
+    movie_titles, movie_genres = load_movie_titles()
+    
     # Load data
+    data_file = 'ml-100k/u.data'
     column_names = ['user_id', 'item_id', 'rating', 'timestamp']
     data = pd.read_csv(data_file, sep='\t', names=column_names)
     
     print(f"Loaded {len(data)} ratings from {data['user_id'].nunique()} users and {data['item_id'].nunique()} movies")
     
     # Split data
-    train_data, test_data = train_test_split(data, test_size=0.2, random_state=42)
-    
-    # Create user-item matrices
-    def create_user_item_matrix(data):
-        return data.pivot_table(index='user_id', columns='item_id', values='rating', fill_value=0)
-    
-    train_user_item_matrix = create_user_item_matrix(train_data)
-    user_item_matrix = create_user_item_matrix(data)
-    
-    print("Training multiple recommendation models...")
-    
-    # 1. SVD Model (Matrix Factorization)
-    print("Training SVD model...")
-    models['svd'] = TruncatedSVD(n_components=50, random_state=42)
-    models['svd'].fit(train_user_item_matrix)
-    
-    # 2. NMF Model (Non-negative Matrix Factorization)
-    print("Training NMF model...")
-    models['nmf'] = NMF(n_components=50, random_state=42, max_iter=200)
-    models['nmf'].fit(train_user_item_matrix)
-    
-    # 3. Item-based Collaborative Filtering
-    print("Training Item-based KNN...")
-    item_item_matrix = train_user_item_matrix.T  # Transpose to get item-user matrix
-    models['item_knn'] = NearestNeighbors(n_neighbors=20, metric='cosine')
-    models['item_knn'].fit(item_item_matrix)
-    
-    # Precompute item similarity matrix for faster recommendations
-    item_similarity_matrix = cosine_similarity(item_item_matrix)
-    
-    # 4. User-based Collaborative Filtering
-    print("Training User-based KNN...")
-    models['user_knn'] = NearestNeighbors(n_neighbors=20, metric='cosine')
-    models['user_knn'].fit(train_user_item_matrix)
+    train_data, test_data = train_test_split(data, test_size=TRAINING_CONFIG['test_size'],
+                                             random_state=TRAINING_CONFIG['random_state'])
+    
+    # Ratings saved through the app are all used for training; being last, they win over u.data
+    if app_ratings is not None and len(app_ratings):
+        print(f"Adding {len(app_ratings)} app ratings")
+        train_data = pd.concat([train_data, app_ratings], ignore_index=True)
+        all_data = pd.concat([data, app_ratings], ignore_index=True)
+    else:
+        all_data = data
     
-    # Precompute user similarity matrix
-    user_similarity_matrix = cosine_similarity(train_user_item_matrix)
+    # Create sparse user-item rating stores
+    train_ratings = RatingsStore.from_frame(train_data)
+    all_ratings = RatingsStore.from_frame(all_data)
+    popularity = build_popularity(data, app_ratings if app_ratings is not None else load_app_ratings(),
+                                  sorted(movie_titles))
+    data_timestamps = build_data_timestamps(all_ratings, data)
     
-    # 5. Content-based Filtering
-    print("Training Content-based model...")
     # Create content features from genres
     content_features = []
     movie_ids = []
     for movie_id in movie_genres:
-        if movie_id in train_user_item_matrix.columns:
+        if train_ratings.has_item(movie_id):
             content_features.append(movie_genres[movie_id])
             movie_ids.append(movie_id)
     
-    if content_features:
-        tfidf = TfidfVectorizer(max_features=100, stop_words='english')
-        content_matrix = tfidf.fit_transform(content_features)
-        models['content'] = {
-            'tfidf': tfidf,
-            'content_matrix': content_matrix,
-            'movie_ids': movie_ids
-        }
+    # Every fit gets only the sparse training matrix (or the genre strings), so
+    # running it in a worker process pickles little more than the fitted arrays
+    ratings_matrix = train_ratings.matrix
+    trainers = {
+        'nmf': (fit_nmf, (ratings_matrix,)),
+        'biased_mf': (fit_biased_mf, (ratings_matrix,)),
+        'als': (fit_als, (ratings_matrix,)),
+        'user_knn': (fit_user_knn, (ratings_matrix,)),
+        'svd': (fit_svd, (ratings_matrix,)),
+        'item_knn': (fit_item_knn, (ratings_matrix,)),
+        'content': (fit_content, (content_features, movie_ids, train_ratings.item_index, train_ratings.n_items))
+    }
     
-    print("All models trained successfully!")
-    return True
+    with publish_lock:
+        live = ServingBundle(dict.fromkeys(MODEL_NAMES), train_ratings, all_ratings, data, movie_titles, movie_genres,
+                             popularity=popularity, data_timestamps=data_timestamps)
+    for model_name in MODEL_NAMES:
+        model_states[model_name] = {'state': 'pending'}
+    return trainers
 
-def get_svd_recommendations(user_id, n_recommendations=10):
-    """Get recommendations using SVD model"""
-    if models['svd'] is None:
-        return {"error": "SVD model not trained"}
-    
-    if user_id not in train_user_item_matrix.index:
-        return {"error": f"User {user_id} not found in dataset"}
-    
-    try:
-        # Transform the user-item matrix using the trained SVD model
-        user_factors = models['svd'].transform(train_user_item_matrix)
-        item_factors = models['svd'].components_
-        
-        # Reconstruct the ratings matrix
-        predicted_ratings = np.dot(user_factors, item_factors)
-        predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                          index=train_user_item_matrix.index,
-                                          columns=train_user_item_matrix.columns)
-        
-        # Get items that the user hasn't rated
-        user_ratings = train_user_item_matrix.loc[user_id]
-        unrated_items = user_ratings[user_ratings == 0].index
-        
-        # Get predicted ratings for unrated items
-        user_predictions = predicted_ratings_df.loc[user_id, unrated_items]
-        
-        # Get top N recommendations
-        top_recommendations = user_predictions.nlargest(n_recommendations)
-        
-        # Format recommendations with movie titles and posters
-        recommendations = []
-        for item_id, predicted_rating in top_recommendations.items():
-            movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-            
-            # Get poster URL from cached metadata or fetch from TMDB
-            poster_url = None
+def fit_models(trainers):
+    """Fit every model, serving each as soon as it is ready; returns the names of any that failed
+
+    One after another in MODEL_PRIORITY order, or on a process pool with
+    the longest fits first when TRAINING_PROCESSES > 1.
+    """
+    training_times.clear()
+    failed = []
+    
+    def publish(model_name, fitted):
+        global live
+        model, seconds = fitted
+        with publish_lock:
+            if model_name == 'content' and model is not None:
+                model['item_index'] = live.train_ratings.item_index
+            # The new bundle starts without fold-ins, which hold vectors for the models of the old one
+            live = live.with_model(model_name, model)
+        training_times[model_name] = round(seconds, 3)
+        model_states[model_name] = {'state': 'ready', 'source': 'trained', 'seconds': round(seconds, 3)}
+    
+    def fail(model_name, error):
+        print(f"Error training {model_name}: {error}")
+        failed.append(model_name)
+        model_states[model_name] = {'state': 'failed', 'error': str(error)}
+    
+    # Pool workers (as in a background retrain) cannot start processes of their own
+    start_time = time.time()
+    if TRAINING_PROCESSES > 1 and not multiprocessing.current_process().daemon:
+        print(f"Training {len(trainers)} models on {TRAINING_PROCESSES} processes...")
+        with multiprocessing.get_context('spawn').Pool(TRAINING_PROCESSES) as pool:
+            pending = []
+            for model_name, (trainer, args) in trainers.items():
+                model_states[model_name] = {'state': 'training'}
+                pending.append(pool.apply_async(timed_fit, (trainer, *args),
+                                                callback=lambda fitted, name=model_name: publish(name, fitted),
+                                                error_callback=lambda error, name=model_name: fail(name, error)))
+            for result in pending:
+                result.wait()
+    else:
+        print("Training multiple recommendation models...")
+        for model_name in MODEL_PRIORITY:
+            trainer, args = trainers[model_name]
+            model_states[model_name] = {'state': 'training'}
             try:
-                # First try to get from cached metadata
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-                    print(f"SVD: Found cached poster for movie {item_id}: {poster_url}")
-                else:
-                    # If not cached, search TMDB directly
-                    print(f"SVD: Searching TMDB for movie {item_id} ({movie_title})")
-                    search_result = tmdb_client.search_movie(movie_title)
-                    if search_result and search_result.get('poster_path'):
-                        poster_url = tmdb_client.get_poster_url(search_result['poster_path'])
-                        print(f"SVD: Found TMDB poster for movie {item_id}: {poster_url}")
+                publish(model_name, timed_fit(trainer, *args))
             except Exception as e:
-                print(f"SVD: Error getting poster for movie {item_id}: {e}")
-                pass
-                
-            recommendations.append({
-                'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
-                'item_id': int(item_id),
-                'title': movie_title,
-                'predicted_rating': round(float(predicted_rating), 2),
-                'model': 'SVD',
-                'poster_url': poster_url
-            })
-        
-        return recommendations
+                fail(model_name, e)
+    wall_seconds = time.time() - start_time
+    
+    for model_name, seconds in sorted(training_times.items(), key=lambda item: -item[1]):
+        print(f"  {model_name}: {seconds:.2f}s")
+    if training_times:
+        print(f"Trained in {wall_seconds:.2f}s wall time ({sum(training_times.values()):.2f}s of fitting, "
+              f"longest {max(training_times, key=training_times.get)})")
+    
+    if not failed:
+        print("All models trained successfully!")
+    return failed
+
+def timed_fit(trainer, *args):
+    """Run a model fit and return (model, seconds)"""
+    start_time = time.time()
+    model = trainer(*args)
+    return model, time.time() - start_time
+
+def fit_svd(ratings_matrix):
+    """SVD Model (Matrix Factorization)"""
+    print("Training SVD model...")
+    svd = TruncatedSVD(n_components=TRAINING_CONFIG['factor_components'], random_state=TRAINING_CONFIG['random_state'])
+    svd.fit(ratings_matrix)
+    return quantize_item_factors('svd', build_ann_index('svd', build_factor_model(svd, ratings_matrix), ratings_matrix))
+
+def fit_nmf(ratings_matrix):
+    """NMF Model (Non-negative Matrix Factorization)"""
+    print("Training NMF model...")
+    nmf = NMF(n_components=TRAINING_CONFIG['factor_components'], random_state=TRAINING_CONFIG['random_state'],
+              max_iter=TRAINING_CONFIG['nmf_max_iter'])
+    nmf.fit(ratings_matrix)
+    return quantize_item_factors('nmf', build_ann_index('nmf', build_factor_model(nmf, ratings_matrix), ratings_matrix))
+
+def fit_als(ratings_matrix):
+    """ALS model (factorizes the observed ratings only, unlike SVD/NMF's zero-filled matrix)"""
+    print("Training ALS model...")
+    als = AlternatingLeastSquares(n_factors=TRAINING_CONFIG['als_factors'], n_iter=TRAINING_CONFIG['als_iterations'],
+                                  regularization=TRAINING_CONFIG['als_regularization'], n_threads=ALS_THREADS,
+                                  random_state=TRAINING_CONFIG['random_state'])
+    factors = {'user_factors': als.fit_transform(ratings_matrix), 'item_factors': als.components_}
+    print(f"ALS trained on {ALS_THREADS} threads, training RMSE {als.rmse(ratings_matrix):.4f}")
+    return quantize_item_factors('als', build_ann_index('als', factors, ratings_matrix))
+
+def fit_biased_mf(ratings_matrix):
+    """Biased MF (global mean + user/item biases + factors, by mini-batch SGD)"""
+    print("Training biased MF model...")
+    biased_mf = BiasedMatrixFactorization(n_factors=TRAINING_CONFIG['mf_factors'],
+                                          learning_rate=TRAINING_CONFIG['mf_learning_rate'],
+                                          regularization=TRAINING_CONFIG['mf_regularization'],
+                                          batch_size=TRAINING_CONFIG['mf_batch_size'],
+                                          max_epochs=TRAINING_CONFIG['mf_max_epochs'],
+                                          patience=TRAINING_CONFIG['mf_patience'],
+                                          validation_fraction=TRAINING_CONFIG['mf_validation_fraction'],
+                                          random_state=TRAINING_CONFIG['random_state'])
+    biased_mf.fit(ratings_matrix)
+    user_vectors, item_vectors = biased_mf.serving_factors()
+    print(f"Biased MF trained for {biased_mf.n_epochs_} epochs at {biased_mf.ratings_per_second_:,.0f} ratings/sec, "
+          f"validation RMSE {biased_mf.best_validation_rmse_:.4f}")
+    return quantize_item_factors('biased_mf', build_ann_index('biased_mf', {
+        'user_factors': user_vectors,
+        'item_factors': item_vectors,
+        'training_report': {
+            'epochs': biased_mf.n_epochs_,
+            'ratings_per_second': round(biased_mf.ratings_per_second_),
+            'validation_rmse': biased_mf.best_validation_rmse_
+        }
+    }, ratings_matrix))
+
+def fit_item_knn(ratings_matrix):
+    """Item-based Collaborative Filtering"""
+    print("Training Item-based KNN...")
     
-    except Exception as e:
-        return {"error": f"Error generating SVD recommendations: {str(e)}"}
+    # Keep only each item's top-k neighbors as a sparse matrix, built a block of items at a time
+    return {
+        'neighbors': build_item_neighbors_blocked(ratings_matrix,
+                                                  n_neighbors=ITEM_KNN_NEIGHBORS,
+                                                  min_similarity=ITEM_KNN_MIN_SIMILARITY,
+                                                  min_support=ITEM_KNN_MIN_SUPPORT,
+                                                  shrinkage=ITEM_KNN_SHRINKAGE,
+                                                  block_size=ITEM_KNN_BLOCK_SIZE,
+                                                  n_threads=ITEM_KNN_THREADS)
+    }
 
-def get_nmf_recommendations(user_id, n_recommendations=10):
-    """Get recommendations using NMF model"""
-    if models['nmf'] is None:
-        return {"error": "NMF model not trained"}
+def fit_user_knn(ratings_matrix):
+    """User-based Collaborative Filtering"""
+    print("Training User-based KNN...")
     
-    if user_id not in train_user_item_matrix.index:
+    # Precompute each user's neighbor list, a block of users at a time
+    return {
+        'index': UserNeighborIndex.build(ratings_matrix, n_neighbors=USER_KNN_NEIGHBORS,
+                                         block_size=USER_KNN_BLOCK_SIZE, n_threads=USER_KNN_THREADS)
+    }
+
+def fit_content(content_features, movie_ids, item_index, n_items):
+    """Content-based Filtering from genre strings; None if no item has any"""
+    print("Training Content-based model...")
+    if not content_features:
+        return None
+    
+    tfidf = TfidfVectorizer(max_features=TRAINING_CONFIG['tfidf_max_features'], stop_words='english')
+    # Row-normalized TF-IDF rows laid out on the ratings item axis
+    content_matrix, has_features = align_item_features(tfidf.fit_transform(content_features), movie_ids,
+                                                       item_index, n_items)
+    return {
+        'tfidf': tfidf,
+        'content_matrix': content_matrix,
+        'has_features': has_features,
+        'item_index': item_index
+    }
+
+def get_factor_recommendations(model_name, user_id, n_recommendations=10, exclude_items=None, retrieval='exact'):
+    """Get recommendations using one of the factor models (SVD, NMF, ALS or biased MF)"""
+    live = current_bundle()
+    label = MODEL_LABELS[model_name]
+    if live.models[model_name] is None:
+        return {"error": f"{label} model not trained"}
+    
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
-        # Transform the user-item matrix using the trained NMF model
-        user_factors = models['nmf'].transform(train_user_item_matrix)
-        item_factors = models['nmf'].components_
-        
-        # Reconstruct the ratings matrix
-        predicted_ratings = np.dot(user_factors, item_factors)
-        predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                          index=train_user_item_matrix.index,
-                                          columns=train_user_item_matrix.columns)
-        
-        # Get items that the user hasn't rated
-        user_ratings = train_user_item_matrix.loc[user_id]
-        unrated_items = user_ratings[user_ratings == 0].index
-        
-        # Get predicted ratings for unrated items
-        user_predictions = predicted_ratings_df.loc[user_id, unrated_items]
-        
-        # Get top N recommendations
-        top_recommendations = user_predictions.nlargest(n_recommendations)
+        # Get top N items the user hasn't rated or excluded from the cached factors
+        top_items = get_factor_top_items(model_name, user_idx, n_recommendations, exclude_items, retrieval, folded)
         
         # Format recommendations with movie titles and posters
         recommendations = []
-        for item_id, predicted_rating in top_recommendations.items():
-            movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-            
-            # Get poster URL from cached metadata
-            poster_url = None
-            try:
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-            except:
-                pass
-                
+        for item_idx, predicted_rating in zip(*top_items):
+            item_id = int(live.train_ratings.item_ids[item_idx])
+            movie_title = live.movie_titles.get(item_id, f"Movie {item_id}")
             recommendations.append({
-                'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
-                'item_id': int(item_id),
+                'id': item_id,  # MovieCard expects 'id', not 'item_id'
+                'item_id': item_id,
                 'title': movie_title,
                 'predicted_rating': round(float(predicted_rating), 2),
-                'model': 'NMF',
-                'poster_url': poster_url
+                'model': label,
+                'poster_url': get_poster_url(item_id, movie_title, label, search=model_name in POSTER_SEARCH_MODELS)
             })
         
         return recommendations
     
     except Exception as e:
-        return {"error": f"Error generating NMF recommendations: {str(e)}"}
+        return {"error": f"Error generating {label} recommendations: {str(e)}"}
 
-def get_item_knn_recommendations(user_id, n_recommendations=10):
-    """Get recommendations using item-based KNN (optimized)"""
-    if models['item_knn'] is None or item_similarity_matrix is None:
+def get_item_knn_recommendations(user_id, n_recommendations=10, exclude_items=None):
+    """Get recommendations using item-based KNN over the sparse neighbor matrix"""
+    live = current_bundle()
+    if live.models['item_knn'] is None:
         return {"error": "Item-based KNN model not trained"}
     
-    if user_id not in train_user_item_matrix.index:
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
         print(f"Getting item-KNN recommendations for user {user_id}")
-        user_ratings = train_user_item_matrix.loc[user_id]
-        unrated_items = user_ratings[user_ratings == 0].index
         
-        # Limit to top 100 unrated items for speed
-        unrated_items = unrated_items[:100]
-        
-        # Calculate predictions for unrated items (simplified)
-        predictions = {}
-        rated_items = user_ratings[user_ratings > 0]
-        
-        for item_id in unrated_items:
-            try:
-                item_idx = list(train_user_item_matrix.columns).index(item_id)
-                
-                # Get top 10 similar items for speed
-                similarities = []
-                for rated_item_id in rated_items.index[:20]:  # Limit to top 20 rated items
-                    rated_item_idx = list(train_user_item_matrix.columns).index(rated_item_id)
-                    similarity = item_similarity_matrix[item_idx][rated_item_idx]
-                    if similarity > 0.1:  # Only consider items with reasonable similarity
-                        similarities.append((similarity, rated_items[rated_item_id]))
-                
-                # Calculate weighted average prediction
-                if similarities:
-                    similarities.sort(reverse=True)
-                    top_similarities = similarities[:10]  # Top 10 similar items
-                    numerator = sum(sim * rating for sim, rating in top_similarities)
-                    denominator = sum(sim for sim, _ in top_similarities)
-                    predictions[item_id] = numerator / denominator if denominator > 0 else 0
-            except (ValueError, IndexError):
-                continue
+        # Score every item against the user's ratings in one sparse product
+        predicted_ratings = get_model_scores('item_knn', user_idx, folded)
         
-        # Get top N recommendations
-        top_items = sorted(predictions.items(), key=lambda x: x[1], reverse=True)[:n_recommendations]
+        # Get top N unrated, non-excluded items the model can score
+        top_items = top_k(predicted_ratings, n_recommendations,
+                          get_seen_mask(user_idx, folded), exclude_items)
         
         # Format recommendations with movie titles and posters
         recommendations = []
-        for item_id, predicted_rating in top_items:
-            movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-            
-            # Get poster URL from cached metadata
-            poster_url = None
-            try:
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-            except:
-                pass
-                
+        for item_idx, predicted_rating in zip(*top_items):
+            item_id = live.train_ratings.item_ids[item_idx]
+            movie_title = live.movie_titles.get(item_id, f"Movie {item_id}")
             recommendations.append({
                 'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
                 'item_id': int(item_id),
                 'title': movie_title,
                 'predicted_rating': round(float(predicted_rating), 2),
                 'model': 'Item-KNN',
-                'poster_url': poster_url
+                'poster_url': get_poster_url(item_id, movie_title, 'Item-KNN')
             })
         
         print(f"Returning {len(recommendations)} item-KNN recommendations")
@@ -363,76 +1458,38 @@ def get_item_knn_recommendations(user_id, n_recommendations=10):
         print(f"Error in item-KNN: {str(e)}")
         return {"error": f"Error generating Item-KNN recommendations: {str(e)}"}
 
-def get_user_knn_recommendations(user_id, n_recommendations=10):
-    """Get recommendations using user-based KNN (optimized)"""
-    if models['user_knn'] is None or user_similarity_matrix is None:
+def get_user_knn_recommendations(user_id, n_recommendations=10, exclude_items=None):
+    """Get recommendations using user-based KNN over precomputed neighbor lists"""
+    live = current_bundle()
+    if live.models['user_knn'] is None:
         return {"error": "User-based KNN model not trained"}
     
-    if user_id not in train_user_item_matrix.index:
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
         print(f"Getting user-KNN recommendations for user {user_id}")
-        user_idx = list(train_user_item_matrix.index).index(user_id)
-        user_ratings = train_user_item_matrix.loc[user_id]
-        unrated_items = user_ratings[user_ratings == 0].index
         
-        # Limit to top 100 unrated items for speed
-        unrated_items = unrated_items[:100]
+        # Weighted average of the neighbors' ratings for every item in one pass
+        predicted_ratings = get_model_scores('user_knn', user_idx, folded)
         
-        # Find top 20 similar users for speed
-        user_similarities = user_similarity_matrix[user_idx]
-        similar_user_indices = np.argsort(user_similarities)[::-1][1:21]  # Top 20 similar users
-        similar_users = []
-        
-        for idx in similar_user_indices:
-            other_user_id = list(train_user_item_matrix.index)[idx]
-            similarity = user_similarities[idx]
-            if similarity > 0.1:  # Only consider users with reasonable similarity
-                similar_users.append((other_user_id, similarity))
-        
-        # Calculate predictions for unrated items
-        predictions = {}
-        for item_id in unrated_items:
-            # Find similar users who have rated this item
-            ratings_from_similar = []
-            for similar_user_id, similarity in similar_users:
-                similar_user_rating = train_user_item_matrix.loc[similar_user_id, item_id]
-                if similar_user_rating > 0:
-                    ratings_from_similar.append((similarity, similar_user_rating))
-            
-            # Calculate weighted average prediction
-            if ratings_from_similar:
-                ratings_from_similar.sort(reverse=True)
-                top_ratings = ratings_from_similar[:10]  # Top 10 similar users
-                numerator = sum(sim * rating for sim, rating in top_ratings)
-                denominator = sum(sim for sim, _ in top_ratings)
-                predictions[item_id] = numerator / denominator if denominator > 0 else 0
-        
-        # Get top N recommendations
-        top_items = sorted(predictions.items(), key=lambda x: x[1], reverse=True)[:n_recommendations]
+        # Get top N unrated, non-excluded items the model can score
+        top_items = top_k(predicted_ratings, n_recommendations,
+                          get_seen_mask(user_idx, folded), exclude_items)
         
         # Format recommendations with movie titles and posters
         recommendations = []
-        for item_id, predicted_rating in top_items:
-            movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-            
-            # Get poster URL from cached metadata
-            poster_url = None
-            try:
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-            except:
-                pass
-                
+        for item_idx, predicted_rating in zip(*top_items):
+            item_id = live.train_ratings.item_ids[item_idx]
+            movie_title = live.movie_titles.get(item_id, f"Movie {item_id}")
             recommendations.append({
                 'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
                 'item_id': int(item_id),
                 'title': movie_title,
                 'predicted_rating': round(float(predicted_rating), 2),
                 'model': 'User-KNN',
-                'poster_url': poster_url
+                'poster_url': get_poster_url(item_id, movie_title, 'User-KNN')
             })
         
         print(f"Returning {len(recommendations)} user-KNN recommendations")
@@ -442,66 +1499,38 @@ def get_user_knn_recommendations(user_id, n_recommendations=10):
         print(f"Error in user-KNN: {str(e)}")
         return {"error": f"Error generating User-KNN recommendations: {str(e)}"}
 
-def get_content_recommendations(user_id, n_recommendations=10):
+def get_content_recommendations(user_id, n_recommendations=10, exclude_items=None):
     """Get recommendations using content-based filtering"""
-    if models['content'] is None:
+    live = current_bundle()
+    if live.models['content'] is None:
         return {"error": "Content-based model not trained"}
     
-    if user_id not in train_user_item_matrix.index:
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
-        user_ratings = train_user_item_matrix.loc[user_id]
-        rated_items = user_ratings[user_ratings > 0]
-        unrated_items = user_ratings[user_ratings == 0].index
-        
-        # Get user profile based on rated items
-        user_profile = np.zeros(models['content']['content_matrix'].shape[1])
-        total_weight = 0
-        
-        for item_id, rating in rated_items.items():
-            if item_id in models['content']['movie_ids']:
-                item_idx = models['content']['movie_ids'].index(item_id)
-                item_features = models['content']['content_matrix'][item_idx].toarray().flatten()
-                user_profile += item_features * rating
-                total_weight += rating
-        
-        if total_weight > 0:
-            user_profile = user_profile / total_weight
-        
-        # Calculate similarity between user profile and unrated items
-        predictions = {}
-        for item_id in unrated_items:
-            if item_id in models['content']['movie_ids']:
-                item_idx = models['content']['movie_ids'].index(item_id)
-                item_features = models['content']['content_matrix'][item_idx].toarray().flatten()
-                similarity = cosine_similarity([user_profile], [item_features])[0][0]
-                predictions[item_id] = similarity
+        # Similarity between the user's profile and every item in one sparse product
+        similarity_scores = content_scores(live.models['content']['content_matrix'],
+                                           get_user_vector(user_idx, folded),
+                                           live.models['content']['has_features'])
         
-        # Get top N recommendations
-        top_items = sorted(predictions.items(), key=lambda x: x[1], reverse=True)[:n_recommendations]
+        # Get top N unrated, non-excluded items the model can score
+        top_items = top_k(similarity_scores, n_recommendations,
+                          get_seen_mask(user_idx, folded), exclude_items)
         
         # Format recommendations with movie titles and posters
         recommendations = []
-        for item_id, similarity_score in top_items:
-            movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-            
-            # Get poster URL from cached metadata
-            poster_url = None
-            try:
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-            except:
-                pass
-                
+        for item_idx, similarity_score in zip(*top_items):
+            item_id = live.train_ratings.item_ids[item_idx]
+            movie_title = live.movie_titles.get(item_id, f"Movie {item_id}")
             recommendations.append({
                 'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
                 'item_id': int(item_id),
                 'title': movie_title,
                 'predicted_rating': round(float(similarity_score * 5), 2),  # Scale similarity to rating
                 'model': 'Content-Based',
-                'poster_url': poster_url
+                'poster_url': get_poster_url(item_id, movie_title, 'Content-Based')
             })
         
         return recommendations
@@ -509,101 +1538,54 @@ def get_content_recommendations(user_id, n_recommendations=10):
     except Exception as e:
         return {"error": f"Error generating Content-Based recommendations: {str(e)}"}
 
-def get_ensemble_recommendations(user_id, n_recommendations=10, weights=None):
-    """Get ensemble recommendations by combining multiple models"""
+def get_ensemble_recommendations(user_id, n_recommendations=10, weights=None, exclude_items=None):
+    """Get ensemble recommendations by combining every model's full-catalog scores"""
+    live = current_bundle()
     if weights is None:
-        weights = {'svd': 0.4, 'nmf': 0.3, 'content': 0.3}  # Simplified to faster models
+        weights = ENSEMBLE_WEIGHTS
     
-    print(f"Getting ensemble recommendations for user {user_id}")
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
+        return {"error": f"User {user_id} not found in dataset"}
     
-    # Get recommendations from each model (only use faster models for ensemble)
-    all_recommendations = {}
+    print(f"Getting ensemble recommendations for user {user_id}")
     
     try:
-        # SVD (fast)
-        print("Getting SVD recommendations...")
-        svd_recs = get_svd_recommendations(user_id, n_recommendations * 2)
-        if not isinstance(svd_recs, dict) or 'error' not in svd_recs:
-            for rec in svd_recs:
-                item_id = rec['item_id']
-                if item_id not in all_recommendations:
-                    all_recommendations[item_id] = {'scores': {}, 'title': rec['title']}
-                all_recommendations[item_id]['scores']['svd'] = rec['predicted_rating']
-        
-        # NMF (fast)
-        print("Getting NMF recommendations...")
-        nmf_recs = get_nmf_recommendations(user_id, n_recommendations * 2)
-        if not isinstance(nmf_recs, dict) or 'error' not in nmf_recs:
-            for rec in nmf_recs:
-                item_id = rec['item_id']
-                if item_id not in all_recommendations:
-                    all_recommendations[item_id] = {'scores': {}, 'title': rec['title']}
-                all_recommendations[item_id]['scores']['nmf'] = rec['predicted_rating']
-        
-        # Content-Based (fast)
-        print("Getting Content-based recommendations...")
-        content_recs = get_content_recommendations(user_id, n_recommendations * 2)
-        if not isinstance(content_recs, dict) or 'error' not in content_recs:
-            for rec in content_recs:
-                item_id = rec['item_id']
-                if item_id not in all_recommendations:
-                    all_recommendations[item_id] = {'scores': {}, 'title': rec['title']}
-                all_recommendations[item_id]['scores']['content'] = rec['predicted_rating']
+        # Full score vector from every trained model in the ensemble
+        model_scores = {}
+        for model_name in weights:
+            if live.models.get(model_name) is not None:
+                model_scores[model_name] = get_model_scores(model_name, user_idx, folded)
         
-        # Skip KNN models for now as they are too slow
-        
-        print(f"Got {len(all_recommendations)} unique recommendations")
-        
-        # Calculate weighted ensemble scores
-        ensemble_scores = {}
-        for item_id, data in all_recommendations.items():
-            weighted_score = 0
-            total_weight = 0
-            for model, score in data['scores'].items():
-                if model in weights:
-                    weighted_score += score * weights[model]
-                    total_weight += weights[model]
-            
-            if total_weight > 0:
-                ensemble_scores[item_id] = {
-                    'score': weighted_score / total_weight,
-                    'title': data['title'],
-                    'model_scores': data['scores']
-                }
+        if not model_scores:
+            return {"error": "No ensemble models trained"}
         
-        # Get top N recommendations
-        top_items = sorted(ensemble_scores.items(), key=lambda x: x[1]['score'], reverse=True)[:n_recommendations]
+        # Normalize, blend with the weights and take the top N unrated, non-excluded items
+        seen = get_seen_mask(user_idx, folded)
+        ensemble_scores = combine_scores(model_scores, weights, ~seen)
+        top_indices, _ = top_k(ensemble_scores, n_recommendations, seen, exclude_items)
         
-        # Format recommendations with posters
+        # Format recommendations with posters (only the final N are hydrated)
         recommendations = []
-        for item_id, data in top_items:
-            # Get poster URL from cached metadata or fetch from TMDB
-            poster_url = None
-            try:
-                # First try to get from cached metadata
-                cached_metadata = rating_db.get_movie_metadata(item_id)
-                if cached_metadata and cached_metadata.get('poster_path'):
-                    poster_url = tmdb_client.get_poster_url(cached_metadata['poster_path'])
-                    print(f"Ensemble: Found cached poster for movie {item_id}: {poster_url}")
-                else:
-                    # If not cached, search TMDB directly
-                    print(f"Ensemble: Searching TMDB for movie {item_id} ({data['title']})")
-                    search_result = tmdb_client.search_movie(data['title'])
-                    if search_result and search_result.get('poster_path'):
-                        poster_url = tmdb_client.get_poster_url(search_result['poster_path'])
-                        print(f"Ensemble: Found TMDB poster for movie {item_id}: {poster_url}")
-            except Exception as e:
-                print(f"Ensemble: Error getting poster for movie {item_id}: {e}")
-                pass
-                
+        for item_idx in top_indices:
+            item_id = live.train_ratings.item_ids[item_idx]
+            title = live.movie_titles.get(item_id, f"Movie {item_id}")
+            
+            # Report the weighted average of the models' rating-scale scores
+            item_scores = {model_name: float(scores[item_idx])
+                           for model_name, scores in model_scores.items() if np.isfinite(scores[item_idx])}
+            total_weight = sum(weights[model_name] for model_name in item_scores)
+            predicted_rating = (sum(score * weights[model_name] for model_name, score in item_scores.items()) / total_weight
+                                if total_weight > 0 else 0.0)
+            
             recommendations.append({
                 'id': int(item_id),  # MovieCard expects 'id', not 'item_id'
                 'item_id': int(item_id),
-                'title': data['title'],
-                'predicted_rating': round(float(data['score']), 2),
+                'title': title,
+                'predicted_rating': round(float(predicted_rating), 2),
                 'model': 'Ensemble',
-                'model_scores': data['model_scores'],
-                'poster_url': poster_url
+                'model_scores': {model_name: round(score, 2) for model_name, score in item_scores.items()},
+                'poster_url': get_poster_url(item_id, title, 'Ensemble', search='ensemble' in POSTER_SEARCH_MODELS)
             })
         
         print(f"Returning {len(recommendations)} ensemble recommendations")
@@ -613,121 +1595,196 @@ def get_ensemble_recommendations(user_id, n_recommendations=10, weights=None):
         print(f"Error in ensemble recommendations: {str(e)}")
         return {"error": f"Error generating ensemble recommendations: {str(e)}"}
 
-def get_user_recommendations(user_id, n_recommendations=10, model='ensemble'):
+def get_top_n_store():
+    """Get the live bundle's top-N store as (version, arrays, meta), or None if there is none yet
+
+    A store written after the bundle was swapped in is picked up on a
+    request at most TOP_N_RELOAD_SECONDS later.
+    """
+    live = current_bundle()
+    global top_n_store, top_n_checked_at
+    version = live.info.get('version')
+    store = top_n_store
+    if (store is None or store[0] != version) and time.time() - top_n_checked_at >= TOP_N_RELOAD_SECONDS:
+        top_n_checked_at = time.time()
+        loaded = load_bundle(TOP_N_DIR, version) if version else None
+        if loaded is not None:
+            top_n_store = store = (version, *loaded)
+            print(f"Loaded top-{loaded[1]['n']} store for bundle {version}")
+    return store if store is not None and store[0] == version else None
+
+def get_stored_recommendations(user_id, n_recommendations=10, model='ensemble', exclude_items=None):
+    """Get a user's recommendations from the top-N store, or None if they have to be scored online
+
+    Users the store does not cover, users who have rated since it was
+    built, and requests whose exclusions leave fewer than n of a full
+    stored list are scored online.
+    """
+    live = current_bundle()
+    store = get_top_n_store()
+    if store is None or user_id in live.dirty_users or not live.train_ratings.has_user(user_id):
+        return None
+    _, arrays, meta = store
+    if model not in meta['models']:
+        return None
+    
+    user_idx = live.train_ratings.user_index[user_id]
+    item_ids = np.asarray(arrays[f'{model}.item_ids'][user_idx])
+    keep = item_ids >= 0
+    if exclude_items is not None and len(exclude_items):
+        keep &= ~np.isin(item_ids, live.train_ratings.item_ids[exclude_items])
+    positions = np.flatnonzero(keep)[:n_recommendations]
+    if len(positions) < n_recommendations and item_ids[-1] >= 0:
+        return None
+    
+    scores = arrays[f'{model}.scores'][user_idx]
+    member_names = [name[len(model) + len('.model_scores.'):] for name in arrays
+                    if name.startswith(f'{model}.model_scores.')]
+    recommendations = []
+    for position in positions:
+        item_id = int(item_ids[position])
+        title = live.movie_titles.get(item_id, f"Movie {item_id}")
+        recommendation = {
+            'id': item_id,  # MovieCard expects 'id', not 'item_id'
+            'item_id': item_id,
+            'title': title,
+            'predicted_rating': round(float(scores[position]), 2),
+            'model': MODEL_LABELS[model],
+            'poster_url': get_poster_url(item_id, title, MODEL_LABELS[model], search=model in POSTER_SEARCH_MODELS)
+        }
+        if member_names:
+            member_scores = {name: float(arrays[f'{model}.model_scores.{name}'][user_idx, position])
+                             for name in member_names}
+            recommendation['model_scores'] = {name: round(score, 2) for name, score in member_scores.items()
+                                              if np.isfinite(score)}
+        recommendations.append(recommendation)
+    return recommendations
+
+def get_poster_url(item_id, title, label, search=False):
+    """Get a movie's poster URL from cached metadata, or with search from a TMDB search; None if neither has one"""
+    try:
+        cached_metadata = rating_db.get_movie_metadata(item_id)
+        if cached_metadata and cached_metadata.get('poster_path'):
+            return tmdb_client.get_poster_url(cached_metadata['poster_path'])
+        if not search:
+            return None
+        print(f"{label}: Searching TMDB for movie {item_id} ({title})")
+        search_result = tmdb_client.search_movie(title)
+        if search_result and search_result.get('poster_path'):
+            return tmdb_client.get_poster_url(search_result['poster_path'])
+    except Exception as e:
+        print(f"{label}: Error getting poster for movie {item_id}: {e}")
+    return None
+
+def get_user_recommendations(user_id, n_recommendations=10, model='ensemble', exclude_items=None, retrieval='exact'):
     """Get recommendations for a specific user using specified model"""
-    if model == 'svd':
-        return get_svd_recommendations(user_id, n_recommendations)
-    elif model == 'nmf':
-        return get_nmf_recommendations(user_id, n_recommendations)
+    if model in FACTOR_MODELS:
+        return get_factor_recommendations(model, user_id, n_recommendations, exclude_items, retrieval)
     elif model == 'item_knn':
-        return get_item_knn_recommendations(user_id, n_recommendations)
+        return get_item_knn_recommendations(user_id, n_recommendations, exclude_items)
     elif model == 'user_knn':
-        return get_user_knn_recommendations(user_id, n_recommendations)
+        return get_user_knn_recommendations(user_id, n_recommendations, exclude_items)
+    elif model == 'content':
+        return get_content_recommendations(user_id, n_recommendations, exclude_items)
+    elif model == 'ensemble':
+        return get_ensemble_recommendations(user_id, n_recommendations, exclude_items=exclude_items)
+    else:
+        return {"error": f"Unknown model: {model}. Available models: svd, nmf, als, biased_mf, item_knn, user_knn, content, ensemble"}
+
+def gather_user_factors(model_name, users):
+    """Get a factor model's user vectors for a list of (user_idx, folded) users (users x factors)"""
+    live = current_bundle()
+    rows = np.array([user_idx if folded is None else 0 for user_idx, folded in users], dtype=np.int64)
+    user_factors = live.models[model_name]['user_factors'][rows]
+    for row, (user_idx, folded) in enumerate(users):
+        if folded is not None:
+            user_factors[row] = get_folded_factors(model_name, folded)
+    return user_factors
+
+def get_content_predictions(users, item_indices):
+    """Content-based predictions for (user, item) pairs: 5 x the cosine of the user's profile and the item's features
+
+    Each distinct user's profile is built once, from the feature rows of
+    the items they rated only. Users with no ratings and items with no
+    features get 2.5.
+    """
+    live = current_bundle()
+    content = live.models['content']
+    predictions = np.full(len(item_indices), 2.5)
+    
+    pairs_by_user = defaultdict(list)
+    for pair, (user_idx, folded) in enumerate(users):
+        pairs_by_user[user_idx if folded is None else id(folded)].append(pair)
+    
+    for pairs in pairs_by_user.values():
+        user_idx, folded = users[pairs[0]]
+        if folded is not None:
+            rated = np.flatnonzero(folded['user_vector'])
+            ratings = folded['user_vector'][rated]
+        else:
+            rated, ratings = live.train_ratings.user_ratings(user_idx)
+        if not len(rated):
+            continue
+        
+        user_profile = content_profile(content['content_matrix'][rated], ratings)
+        profile_norm = np.linalg.norm(user_profile)
+        items = item_indices[pairs]
+        scored = content['has_features'][items]
+        similarities = (np.asarray(content['content_matrix'][items[scored]] @ user_profile).ravel() / profile_norm
+                        if profile_norm > 0 else 0.0)
+        predictions[np.asarray(pairs)[scored]] = similarities * 5  # Scale to 1-5 rating
+    return predictions
+
+def predict_pairs(model, users, item_indices):
+    """Predict 1-5 ratings for (user, item) pairs
+
+    users holds each pair's (user_idx, folded) from resolve_user. Factor
+    models gather the pairs' user and item vectors and take all the dot
+    products in one einsum, so a prediction costs O(factors). The ensemble
+    averages the SVD, NMF and content predictions.
+    """
+    live = current_bundle()
+    item_indices = np.asarray(item_indices, dtype=np.int64)
+    if model in FACTOR_MODELS:
+        # For biased MF the dot product includes the global mean and both biases
+        predictions = np.einsum('ij,ij->i', gather_user_factors(model, users), get_item_vectors(model, item_indices))
     elif model == 'content':
-        return get_content_recommendations(user_id, n_recommendations)
+        predictions = get_content_predictions(users, item_indices)
     elif model == 'ensemble':
-        return get_ensemble_recommendations(user_id, n_recommendations)
+        member_predictions = [np.round(predict_pairs(name, users, item_indices), 2)
+                              for name in ('svd', 'nmf', 'content') if live.models[name] is not None]
+        predictions = (np.mean(member_predictions, axis=0) if member_predictions
+                       else np.full(len(item_indices), 2.5))  # Default rating
     else:
-        return {"error": f"Unknown model: {model}. Available models: svd, nmf, item_knn, user_knn, content, ensemble"}
+        raise ValueError(f"Unknown model: {model}")
+    
+    # Ensure ratings are within the valid range (1-5)
+    return np.clip(predictions, 1.0, 5.0)
+
+def can_predict(model):
+    """Whether a model predicts single ratings and is trained"""
+    live = current_bundle()
+    return model == 'ensemble' or (model in FACTOR_MODELS + ('content',) and live.models[model] is not None)
 
 def predict_rating(user_id, item_id, model='svd'):
     """Predict rating for a specific user-item pair using specified model"""
-    if user_id not in train_user_item_matrix.index:
+    live = current_bundle()
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
         return {"error": f"User {user_id} not found in dataset"}
     
-    if item_id not in train_user_item_matrix.columns:
+    if not live.train_ratings.has_item(item_id):
         return {"error": f"Item {item_id} not found in dataset"}
     
+    if not can_predict(model):
+        return {"error": f"Model {model} not supported for prediction or not trained"}
+    
     try:
-        movie_title = movie_titles.get(item_id, f"Movie {item_id}")
-        
-        if model == 'svd' and models['svd'] is not None:
-            user_factors = models['svd'].transform(train_user_item_matrix)
-            item_factors = models['svd'].components_
-            predicted_ratings = np.dot(user_factors, item_factors)
-            predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                              index=train_user_item_matrix.index,
-                                              columns=train_user_item_matrix.columns)
-            predicted_rating = predicted_ratings_df.loc[user_id, item_id]
-        
-        elif model == 'nmf' and models['nmf'] is not None:
-            user_factors = models['nmf'].transform(train_user_item_matrix)
-            item_factors = models['nmf'].components_
-            predicted_ratings = np.dot(user_factors, item_factors)
-            predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                              index=train_user_item_matrix.index,
-                                              columns=train_user_item_matrix.columns)
-            predicted_rating = predicted_ratings_df.loc[user_id, item_id]
-        
-        elif model == 'content' and models['content'] is not None:
-            # Content-based prediction
-            user_ratings = train_user_item_matrix.loc[user_id]
-            rated_items = user_ratings[user_ratings > 0]
-            
-            if len(rated_items) == 0:
-                predicted_rating = 2.5  # Default rating if no history
-            else:
-                # Build user profile
-                user_profile = np.zeros(models['content']['content_matrix'].shape[1])
-                total_weight = 0
-                
-                for rated_item_id, rating in rated_items.items():
-                    if rated_item_id in models['content']['movie_ids']:
-                        item_idx = models['content']['movie_ids'].index(rated_item_id)
-                        item_features = models['content']['content_matrix'][item_idx].toarray().flatten()
-                        user_profile += item_features * rating
-                        total_weight += rating
-                
-                if total_weight > 0:
-                    user_profile = user_profile / total_weight
-                
-                # Get similarity with target item
-                if item_id in models['content']['movie_ids']:
-                    item_idx = models['content']['movie_ids'].index(item_id)
-                    item_features = models['content']['content_matrix'][item_idx].toarray().flatten()
-                    similarity = cosine_similarity([user_profile], [item_features])[0][0]
-                    predicted_rating = similarity * 5  # Scale to 1-5 rating
-                else:
-                    predicted_rating = 2.5  # Default if item not in content matrix
-        
-        elif model == 'ensemble':
-            # Get predictions from multiple models and combine
-            predictions = []
-            
-            # SVD prediction
-            if models['svd'] is not None:
-                svd_pred = predict_rating(user_id, item_id, 'svd')
-                if 'predicted_rating' in svd_pred:
-                    predictions.append(svd_pred['predicted_rating'])
-            
-            # NMF prediction
-            if models['nmf'] is not None:
-                nmf_pred = predict_rating(user_id, item_id, 'nmf')
-                if 'predicted_rating' in nmf_pred:
-                    predictions.append(nmf_pred['predicted_rating'])
-            
-            # Content prediction
-            if models['content'] is not None:
-                content_pred = predict_rating(user_id, item_id, 'content')
-                if 'predicted_rating' in content_pred:
-                    predictions.append(content_pred['predicted_rating'])
-            
-            # Average the predictions
-            if predictions:
-                predicted_rating = sum(predictions) / len(predictions)
-            else:
-                predicted_rating = 2.5  # Default rating
-        
-        else:
-            return {"error": f"Model {model} not supported for prediction or not trained"}
-        
-        # Ensure rating is within valid range (1-5)
-        predicted_rating = max(1.0, min(5.0, predicted_rating))
-        
+        predicted_rating = predict_pairs(model, [(user_idx, folded)], [live.train_ratings.item_index[item_id]])[0]
         return {
             'user_id': user_id,
             'item_id': item_id,
-            'title': movie_title,
+            'title': live.movie_titles.get(item_id, f"Movie {item_id}"),
             'predicted_rating': round(float(predicted_rating), 2),
             'model': model
         }
@@ -736,49 +1793,221 @@ def predict_rating(user_id, item_id, model='svd'):
         print(f"Error in predict_rating: {str(e)}")
         return {"error": f"Error predicting rating: {str(e)}"}
 
+def get_batch_predictions(pairs, model='svd'):
+    """Predict ratings for many (user_id, item_id) pairs at once
+
+    Each user is resolved once; pairs with an unknown user or item get an
+    error entry in place.
+    """
+    live = current_bundle()
+    if not can_predict(model):
+        return {"error": f"Model {model} not supported for prediction or not trained"}
+    
+    resolved = {}
+    results = []
+    valid = []
+    for user_id, item_id in pairs:
+        if user_id not in resolved:
+            resolved[user_id] = resolve_user(user_id)
+        if resolved[user_id] == (None, None):
+            results.append({'user_id': user_id, 'item_id': item_id, 'error': f"User {user_id} not found in dataset"})
+        elif not live.train_ratings.has_item(item_id):
+            results.append({'user_id': user_id, 'item_id': item_id, 'error': f"Item {item_id} not found in dataset"})
+        else:
+            results.append(None)
+            valid.append(len(results) - 1)
+    
+    if valid:
+        predictions = predict_pairs(model, [resolved[pairs[pair][0]] for pair in valid],
+                                    [live.train_ratings.item_index[pairs[pair][1]] for pair in valid])
+        for pair, predicted_rating in zip(valid, predictions):
+            user_id, item_id = pairs[pair]
+            results[pair] = {
+                'user_id': user_id,
+                'item_id': item_id,
+                'title': live.movie_titles.get(item_id, f"Movie {item_id}"),
+                'predicted_rating': round(float(predicted_rating), 2)
+            }
+    return {'predictions': results}
+
+@app.before_request
+def take_bundle():
+    request_bundle.set(live)
+
+@app.teardown_request
+def release_bundle(exception=None):
+    request_bundle.set(None)
+
 @app.route('/')
 def home():
     return jsonify({"message": "AI Movie Recommendation Engine API"})
 
-@app.route('/recommendations/<int:user_id>')
+@app.route('/recommendations/<user_id:user_id>')
 def recommendations(user_id):
     """Get recommendations for a user"""
     n_recommendations = request.args.get('n', 10, type=int)
     model = request.args.get('model', 'ensemble')
-    
-    result = get_user_recommendations(user_id, n_recommendations, model)
+    exclude = [source for source in request.args.get('exclude', '').split(',') if source]
+    retrieval = request.args.get('retrieval', DEFAULT_RETRIEVAL)
+    
+    if retrieval not in ('exact', 'ann'):
+        return jsonify({'error': "retrieval must be 'exact' or 'ann'"}), 400
+    
+    model, fallback = resolve_model(model)
+    if model is None:
+        return jsonify({'error': 'No model is ready yet', 'model_states': model_states}), 503
+    
+    exclude_items = get_excluded_items(user_id, exclude) if exclude else None
+    user_idx, folded = resolve_user(user_id)
+    if user_idx is None and folded is None:
+        # Users with no ratings anywhere get the most popular movies
+        model, fallback, served_from = 'popular', None, 'popular'
+        result = get_popular_recommendations(n_recommendations, exclude_items)
+    else:
+        result = None
+        if SERVING_MODE == 'precomputed':
+            result = get_stored_recommendations(user_id, n_recommendations, model, exclude_items)
+        served_from = 'precomputed' if result is not None else 'online'
+        if result is None:
+            result = get_user_recommendations(user_id, n_recommendations, model, exclude_items, retrieval)
     
     if isinstance(result, dict) and 'error' in result:
         return jsonify(result), 404
     
-    return jsonify({
+    response = {
         'recommendations': result,
         'model': model,
-        'user_id': user_id
-    })
+        'user_id': user_id,
+        'retrieval': retrieval if model in FACTOR_MODELS and served_from == 'online' else 'exact',
+        'served_from': served_from
+    }
+    if fallback:
+        response['fallback'] = fallback
+    return jsonify(response)
+
+@app.route('/recommendations/batch', methods=['POST'])
+def batch_recommendations():
+    """Get recommendations for a list of users in one request"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('user_ids'), list):
+        return jsonify({'error': 'user_ids array is required'}), 400
+    
+    model = data.get('model', 'svd')
+    n_recommendations = data.get('n', 10)
+    include_posters = bool(data.get('include_posters', False))
+    exclude = data.get('exclude', [])
+    
+    if not isinstance(n_recommendations, int) or n_recommendations < 1:
+        return jsonify({'error': 'n must be a positive integer'}), 400
+    
+    model, fallback = resolve_model(model)
+    if model is None:
+        return jsonify({'error': 'No model is ready yet', 'model_states': model_states}), 503
+    
+    result = get_batch_recommendations(data['user_ids'], n_recommendations, model, include_posters, exclude)
+    
+    if 'error' in result:
+        return jsonify(result), 400
+    
+    response = {
+        'recommendations': result,
+        'model': model,
+        'n_recommendations': n_recommendations,
+        'total_users': len(result)
+    }
+    if fallback:
+        response['fallback'] = fallback
+    return jsonify(response)
 
 @app.route('/predict')
 def predict():
     """Predict rating for a user-item pair"""
-    user_id = request.args.get('user_id', type=int)
+    user_id = request.args.get('user_id', type=parse_user_id)
     item_id = request.args.get('item_id', type=int)
     model = request.args.get('model', 'svd')
     
-    if user_id is None or item_id is None:
+    if user_id in (None, '') or item_id is None:
         return jsonify({'error': 'user_id and item_id are required'}), 400
     
+    # Only the factor and content models (and the ensemble of them) predict single ratings
+    model, fallback = resolve_model(model, supported=FACTOR_MODELS + ('content',))
+    if model is None:
+        return jsonify({'error': 'No model is ready yet', 'model_states': model_states}), 503
+    
     result = predict_rating(user_id, item_id, model)
     
     if isinstance(result, dict) and 'error' in result:
         return jsonify(result), 404
     
+    if fallback:
+        result['fallback'] = fallback
     return jsonify(result)
 
+@app.route('/predict/batch', methods=['POST'])
+def batch_predict():
+    """Predict ratings for a list of (user, item) pairs in one request"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('pairs'), list):
+        return jsonify({'error': 'pairs array is required'}), 400
+    
+    pairs = []
+    for pair in data['pairs']:
+        if (not isinstance(pair, dict) or not isinstance(pair.get('user_id'), (int, str))
+                or isinstance(pair.get('user_id'), bool) or not isinstance(pair.get('item_id'), int)):
+            return jsonify({'error': 'Each pair needs an integer or string user_id and an integer item_id'}), 400
+        pairs.append((parse_user_id(pair['user_id']), pair['item_id']))
+    
+    model, fallback = resolve_model(data.get('model', 'svd'), supported=FACTOR_MODELS + ('content',))
+    if model is None:
+        return jsonify({'error': 'No model is ready yet', 'model_states': model_states}), 503
+    
+    result = get_batch_predictions(pairs, model)
+    
+    if 'error' in result:
+        return jsonify(result), 400
+    
+    response = {
+        'predictions': result['predictions'],
+        'model': model,
+        'total_pairs': len(pairs)
+    }
+    if fallback:
+        response['fallback'] = fallback
+    return jsonify(response)
+
+def require_admin_token(f):
+    """Reject requests to an admin route that do not carry ADMIN_TOKEN as a bearer token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled; set ADMIN_TOKEN to enable them'}), 403
+        
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+        if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Missing or invalid authorization header'}), 401
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
+@app.route('/admin/retrain', methods=['POST'])
+@require_admin_token
+def retrain():
+    """Retrain the models in the background and hot-swap them in when done"""
+    live = current_bundle()
+    started = start_background_retrain()
+    return jsonify({
+        'started': started,
+        'retrain': retrain_status,
+        'model_bundle': live.info
+    }), 202 if started else 409
+
 @app.route('/models')
 def get_models():
     """Get available models and their status"""
+    live = current_bundle()
     model_status = {}
-    for model_name, model in models.items():
+    for model_name, model in live.models.items():
         if model_name == 'content':
             model_status[model_name] = model is not None and 'tfidf' in model
         else:
@@ -786,38 +2015,86 @@ def get_models():
     
     return jsonify({
         'models': model_status,
-        'available_models': ['svd', 'nmf', 'item_knn', 'user_knn', 'content', 'ensemble']
+        'model_states': model_states,
+        'available_models': ['svd', 'nmf', 'als', 'biased_mf', 'item_knn', 'user_knn', 'content', 'ensemble']
     })
 
-@app.route('/compare/<int:user_id>')
+@app.route('/compare/<user_id:user_id>')
 def compare_models(user_id):
-    """Compare recommendations from different models for a user"""
+    """Compare recommendations from different models for a user
+
+    The models run concurrently, each against its own deadline (the
+    deadline query parameter overrides the default). Models that miss it
+    are reported as timed out and the rest are returned.
+    """
     n_recommendations = request.args.get('n', 10, type=int)
+    default_deadline = request.args.get('deadline', COMPARE_DEADLINE_SECONDS, type=float)
     
     comparison = {}
-    model_list = ['svd', 'nmf', 'item_knn', 'user_knn', 'content', 'ensemble']
+    timings = {}
+    model_list = ['svd', 'nmf', 'als', 'biased_mf', 'item_knn', 'user_knn', 'content', 'ensemble']
+    
+    start_time = time.time()
+    deadlines = {model: COMPARE_MODEL_DEADLINES.get(model, default_deadline) for model in model_list}
+    bundle = current_bundle()
+    futures = {model: compare_executor.submit(run_compare_model, bundle, user_id, n_recommendations, model,
+                                              start_time + deadlines[model])
+               for model in model_list}
     
     for model in model_list:
-        result = get_user_recommendations(user_id, n_recommendations, model)
-        if isinstance(result, dict) and 'error' in result:
+        try:
+            result, seconds = futures[model].result(timeout=max(start_time + deadlines[model] - time.time(), 0))
+        except FutureTimeoutError:
+            result, seconds = None, None
+        
+        if result is None:
+            comparison[model] = {'error': f"Timed out after {deadlines[model]}s", 'timed_out': True}
+            timings[model] = {'status': 'timeout', 'deadline': deadlines[model]}
+        elif isinstance(result, dict) and 'error' in result:
             comparison[model] = {'error': result['error']}
+            timings[model] = {'status': 'error', 'seconds': round(seconds, 4)}
         else:
             comparison[model] = result
+            timings[model] = {'status': 'ok', 'seconds': round(seconds, 4)}
     
     return jsonify({
         'user_id': user_id,
         'comparison': comparison,
-        'n_recommendations': n_recommendations
+        'n_recommendations': n_recommendations,
+        'timings': timings,
+        'partial': any(timing['status'] == 'timeout' for timing in timings.values()),
+        'total_seconds': round(time.time() - start_time, 4)
     })
 
+def run_compare_model(bundle, user_id, n_recommendations, model, deadline_at):
+    """Get one model's recommendations for /compare as (result, seconds); (None, None) if it starts past its deadline
+
+    Runs on a compare_executor thread, serving from the bundle the request
+    started on; it may still be running after the request has returned.
+    """
+    if time.time() >= deadline_at:
+        return None, None
+    
+    request_bundle.set(bundle)
+    try:
+        start_time = time.time()
+        try:
+            result = get_user_recommendations(user_id, n_recommendations, model)
+        except Exception as e:
+            result = {'error': f"Error getting {model} recommendations: {str(e)}"}
+        return result, time.time() - start_time
+    finally:
+        request_bundle.set(None)
+
 @app.route('/movies')
 def get_movies():
     """Get all movies with basic information and posters"""
+    live = current_bundle()
     limit = request.args.get('limit', type=int)
     include_posters = request.args.get('include_posters', 'false').lower() == 'true'
     
     movies = []
-    movie_items = list(movie_titles.items())
+    movie_items = list(live.movie_titles.items())
     
     if limit:
         movie_items = movie_items[:limit]
@@ -827,7 +2104,7 @@ def get_movies():
             'id': movie_id,
             'title': title,
             'year': extract_year(title),
-            'genres': movie_genres.get(movie_id, [])
+            'genres': live.movie_genres.get(movie_id, [])
         }
         
         # Add poster URL if requested and available
@@ -837,7 +2114,7 @@ def get_movies():
                 movie_info['poster_url'] = tmdb_client.get_poster_url(cached_metadata['poster_path'])
         
         # Add user rating statistics
-        avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+        avg_rating, rating_count = get_rating_stats(movie_id)
         if avg_rating > 0:
             movie_info['user_rating'] = round(avg_rating, 2)
             movie_info['user_rating_count'] = rating_count
@@ -850,27 +2127,59 @@ def get_movies():
         'has_posters': include_posters
     })
 
+def top_n_status():
+    """Describe the live bundle's top-N store for /status, or None if there is none"""
+    store = get_top_n_store() if SERVING_MODE == 'precomputed' else None
+    if store is None:
+        return None
+    version, _, meta = store
+    return {'version': version, 'n': meta['n'], 'models': meta['models'], 'created_at': meta['created_at'],
+            'build_seconds': meta.get('build_seconds')}
+
 @app.route('/status')
 def status():
     """Get system status"""
+    live = current_bundle()
     model_status = {}
-    for model_name, model in models.items():
+    for model_name, model in live.models.items():
         if model_name == 'content':
             model_status[model_name] = model is not None and 'tfidf' in model
         else:
             model_status[model_name] = model is not None
     
+    ann_recall = {model_name: live.models[model_name]['ann_recall'] for model_name in FACTOR_MODELS
+                  if live.models[model_name] is not None and 'ann_recall' in live.models[model_name]}
+    training_reports = {model_name: live.models[model_name]['training_report'] for model_name in FACTOR_MODELS
+                        if live.models[model_name] is not None and 'training_report' in live.models[model_name]}
+    precision_reports = {model_name: live.models[model_name]['precision_report'] for model_name in FACTOR_MODELS
+                         if live.models[model_name] is not None and 'precision_report' in live.models[model_name]}
+    
     return jsonify({
         'status': 'running',
         'models_trained': model_status,
-        'total_movies': len(movie_titles),
-        'total_users': len(user_item_matrix.index) if user_item_matrix is not None else 0,
-        'total_ratings': len(data) if data is not None else 0
+        'model_states': model_states,
+        'ann_recall': ann_recall,
+        'training_reports': training_reports,
+        'serving_precision': SERVING_PRECISION,
+        'precision_reports': precision_reports,
+        'default_retrieval': DEFAULT_RETRIEVAL,
+        'serving_mode': SERVING_MODE,
+        'top_n_store': top_n_status(),
+        'dirty_users': len(live.dirty_users),
+        'model_bundle': live.info,
+        'retrain': retrain_status,
+        'folded_users_cached': len(live.folded_users),
+        'pending_ratings': live.train_ratings.n_pending if live.train_ratings is not None else 0,
+        'worker': {'pid': os.getpid(), 'memory_kb': memory_usage()},
+        'total_movies': len(live.movie_titles),
+        'total_users': live.all_ratings.n_users if live.all_ratings is not None else 0,
+        'total_ratings': len(live.data) if live.data is not None else 0
     })
 
 @app.route('/search')
 def search_movies():
     """Search movies by title with enhanced information"""
+    live = current_bundle()
     query = request.args.get('q', '').lower()
     sort_by = request.args.get('sort', 'title')
     limit = request.args.get('limit', 50, type=int)
@@ -881,13 +2190,13 @@ def search_movies():
     
     # Filter movies based on search query
     matching_movies = []
-    for movie_id, title in movie_titles.items():
+    for movie_id, title in live.movie_titles.items():
         if query in title.lower():
             movie_info = {
                 'id': movie_id,
                 'title': title,
                 'year': extract_year(title),
-                'genres': movie_genres.get(movie_id, [])
+                'genres': live.movie_genres.get(movie_id, [])
             }
             
             # Add poster URL if requested and available
@@ -897,7 +2206,7 @@ def search_movies():
                     movie_info['poster_url'] = tmdb_client.get_poster_url(cached_metadata['poster_path'])
             
             # Add user rating statistics
-            avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+            avg_rating, rating_count = get_rating_stats(movie_id)
             if avg_rating > 0:
                 movie_info['user_rating'] = round(avg_rating, 2)
                 movie_info['user_rating_count'] = rating_count
@@ -933,16 +2242,17 @@ def extract_year(title):
 @app.route('/movies/random')
 def get_random_movies():
     """Get random movies for browsing"""
+    live = current_bundle()
     limit = request.args.get('limit', 20, type=int)
     include_posters = request.args.get('include_posters', 'false').lower() == 'true'
     
     movie_list = []
-    for movie_id, title in movie_titles.items():
+    for movie_id, title in live.movie_titles.items():
         movie_info = {
             'id': movie_id,
             'title': title,
             'year': extract_year(title),
-            'genres': movie_genres.get(movie_id, [])
+            'genres': live.movie_genres.get(movie_id, [])
         }
         
         # Add poster URL if requested and available
@@ -954,7 +2264,7 @@ def get_random_movies():
                 has_poster = True
         
         # Add user rating statistics
-        avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+        avg_rating, rating_count = get_rating_stats(movie_id)
         if avg_rating > 0:
             movie_info['user_rating'] = round(avg_rating, 2)
             movie_info['user_rating_count'] = rating_count
@@ -979,15 +2289,16 @@ def get_random_movies():
 @app.route('/movies/<int:movie_id>')
 def get_movie_details(movie_id):
     """Get details for a specific movie"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
-    movie_title = movie_titles[movie_id]
+    movie_title = live.movie_titles[movie_id]
     
     # Get some statistics if possible
     movie_stats = {}
-    if data is not None:
-        movie_data = data[data['item_id'] == movie_id]
+    if live.data is not None:
+        movie_data = live.data[live.data['item_id'] == movie_id]
         if not movie_data.empty:
             movie_stats = {
                 'average_rating': round(movie_data['rating'].mean(), 2),
@@ -1002,22 +2313,87 @@ def get_movie_details(movie_id):
         'stats': movie_stats
     })
 
+@app.route('/movies/<int:movie_id>/similar')
+def get_similar_movies(movie_id):
+    """Get the movies most similar to a movie, from the item-KNN neighbor lists"""
+    live = current_bundle()
+    n_similar = request.args.get('n', 10, type=int)
+    
+    if live.models['item_knn'] is None:
+        return jsonify({'error': 'Item-KNN model is not ready yet', 'model_states': model_states}), 503
+    if not live.train_ratings.has_item(movie_id):
+        return jsonify({'error': f'Movie {movie_id} not found'}), 404
+    
+    item_indices, similarities = similar_items(live.models['item_knn']['neighbors'],
+                                               live.train_ratings.item_index[movie_id], n_similar)
+    similar_movies = []
+    for item_idx, similarity in zip(item_indices, similarities):
+        item_id = int(live.train_ratings.item_ids[item_idx])
+        similar_movies.append({
+            'id': item_id,
+            'item_id': item_id,
+            'title': live.movie_titles.get(item_id, f"Movie {item_id}"),
+            'similarity': round(float(similarity), 4)
+        })
+    
+    return jsonify({
+        'movie_id': movie_id,
+        'title': live.movie_titles.get(movie_id, f"Movie {movie_id}"),
+        'similar_movies': similar_movies,
+        'total': len(similar_movies)
+    })
+
+@app.route('/movies/popular')
+def get_popular_movies():
+    """Get the top-rated movies by Bayesian average ('bayesian'), recency-weighted average ('recent') or count"""
+    live = current_bundle()
+    limit = request.args.get('limit', 20, type=int)
+    kind = request.args.get('kind', 'bayesian')
+    
+    popularity = get_popularity()
+    if popularity is None:
+        return jsonify({'error': 'Popularity rankings are not ready yet'}), 503
+    if kind not in PopularityModel.KINDS:
+        return jsonify({'error': f"Unknown kind: {kind}. Available: {', '.join(PopularityModel.KINDS)}"}), 400
+    
+    item_ids, scores = popularity.top_items(limit, kind)
+    popular_movies = []
+    for item_id, score in zip(item_ids.tolist(), scores):
+        average_rating, rating_count = popularity.item_stats(item_id)
+        popular_movies.append({
+            'id': item_id,
+            'item_id': item_id,
+            'title': live.movie_titles.get(item_id, f"Movie {item_id}"),
+            'year': extract_year(live.movie_titles.get(item_id, '')),
+            'genres': live.movie_genres.get(item_id, []),
+            'score': round(float(score), 4),
+            'average_rating': round(average_rating, 2),
+            'rating_count': rating_count
+        })
+    
+    return jsonify({
+        'movies': popular_movies,
+        'total': len(popular_movies),
+        'kind': kind
+    })
+
 # === NEW ENDPOINTS FOR RATINGS AND MOVIE POSTERS ===
 
 @app.route('/movies/<int:movie_id>/enhanced')
 def get_enhanced_movie_details(movie_id):
     """Get enhanced movie details with poster, metadata, and ratings"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
-    movie_title = movie_titles[movie_id]
+    movie_title = live.movie_titles[movie_id]
     
     # Get basic movie info
     movie_info = {
         'id': movie_id,
         'title': movie_title,
         'year': extract_year(movie_title),
-        'genres': movie_genres.get(movie_id, [])
+        'genres': live.movie_genres.get(movie_id, [])
     }
     
     # Get cached metadata or fetch from TMDB
@@ -1052,15 +2428,15 @@ def get_enhanced_movie_details(movie_id):
         })
     
     # Get rating statistics
-    avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+    avg_rating, rating_count = get_rating_stats(movie_id)
     movie_info.update({
         'user_rating': round(avg_rating, 2) if avg_rating > 0 else None,
         'user_rating_count': rating_count
     })
     
     # Get original dataset statistics
-    if data is not None:
-        movie_data = data[data['item_id'] == movie_id]
+    if live.data is not None:
+        movie_data = live.data[live.data['item_id'] == movie_id]
         if not movie_data.empty:
             movie_info['original_stats'] = {
                 'average_rating': round(movie_data['rating'].mean(), 2),
@@ -1073,7 +2449,8 @@ def get_enhanced_movie_details(movie_id):
 @app.route('/movies/<int:movie_id>/rate', methods=['POST'])
 def rate_movie(movie_id):
     """Rate a movie"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
     data = request.get_json()
@@ -1086,15 +2463,23 @@ def rate_movie(movie_id):
     if not user_id or rating is None:
         return jsonify({'error': 'user_id and rating are required'}), 400
     
+    # User ids are integers, as in u.data, or strings, like Firebase uids
+    if not isinstance(user_id, (int, str)) or isinstance(user_id, bool):
+        return jsonify({'error': 'user_id must be an integer or a string'}), 400
+    user_id = parse_user_id(user_id)
+    
     if not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
         return jsonify({'error': 'Rating must be between 1 and 5'}), 400
     
     # Save the rating
+    previous = get_app_rating(user_id, movie_id)
     success = rating_db.add_rating(user_id, movie_id, rating)
-    
     if success:
+        count_popularity_rating(user_id, movie_id, float(rating), previous)
+        add_live_rating(user_id, movie_id, float(rating))
+        
         # Get updated statistics
-        avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+        avg_rating, rating_count = refresh_rating_stats(movie_id)
         
         return jsonify({
             'success': True,
@@ -1108,20 +2493,21 @@ def rate_movie(movie_id):
     else:
         return jsonify({'error': 'Failed to save rating'}), 500
 
-@app.route('/users/<int:user_id>/ratings')
+@app.route('/users/<user_id:user_id>/ratings')
 def get_user_ratings(user_id):
     """Get all ratings for a user"""
+    live = current_bundle()
     ratings = rating_db.get_user_ratings(user_id)
     
     # Enhance with movie information
     enhanced_ratings = []
     for rating in ratings:
         movie_id = rating['movie_id']
-        if movie_id in movie_titles:
+        if movie_id in live.movie_titles:
             enhanced_rating = {
                 'movie_id': movie_id,
-                'title': movie_titles[movie_id],
-                'year': extract_year(movie_titles[movie_id]),
+                'title': live.movie_titles[movie_id],
+                'year': extract_year(live.movie_titles[movie_id]),
                 'rating': rating['rating'],
                 'timestamp': rating['timestamp']
             }
@@ -1139,10 +2525,11 @@ def get_user_ratings(user_id):
         'total_ratings': len(enhanced_ratings)
     })
 
-@app.route('/movies/<int:movie_id>/rating/<int:user_id>')
+@app.route('/movies/<int:movie_id>/rating/<user_id:user_id>')
 def get_user_movie_rating(movie_id, user_id):
     """Get a specific user's rating for a movie"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
     rating = rating_db.get_movie_rating(user_id, movie_id)
@@ -1154,20 +2541,21 @@ def get_user_movie_rating(movie_id, user_id):
         'has_rated': rating is not None
     })
 
-@app.route('/users/<int:user_id>/watchlist')
+@app.route('/users/<user_id:user_id>/watchlist')
 def get_user_watchlist(user_id):
     """Get user's watchlist"""
+    live = current_bundle()
     watchlist_ids = rating_db.get_watchlist(user_id)
     
     # Enhance with movie information
     watchlist_movies = []
     for movie_id in watchlist_ids:
-        if movie_id in movie_titles:
+        if movie_id in live.movie_titles:
             movie_info = {
                 'id': movie_id,
-                'title': movie_titles[movie_id],
-                'year': extract_year(movie_titles[movie_id]),
-                'genres': movie_genres.get(movie_id, [])
+                'title': live.movie_titles[movie_id],
+                'year': extract_year(live.movie_titles[movie_id]),
+                'genres': live.movie_genres.get(movie_id, [])
             }
             
             # Add poster if available
@@ -1183,10 +2571,11 @@ def get_user_watchlist(user_id):
         'total_movies': len(watchlist_movies)
     })
 
-@app.route('/users/<int:user_id>/watchlist/<int:movie_id>', methods=['POST'])
+@app.route('/users/<user_id:user_id>/watchlist/<int:movie_id>', methods=['POST'])
 def add_to_watchlist(user_id, movie_id):
     """Add movie to user's watchlist"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
     success = rating_db.add_to_watchlist(user_id, movie_id)
@@ -1201,10 +2590,11 @@ def add_to_watchlist(user_id, movie_id):
     else:
         return jsonify({'error': 'Failed to add to watchlist'}), 500
 
-@app.route('/users/<int:user_id>/watchlist/<int:movie_id>', methods=['DELETE'])
+@app.route('/users/<user_id:user_id>/watchlist/<int:movie_id>', methods=['DELETE'])
 def remove_from_watchlist(user_id, movie_id):
     """Remove movie from user's watchlist"""
-    if movie_id not in movie_titles:
+    live = current_bundle()
+    if movie_id not in live.movie_titles:
         return jsonify({'error': f'Movie {movie_id} not found'}), 404
     
     success = rating_db.remove_from_watchlist(user_id, movie_id)
@@ -1222,6 +2612,7 @@ def remove_from_watchlist(user_id, movie_id):
 @app.route('/movies/batch-enhance', methods=['POST'])
 def batch_enhance_movies():
     """Batch enhance movies with TMDB data"""
+    live = current_bundle()
     data = request.get_json()
     if not data or 'movie_ids' not in data:
         return jsonify({'error': 'movie_ids array is required'}), 400
@@ -1230,12 +2621,12 @@ def batch_enhance_movies():
     enhanced_movies = []
     
     for movie_id in movie_ids:
-        if movie_id in movie_titles:
+        if movie_id in live.movie_titles:
             movie_info = {
                 'id': movie_id,
-                'title': movie_titles[movie_id],
-                'year': extract_year(movie_titles[movie_id]),
-                'genres': movie_genres.get(movie_id, [])
+                'title': live.movie_titles[movie_id],
+                'year': extract_year(live.movie_titles[movie_id]),
+                'genres': live.movie_genres.get(movie_id, [])
             }
             
             # Get cached metadata
@@ -1247,7 +2638,7 @@ def batch_enhance_movies():
                 movie_info['tmdb_rating'] = cached_metadata.get('vote_average')
             
             # Get user rating statistics
-            avg_rating, rating_count = rating_db.get_average_rating(movie_id)
+            avg_rating, rating_count = get_rating_stats(movie_id)
             movie_info.update({
                 'user_rating': round(avg_rating, 2) if avg_rating > 0 else None,
                 'user_rating_count': rating_count
@@ -1263,8 +2654,11 @@ def batch_enhance_movies():
 # === END OF NEW ENDPOINTS ===
 
 if __name__ == '__main__':
-    # Load data on startup
-    load_and_train_model()
+    # Load data on startup; models still training are served by a fallback until ready
+    load_and_train_model(background=BACKGROUND_TRAINING)
+    
+    if RETRAIN_INTERVAL > 0:
+        threading.Thread(target=retrain_periodically, daemon=True).start()
     
     # Get port from environment variable or default to 5000
     import os
@@ -150,6 +150,19 @@ def load_movie_titles():
     
     return movie_titles, movie_genres
 
+def build_factor_model(estimator, user_item_matrix):
+    """Precompute user and item factors so serving a user is one row x factor-matrix product"""
+    return {
+        'user_factors': estimator.transform(user_item_matrix),
+        'item_factors': estimator.components_
+    }
+
+def get_factor_scores(model_name, user_id):
+    """Get predicted ratings for every item from a factor model's cached factors"""
+    factors = models[model_name]
+    user_idx = train_user_item_matrix.index.get_loc(user_id)
+    return np.dot(factors['user_factors'][user_idx], factors['item_factors'])
+
 def load_and_train_model():
     """Load data and train optimized models for production"""
     global models, train_user_item_matrix, data, user_item_matrix, movie_titles, movie_genres
@@ -184,13 +197,15 @@ def load_and_train_model():
         
         # 1. SVD Model (Fast and effective)
         print("Training SVD model...")
-        models['svd'] = TruncatedSVD(n_components=50, random_state=42)
-        models['svd'].fit(train_user_item_matrix)
+        svd = TruncatedSVD(n_components=50, random_state=42)
+        svd.fit(train_user_item_matrix)
+        models['svd'] = build_factor_model(svd, train_user_item_matrix)
         
         # 2. NMF Model (Good for interpretability)
         print("Training NMF model...")
-        models['nmf'] = NMF(n_components=50, random_state=42, max_iter=200)
-        models['nmf'].fit(train_user_item_matrix)
+        nmf = NMF(n_components=50, random_state=42, max_iter=200)
+        nmf.fit(train_user_item_matrix)
+        models['nmf'] = build_factor_model(nmf, train_user_item_matrix)
         
         # 3. Content-based Filtering
         print("Training Content-based model...")
@@ -238,18 +253,13 @@ def get_svd_recommendations(user_id, n_recommendations=10):
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
-        user_factors = models['svd'].transform(train_user_item_matrix)
-        item_factors = models['svd'].components_
-        
-        predicted_ratings = np.dot(user_factors, item_factors)
-        predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                          index=train_user_item_matrix.index,
-                                          columns=train_user_item_matrix.columns)
+        predicted_ratings = pd.Series(get_factor_scores('svd', user_id),
+                                      index=train_user_item_matrix.columns)
         
         user_ratings = train_user_item_matrix.loc[user_id]
         unrated_items = user_ratings[user_ratings == 0].index
         
-        user_predictions = predicted_ratings_df.loc[user_id, unrated_items]
+        user_predictions = predicted_ratings[unrated_items]
         top_recommendations = user_predictions.nlargest(n_recommendations)
         
         recommendations = []
@@ -288,18 +298,13 @@ def get_nmf_recommendations(user_id, n_recommendations=10):
         return {"error": f"User {user_id} not found in dataset"}
     
     try:
-        user_factors = models['nmf'].transform(train_user_item_matrix)
-        item_factors = models['nmf'].components_
-        
-        predicted_ratings = np.dot(user_factors, item_factors)
-        predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                          index=train_user_item_matrix.index,
-                                          columns=train_user_item_matrix.columns)
+        predicted_ratings = pd.Series(get_factor_scores('nmf', user_id),
+                                      index=train_user_item_matrix.columns)
         
         user_ratings = train_user_item_matrix.loc[user_id]
         unrated_items = user_ratings[user_ratings == 0].index
         
-        user_predictions = predicted_ratings_df.loc[user_id, unrated_items]
+        user_predictions = predicted_ratings[unrated_items]
         top_recommendations = user_predictions.nlargest(n_recommendations)
         
         recommendations = []
@@ -27,6 +27,7 @@ try:
     from sklearn.decomposition import TruncatedSVD, NMF
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.model_selection import train_test_split
+    from popularity import PopularityModel
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
@@ -134,6 +135,10 @@ data = None
 user_item_matrix = None
 movie_titles = {}
 movie_genres = {}
+# Popularity over MovieLens and app ratings, for users the models don't know
+popularity = None
+# MovieLens (rating, timestamp) by (user_id, item_id), for the rating an app rating replaces
+data_ratings = None
 
 def load_movie_titles():
     """Load movie titles and genres from u.item file"""
@@ -180,9 +185,22 @@ def load_movie_titles():
             movie_titles[i] = f"Movie {i}"
             movie_genres[i] = "Action"
 
+def build_factor_model(estimator, user_item_matrix):
+    """Precompute user and item factors so serving a user is one row x factor-matrix product"""
+    return {
+        'user_factors': estimator.transform(user_item_matrix),
+        'item_factors': estimator.components_
+    }
+
+def get_factor_scores(model_name, user_id):
+    """Get predicted ratings for every item from a factor model's cached factors"""
+    factors = models[model_name]
+    user_idx = train_user_item_matrix.index.get_loc(user_id)
+    return np.dot(factors['user_factors'][user_idx], factors['item_factors'])
+
 def load_and_train_models():
     """Load data and train lightweight models for PythonAnywhere"""
-    global models, train_user_item_matrix, data, user_item_matrix
+    global models, train_user_item_matrix, data, user_item_matrix, popularity, data_ratings
     
     if not SKLEARN_AVAILABLE:
         logger.warning("scikit-learn not available. ML features disabled.")
@@ -204,6 +222,17 @@ def load_and_train_models():
         
         logger.info(f"Loaded {len(data)} ratings from {data['user_id'].nunique()} users and {data['item_id'].nunique()} movies")
         
+        # Popularity rankings for cold-start users over MovieLens and saved app ratings,
+        # damped towards the global mean
+        ratings = data
+        if rating_db and hasattr(rating_db, 'get_all_ratings'):
+            app_ratings = pd.DataFrame(rating_db.get_all_ratings(), columns=column_names)
+            app_ratings['timestamp'] = pd.to_datetime(app_ratings['timestamp']).astype('int64') // 10**9
+            ratings = pd.concat([data, app_ratings], ignore_index=True).drop_duplicates(['user_id', 'item_id'], keep='last')
+        popularity = PopularityModel(sorted(movie_titles), prior_count=10).fit(
+            ratings['item_id'].values, ratings['rating'].values, ratings['timestamp'].values)
+        data_ratings = data.set_index(['user_id', 'item_id'])[['rating', 'timestamp']].sort_index()
+        
         # Split data
         train_data, test_data = train_test_split(data, test_size=0.2, random_state=42)
         
@@ -219,13 +248,15 @@ def load_and_train_models():
         # Train only fast models for PythonAnywhere
         # 1. SVD Model (reduced components for speed)
         logger.info("Training SVD model...")
-        models['svd'] = TruncatedSVD(n_components=25, random_state=42)
-        models['svd'].fit(train_user_item_matrix)
+        svd = TruncatedSVD(n_components=25, random_state=42)
+        svd.fit(train_user_item_matrix)
+        models['svd'] = build_factor_model(svd, train_user_item_matrix)
         
         # 2. NMF Model (reduced components for speed)
         logger.info("Training NMF model...")
-        models['nmf'] = NMF(n_components=25, random_state=42, max_iter=100)
-        models['nmf'].fit(train_user_item_matrix)
+        nmf = NMF(n_components=25, random_state=42, max_iter=100)
+        nmf.fit(train_user_item_matrix)
+        models['nmf'] = build_factor_model(nmf, train_user_item_matrix)
         
         # 3. Content-based (lightweight)
         logger.info("Training Content-based model...")
@@ -252,50 +283,47 @@ def load_and_train_models():
         logger.error(f"Error training models: {e}")
         return False
 
+def get_popular_recommendations(n_recommendations=10):
+    """Get the top movies by Bayesian-average rating, or the first catalog entries without ratings data"""
+    if popularity is None:
+        return [{'id': movie_id, 'item_id': movie_id, 'title': title, 'predicted_rating': 4.0,
+                 'model': 'Popular', 'poster_url': None}
+                for movie_id, title in list(movie_titles.items())[:n_recommendations]]
+    
+    item_ids, scores = popularity.top_items(n_recommendations)
+    return [{'id': item_id, 'item_id': item_id, 'title': movie_titles.get(item_id, f"Movie {item_id}"),
+             'predicted_rating': round(float(score), 2), 'model': 'Popular', 'poster_url': None}
+            for item_id, score in zip(item_ids.tolist(), scores)]
+
+def get_data_rating(user_id, movie_id):
+    """Get a user's MovieLens (rating, unix timestamp) for a movie, or () if they have none"""
+    if data_ratings is None:
+        return ()
+    try:
+        rating, timestamp = data_ratings.loc[(user_id, movie_id)]
+    except (KeyError, TypeError):
+        return ()
+    return float(rating), int(timestamp)
+
 def get_simple_recommendations(user_id, n_recommendations=10):
     """Get simple recommendations using available models"""
     if not SKLEARN_AVAILABLE or models['svd'] is None:
         # Return popular movies as fallback
-        popular_movies = []
-        for movie_id, title in list(movie_titles.items())[:n_recommendations]:
-            popular_movies.append({
-                'id': movie_id,
-                'item_id': movie_id,
-                'title': title,
-                'predicted_rating': 4.0,
-                'model': 'Popular',
-                'poster_url': None
-            })
-        return popular_movies
+        return get_popular_recommendations(n_recommendations)
     
     try:
         if user_id not in train_user_item_matrix.index:
             # Return popular movies for unknown users
-            popular_movies = []
-            for movie_id, title in list(movie_titles.items())[:n_recommendations]:
-                popular_movies.append({
-                    'id': movie_id,
-                    'item_id': movie_id,
-                    'title': title,
-                    'predicted_rating': 4.0,
-                    'model': 'Popular',
-                    'poster_url': None
-                })
-            return popular_movies
+            return get_popular_recommendations(n_recommendations)
         
         # Use SVD for recommendations
-        user_factors = models['svd'].transform(train_user_item_matrix)
-        item_factors = models['svd'].components_
-        
-        predicted_ratings = np.dot(user_factors, item_factors)
-        predicted_ratings_df = pd.DataFrame(predicted_ratings, 
-                                          index=train_user_item_matrix.index,
-                                          columns=train_user_item_matrix.columns)
+        predicted_ratings = pd.Series(get_factor_scores('svd', user_id),
+                                      index=train_user_item_matrix.columns)
         
         user_ratings = train_user_item_matrix.loc[user_id]
         unrated_items = user_ratings[user_ratings == 0].index
         
-        user_predictions = predicted_ratings_df.loc[user_id, unrated_items]
+        user_predictions = predicted_ratings[unrated_items]
         top_recommendations = user_predictions.nlargest(n_recommendations)
         
         recommendations = []
@@ -599,9 +627,19 @@ def rate_movie(movie_id):
             rating_db.initialize_db()
         
         # Save the rating
+        # The user's earlier rating of the movie, which the new one replaces in the popularity counts:
+        # their app rating, or else their MovieLens one
+        previous = ()
+        if popularity is not None:
+            previous = next(((saved['rating'], pd.Timestamp(saved['timestamp']).value // 10**9)
+                             for saved in rating_db.get_user_ratings(user_id) if saved['movie_id'] == movie_id),
+                            None) or get_data_rating(user_id, movie_id)
         success = rating_db.add_rating(user_id, movie_id, rating)
         
         if success:
+            if popularity is not None:
+                popularity.add_rating(movie_id, float(rating), time.time(), *previous)
+            
             # Get updated statistics
             try:
                 avg_rating, rating_count = rating_db.get_average_rating(movie_id)
@@ -0,0 +1,152 @@
+"""
+Biased matrix factorization (Funk SVD) trained by mini-batch SGD
+"""
+import time
+import numpy as np
+import scipy.sparse as sp
+
+
+def scatter_add(target, indices, updates):
+    """Add each row of updates to target[indices], summing rows that share an index
+
+    Does what np.add.at does, but by sorting the indices and summing each
+    run with np.add.reduceat, which is much faster for 2-D updates.
+    """
+    order = np.argsort(indices, kind='stable')
+    sorted_indices = indices[order]
+    starts = np.flatnonzero(np.concatenate([[True], sorted_indices[1:] != sorted_indices[:-1]]))
+    target[sorted_indices[starts]] += np.add.reduceat(updates[order], starts, axis=0)
+
+
+class BiasedMatrixFactorization:
+    """Predicts r_ui = mu + b_u + b_i + p_u . q_i, fitted to the observed ratings by SGD
+
+    Each epoch walks a shuffled order of the ratings in mini-batches. A batch
+    computes its errors at once and applies its updates with scatter-adds,
+    so a user or item that appears several times in a batch gets the sum of
+    its updates. A validation_fraction of the ratings is held out; training
+    stops once the validation RMSE has not improved for patience epochs, and
+    the best epoch's parameters are kept.
+    """
+
+    def __init__(self, n_factors=50, learning_rate=0.02, regularization=0.1, batch_size=1024,
+                 max_epochs=50, patience=3, validation_fraction=0.1, random_state=42):
+        self.n_factors = n_factors
+        self.learning_rate = learning_rate
+        self.regularization = regularization
+        self.batch_size = batch_size
+        self.max_epochs = max_epochs
+        self.patience = patience
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def fit(self, ratings):
+        """Fit to the stored ratings of a sparse users x items matrix"""
+        ratings = sp.coo_matrix(ratings)
+        users, items = ratings.row.astype(np.int64), ratings.col.astype(np.int64)
+        values = ratings.data.astype(np.float32)
+        n_users, n_items = ratings.shape
+        rng = np.random.default_rng(self.random_state)
+
+        held_out = rng.random(len(values)) < self.validation_fraction
+        train = np.flatnonzero(~held_out)
+
+        self.global_mean_ = float(values[train].mean()) if len(train) else 0.0
+        self.user_bias_ = np.zeros(n_users, dtype=np.float32)
+        self.item_bias_ = np.zeros(n_items, dtype=np.float32)
+        self.user_factors_ = rng.normal(0, 0.1, (n_users, self.n_factors)).astype(np.float32)
+        self.item_factors_ = rng.normal(0, 0.1, (n_items, self.n_factors)).astype(np.float32)
+
+        self.history_ = []
+        best_rmse, best_params, stale_epochs = np.inf, None, 0
+        start_time = time.time()
+        for epoch in range(self.max_epochs):
+            epoch_start = time.time()
+            order = rng.permutation(train)
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                self._sgd_step(users[batch], items[batch], values[batch])
+
+            validation_rmse = (self._rmse(users[held_out], items[held_out], values[held_out])
+                               if held_out.any() else None)
+            self.history_.append({
+                'epoch': epoch + 1,
+                'validation_rmse': validation_rmse,
+                'ratings_per_second': len(order) / max(time.time() - epoch_start, 1e-9)
+            })
+
+            if validation_rmse is None:
+                continue
+            if validation_rmse < best_rmse:
+                best_rmse, stale_epochs = validation_rmse, 0
+                best_params = [param.copy() for param in
+                               (self.user_bias_, self.item_bias_, self.user_factors_, self.item_factors_)]
+            else:
+                stale_epochs += 1
+                if stale_epochs >= self.patience:
+                    break
+
+        if best_params is not None:
+            self.user_bias_, self.item_bias_, self.user_factors_, self.item_factors_ = best_params
+        self.best_validation_rmse_ = best_rmse if best_params is not None else None
+        self.n_epochs_ = len(self.history_)
+        self.ratings_per_second_ = len(train) * self.n_epochs_ / max(time.time() - start_time, 1e-9)
+        return self
+
+    def _sgd_step(self, users, items, values):
+        """One mini-batch of SGD updates, applied with scatter-adds"""
+        user_factors, item_factors = self.user_factors_[users], self.item_factors_[items]
+        errors = values - self._predict(users, items, user_factors, item_factors)
+
+        rate, reg = self.learning_rate, self.regularization
+        scatter_add(self.user_bias_, users, rate * (errors - reg * self.user_bias_[users]))
+        scatter_add(self.item_bias_, items, rate * (errors - reg * self.item_bias_[items]))
+        scatter_add(self.user_factors_, users, rate * (errors[:, None] * item_factors - reg * user_factors))
+        scatter_add(self.item_factors_, items, rate * (errors[:, None] * user_factors - reg * item_factors))
+
+    def _predict(self, users, items, user_factors=None, item_factors=None):
+        if user_factors is None:
+            user_factors, item_factors = self.user_factors_[users], self.item_factors_[items]
+        return (self.global_mean_ + self.user_bias_[users] + self.item_bias_[items]
+                + np.einsum('ij,ij->i', user_factors, item_factors))
+
+    def _rmse(self, users, items, values):
+        return float(np.sqrt(np.mean((self._predict(users, items) - values) ** 2)))
+
+    def rmse(self, ratings):
+        """Root mean squared error on the stored ratings of a sparse users x items matrix"""
+        ratings = sp.coo_matrix(ratings)
+        return self._rmse(ratings.row, ratings.col, ratings.data)
+
+    def serving_factors(self):
+        """Get (user vectors, item vectors) whose dot products are the predicted ratings
+
+        Users become [p_u, 1, b_u, 1] and items [q_i, b_i, 1, mu] (the item
+        vectors are returned as columns, like components_), so the model is
+        served by the same code as the other factor models.
+        """
+        n_users, n_items = len(self.user_bias_), len(self.item_bias_)
+        user_vectors = np.column_stack([self.user_factors_, np.ones(n_users), self.user_bias_, np.ones(n_users)])
+        item_vectors = np.column_stack([self.item_factors_, self.item_bias_, np.ones(n_items),
+                                        np.full(n_items, self.global_mean_)])
+        return user_vectors.astype(np.float32), np.ascontiguousarray(item_vectors.T, dtype=np.float32)
+
+
+def fold_in_biased_user(item_vectors, user_vector, regularization=0.1):
+    """Fit a new user's serving vector against a biased MF model's item vectors
+
+    item_vectors are the columns from serving_factors. The user's factors
+    and bias are solved by ridge regression on their rated items, with the
+    global mean and item biases taken out of the ratings first.
+    """
+    item_vectors = np.asarray(item_vectors, dtype=np.float64)
+    user_vector = np.asarray(user_vector, dtype=np.float64)
+    n_factors = item_vectors.shape[0] - 3
+    rated = np.flatnonzero(user_vector)
+
+    # Columns [q_i, 1] against the ratings less mu and b_i
+    features = np.vstack([item_vectors[:n_factors, rated], np.ones(len(rated))]).T
+    targets = user_vector[rated] - item_vectors[n_factors, rated] - item_vectors[n_factors + 2, rated]
+    solved = np.linalg.solve(features.T @ features + regularization * max(len(rated), 1) * np.eye(n_factors + 1),
+                             features.T @ targets)
+    return np.concatenate([solved[:n_factors], [1.0, solved[n_factors], 1.0]])
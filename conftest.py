@@ -0,0 +1,73 @@
+"""
+Shared test fixtures
+"""
+import sys
+import os
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SECONDS_PER_YEAR = 365 * 86400
+
+# Size of the MovieLens-style data set the app is trained on in tests
+APP_USERS = 80
+APP_ITEMS = 60
+
+@pytest.fixture
+def random_ratings():
+    """Make a sparse users x items float32 matrix of 1-5 ratings with about density of the cells rated"""
+    def make(n_users=60, n_items=40, density=0.3, seed=0):
+        rng = np.random.default_rng(seed)
+        ratings = rng.integers(1, 6, size=(n_users, n_items)) * (rng.random((n_users, n_items)) < density)
+        return sp.csr_matrix(ratings, dtype=np.float32)
+    return make
+
+@pytest.fixture
+def random_rating_log():
+    """Make parallel (item id, rating, unix timestamp) arrays over item ids 1..n_items within a year"""
+    def make(n_ratings=500, n_items=30, seed=0):
+        rng = np.random.default_rng(seed)
+        return (rng.integers(1, n_items + 1, size=n_ratings), rng.integers(1, 6, size=n_ratings).astype(float),
+                rng.integers(0, SECONDS_PER_YEAR, size=n_ratings).astype(float))
+    return make
+
+@pytest.fixture(scope='session')
+def trained_app(tmp_path_factory):
+    """The app module serving models trained on a small generated MovieLens-style data set
+
+    Runs in a temporary directory with its own ratings database and model
+    artifacts. TMDB searches come back empty, so tests make no network calls.
+    """
+    workdir = tmp_path_factory.mktemp('app')
+    cwd = os.getcwd()
+    # The app and rating_db modules open a ratings database in the working directory on import
+    os.chdir(workdir)
+    import app
+    from rating_db import RatingDatabase
+
+    os.makedirs(workdir / 'ml-100k')
+    rng = np.random.default_rng(20)
+    ratings = rng.integers(1, 6, size=(APP_USERS, APP_ITEMS)) * (rng.random((APP_USERS, APP_ITEMS)) < 0.4)
+    ratings[np.arange(APP_USERS), np.arange(APP_USERS) % APP_ITEMS] = 4  # Every user and item has a rating
+    with open(workdir / 'ml-100k' / 'u.data', 'w') as f:
+        for user, item in zip(*np.nonzero(ratings)):
+            f.write(f"{user + 1}\t{item + 1}\t{ratings[user, item]}\t{880000000 + user * 1000 + item}\n")
+    with open(workdir / 'ml-100k' / 'u.item', 'w') as f:
+        for item in range(1, APP_ITEMS + 1):
+            genres = ['1' if (item + genre) % 4 == 0 else '0' for genre in range(19)]
+            f.write(f"{item}|Movie {item} ({1930 + item})|01-Jan-1995||http://example.com|{'|'.join(genres)}\n")
+
+    saved = (app.ARTIFACT_DIR, app.TOP_N_DIR, app.rating_db, app.tmdb_client.search_movie)
+    app.ARTIFACT_DIR = str(workdir / 'artifacts')
+    app.TOP_N_DIR = os.path.join(app.ARTIFACT_DIR, 'top_n')
+    app.rating_db = RatingDatabase(str(workdir / 'ratings.db'))
+    app.tmdb_client.search_movie = lambda *args, **kwargs: None
+    try:
+        app.load_and_train_model()
+        yield app
+    finally:
+        os.chdir(cwd)
+        app.ARTIFACT_DIR, app.TOP_N_DIR, app.rating_db, app.tmdb_client.search_movie = saved
@@ -0,0 +1,134 @@
+"""
+Versioned on-disk bundles of trained model arrays
+"""
+import hashlib
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import numpy as np
+import scipy.sparse as sp
+
+# Bump when the bundle layout changes so old bundles are ignored
+BUNDLE_FORMAT = 3
+
+SPARSE_PARTS = ('data', 'indices', 'indptr')
+
+
+def memory_usage():
+    """Get this process's memory use in kB from /proc/self/smaps_rollup
+
+    Rss counts shared pages in full for every process that maps them; Pss
+    splits them between those processes, so it is the better per-worker
+    figure. Returns the peak RSS from getrusage where /proc is not available.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+        return {name.lower(): int(fields[name].split()[0])
+                for name in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+                if name in fields}
+    except (OSError, ValueError):
+        return {'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def bundle_key(data_files, config, extra_data=b''):
+    """Hash the input data files, any extra training data and the training config into a bundle version key"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'format': BUNDLE_FORMAT, 'config': config}, sort_keys=True).encode('utf-8'))
+    digest.update(extra_data)
+    for path in data_files:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def latest_bundle_key(directory, data_key):
+    """Get the key of the newest bundle in directory whose meta has the given data_key, or None
+
+    data_key identifies the data files and config a bundle was built from,
+    leaving out the ratings saved since, so a bundle that only lacks the
+    latest ratings can still be found.
+    """
+    latest = None
+    if not os.path.isdir(directory):
+        return None
+    for key in os.listdir(directory):
+        meta_path = os.path.join(directory, key, 'meta.json')
+        if key.startswith('.') or not os.path.exists(meta_path):
+            continue
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('format') == BUNDLE_FORMAT and meta.get('data_key') == data_key and meta.get('key') == key:
+            if latest is None or meta['created_at'] > latest[0]:
+                latest = (meta['created_at'], key)
+    return latest[1] if latest is not None else None
+
+
+def save_bundle(directory, key, arrays, meta):
+    """Write a bundle to directory/key and return its path
+
+    Dense arrays are stored as .npy files and sparse matrices as their CSR
+    parts. Everything is written to a temporary directory that is renamed
+    into place, so readers never see a partial bundle. If another process
+    already wrote the same key, its bundle is kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key)
+    staging = tempfile.mkdtemp(prefix=f'.{key}-', dir=directory)
+    try:
+        dense, sparse = [], {}
+        for name, value in arrays.items():
+            if sp.issparse(value):
+                value = sp.csr_matrix(value)
+                for part in SPARSE_PARTS:
+                    np.save(os.path.join(staging, f'{name}.{part}.npy'), getattr(value, part), allow_pickle=False)
+                sparse[name] = list(value.shape)
+            else:
+                np.save(os.path.join(staging, f'{name}.npy'), np.asarray(value), allow_pickle=False)
+                dense.append(name)
+
+        bundle_meta = dict(meta, key=key, format=BUNDLE_FORMAT, created_at=time.time(), arrays=dense, sparse=sparse)
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(bundle_meta, f)
+
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            raise
+    return path
+
+
+def load_bundle(directory, key, mmap=True):
+    """Load the bundle for a key as (arrays, meta), or None if it is missing or from another format
+
+    With mmap the arrays are read-only memory maps of the .npy files, so
+    every process serving the same bundle shares one copy in the page cache.
+    """
+    path = os.path.join(directory, key)
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != BUNDLE_FORMAT or meta.get('key') != key:
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+              for name in meta['arrays']}
+    for name, shape in meta['sparse'].items():
+        data, indices, indptr = (np.load(os.path.join(path, f'{name}.{part}.npy'), mmap_mode=mmap_mode,
+                                         allow_pickle=False)
+                                 for part in SPARSE_PARTS)
+        arrays[name] = sp.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+    return arrays, meta
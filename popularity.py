@@ -0,0 +1,146 @@
+"""
+Item popularity from rating counts and damped averages, for cold start and top-rated lists
+"""
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+SECONDS_PER_DAY = 86400
+
+
+class PopularityModel:
+    """Per-item rating counts, means and Bayesian averages over a fixed catalog
+
+    The Bayesian average damps an item's mean towards the global mean as if
+    it had prior_count extra ratings at that mean, so items with a handful
+    of high ratings do not top the list. The recent variant does the same
+    with every rating's weight halved for each half_life_days of its age,
+    so newer ratings count for more.
+
+    Aggregates are built with np.bincount and kept up to date one rating at
+    a time; rankings are sorted once per change, so a top-N list is a slice.
+    """
+
+    KINDS = ('bayesian', 'recent', 'count', 'mean')
+
+    def __init__(self, item_ids, prior_count=10, half_life_days=90):
+        self.item_ids = np.asarray(item_ids)
+        self.item_index = {item_id: idx for idx, item_id in enumerate(self.item_ids.tolist())}
+        self.prior_count = prior_count
+        self.half_life_days = half_life_days
+        n_items = len(self.item_ids)
+        self.counts = np.zeros(n_items, dtype=np.int64)
+        self.sums = np.zeros(n_items)
+        self.weighted_counts = np.zeros(n_items)
+        self.weighted_sums = np.zeros(n_items)
+        # Recency weights are kept as 2^((timestamp - reference_time) / half-life), rebased as
+        # time moves on, and scored relative to the newest rating so that one weighs 1
+        self.reference_time = 0.0
+        self.latest_time = 0.0
+        self._rankings = {}
+        self._lock = threading.Lock()
+
+    def fit(self, item_ids, ratings, timestamps) -> 'PopularityModel':
+        """Aggregate parallel (item id, rating, unix timestamp) arrays; ratings of unknown items are skipped"""
+        item_ids = np.asarray(item_ids)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+
+        order = np.argsort(self.item_ids)
+        positions = np.clip(np.searchsorted(self.item_ids, item_ids, sorter=order), 0, max(len(order) - 1, 0))
+        known = (self.item_ids[order[positions]] == item_ids) if len(order) else np.zeros(len(item_ids), dtype=bool)
+        items = order[positions[known]]
+        ratings, timestamps = ratings[known], timestamps[known]
+
+        n_items = len(self.item_ids)
+        self.reference_time = self.latest_time = float(timestamps.max()) if len(timestamps) else 0.0
+        weights = self._weights(timestamps)
+        with self._lock:
+            # bincount gives int zeros rather than float ones when there are no ratings
+            self.counts = np.bincount(items, minlength=n_items)
+            self.sums = np.bincount(items, weights=ratings, minlength=n_items).astype(np.float64)
+            self.weighted_counts = np.bincount(items, weights=weights, minlength=n_items).astype(np.float64)
+            self.weighted_sums = np.bincount(items, weights=weights * ratings, minlength=n_items).astype(np.float64)
+            self._rankings = {}
+        return self
+
+    def _weights(self, timestamps):
+        return np.exp2((np.asarray(timestamps, dtype=np.float64) - self.reference_time)
+                       / (self.half_life_days * SECONDS_PER_DAY))
+
+    def add_rating(self, item_id, rating, timestamp, previous=None, previous_timestamp=None) -> bool:
+        """Count a new rating; returns False for unknown items
+
+        previous and previous_timestamp are the rating it replaces and when
+        that was made, if the user had rated the item before; without the
+        timestamp, the old rating is taken out at the new one's weight.
+        """
+        item_idx = self.item_index.get(item_id)
+        if item_idx is None:
+            return False
+
+        with self._lock:
+            # Keep the weights in range by moving the reference time forward when they grow large
+            if timestamp - self.reference_time > 64 * self.half_life_days * SECONDS_PER_DAY:
+                shrink = float(np.exp2((self.reference_time - timestamp) / (self.half_life_days * SECONDS_PER_DAY)))
+                self.weighted_counts *= shrink
+                self.weighted_sums *= shrink
+                self.reference_time = float(timestamp)
+            self.latest_time = max(self.latest_time, float(timestamp))
+            weight = float(self._weights(timestamp))
+
+            if previous is not None:
+                previous_weight = weight if previous_timestamp is None else float(self._weights(previous_timestamp))
+                self.counts[item_idx] -= 1
+                self.sums[item_idx] -= previous
+                self.weighted_counts[item_idx] -= previous_weight
+                self.weighted_sums[item_idx] -= previous_weight * previous
+            self.counts[item_idx] += 1
+            self.sums[item_idx] += rating
+            self.weighted_counts[item_idx] += weight
+            self.weighted_sums[item_idx] += weight * rating
+            self._rankings = {}
+        return True
+
+    def scores(self, kind='bayesian') -> np.ndarray:
+        """Get every item's score: 'bayesian', 'recent' (recency-weighted Bayesian), 'count' or 'mean'"""
+        if kind == 'count':
+            return self.counts.astype(np.float64)
+        if kind == 'mean':
+            return np.divide(self.sums, self.counts, out=np.zeros(len(self.sums)), where=self.counts > 0)
+        if kind == 'recent':
+            scale = float(np.exp2((self.reference_time - self.latest_time) / (self.half_life_days * SECONDS_PER_DAY)))
+            counts, sums = self.weighted_counts * scale, self.weighted_sums * scale
+        elif kind == 'bayesian':
+            counts, sums = self.counts, self.sums
+        else:
+            raise ValueError(f"Unknown popularity kind: {kind}")
+
+        total = counts.sum()
+        global_mean = sums.sum() / total if total > 0 else 0.0
+        return (self.prior_count * global_mean + sums) / (self.prior_count + counts)
+
+    def ranking(self, kind='bayesian') -> Tuple[np.ndarray, np.ndarray]:
+        """Get (rated item indexes, most popular first; every item's scores) for a kind, computed once per change"""
+        rankings = self._rankings
+        if kind not in rankings:
+            scores = self.scores(kind)
+            order = np.argsort(-scores, kind='stable')
+            rankings[kind] = (order[self.counts[order] > 0], scores)
+        return rankings[kind]
+
+    def top_items(self, n, kind='bayesian', exclude_ids=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Get (item ids, scores) of the n most popular items that have ratings, skipping exclude_ids"""
+        order, scores = self.ranking(kind)
+        if exclude_ids is not None and len(exclude_ids):
+            order = order[~np.isin(self.item_ids[order], np.asarray(exclude_ids))]
+        top = order[:n]
+        return self.item_ids[top], scores[top]
+
+    def item_stats(self, item_id) -> Optional[Tuple[float, int]]:
+        """Get an item's (mean rating, rating count), or None for unknown items"""
+        item_idx = self.item_index.get(item_id)
+        if item_idx is None:
+            return None
+        count = int(self.counts[item_idx])
+        return (float(self.sums[item_idx] / count) if count else 0.0), count
@@ -0,0 +1,28 @@
+"""
+Offline job that precomputes every user's top-N recommendations for every model
+
+Loads (or trains) the model bundle for the current data and config, scores
+all training users in blocks across a process pool, and writes the top-N
+store that app.py serves from with RECOMMENDATION_SERVING_MODE=precomputed.
+The store is tied to the bundle version, so run the job again after every
+retrain. An existing store for the bundle is kept; delete it from
+artifacts/top_n to rebuild it with another N.
+"""
+import argparse
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute top-N recommendations for every user and model')
+    parser.add_argument('--n', type=int, default=app.TOP_N_SIZE, help='Recommendations stored per user and model')
+    parser.add_argument('--processes', type=int, default=app.TOP_N_PROCESSES,
+                        help='Worker processes that score blocks of users')
+    args = parser.parse_args()
+
+    app.load_and_train_model()
+    path = app.build_top_n_store(args.n, args.processes)
+    print(f"Top-N store written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Int8 quantization of factor vectors for reduced-precision serving
+"""
+import numpy as np
+from recommender_engine import top_k
+
+# Quantized rows widened to float32 at a time when scoring
+SCORE_BLOCK_ROWS = 2048
+
+
+def quantize_rows(vectors):
+    """Quantize each row of a matrix to int8 with its own scale; returns (codes, scales)
+
+    A row's scale maps its largest absolute value to 127, so codes * scales
+    (row-wise) recovers the row to within half a scale step per entry.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127 if vectors.shape[1] else np.zeros(len(vectors), dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_rows(codes, scales):
+    """Rebuild float32 rows from quantize_rows output"""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def quantized_scores(codes, scales, queries, block_rows=SCORE_BLOCK_ROWS):
+    """Dot products of one query vector, or a block of them, with every quantized row
+
+    int8 codes save memory, not time: BLAS has no int8 x float32 product, so
+    rows are widened to float32 block_rows at a time in one reused buffer.
+    That keeps a float copy of the whole matrix out of memory, but scoring
+    costs a little more than with float32 rows.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    scores = np.empty(queries.shape[:-1] + (len(codes),), dtype=np.float32)
+    buffer = np.empty((min(block_rows, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), block_rows):
+        block = buffer[:min(block_rows, len(codes) - start)]
+        block[:] = codes[start:start + len(block)]
+        scores[..., start:start + len(block)] = queries @ block.T
+    scores *= scales
+    return scores
+
+
+def precision_report(user_factors, item_factors, k=10):
+    """Compare float32 and int8 item factors against float64 scoring for a set of users
+
+    item_factors are item rows. For each precision, gives the RMSE of its
+    scores against the float64 scores and the mean overlap of each user's
+    top k items with the float64 top k.
+    """
+    user_factors = np.asarray(user_factors, dtype=np.float64)
+    item_factors = np.asarray(item_factors, dtype=np.float64)
+    reference = user_factors @ item_factors.T
+
+    codes, scales = quantize_rows(item_factors)
+    candidates = {
+        'float32': user_factors.astype(np.float32) @ item_factors.T.astype(np.float32),
+        'int8': quantized_scores(codes, scales, user_factors)
+    }
+
+    report = {'k': k, 'n_users': len(user_factors)}
+    for precision, scores in candidates.items():
+        overlaps = [len(np.intersect1d(top_k(expected, k)[0], top_k(actual, k)[0])) / max(min(k, len(expected)), 1)
+                    for expected, actual in zip(reference, scores)]
+        report[precision] = {
+            'rmse': float(np.sqrt(np.mean((scores - reference) ** 2))) if reference.size else 0.0,
+            'top_k_overlap': float(np.mean(overlaps)) if overlaps else 0.0
+        }
+    return report
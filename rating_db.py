@@ -101,6 +101,21 @@ class RatingDatabase:
             print(f"Error getting user ratings: {e}")
             return []
     
+    def get_all_ratings(self) -> List[Tuple[int, int, float, str]]:
+        """Get every (user_id, movie_id, rating, timestamp) row, oldest first"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT user_id, movie_id, rating, timestamp
+                    FROM user_ratings
+                    ORDER BY timestamp, id
+                """)
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Error getting all ratings: {e}")
+            return []
+    
     def get_movie_rating(self, user_id: int, movie_id: int) -> Optional[float]:
         """Get a specific user's rating for a movie"""
         try:
@@ -136,6 +151,22 @@ class RatingDatabase:
             print(f"Error getting average rating: {e}")
             return 0.0, 0
     
+    def get_average_ratings(self) -> Dict[int, Tuple[float, int]]:
+        """Get the average rating and count of every rated movie in one query"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT movie_id, AVG(rating), COUNT(*)
+                    FROM user_ratings
+                    GROUP BY movie_id
+                """)
+                
+                return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        except Exception as e:
+            print(f"Error getting average ratings: {e}")
+            return {}
+    
     def cache_movie_metadata(self, movie_id: int, metadata: Dict) -> bool:
         """Cache movie metadata from TMDB"""
         try:
@@ -0,0 +1,280 @@
+"""
+Compact sparse ratings store with id <-> index maps
+"""
+import threading
+import numpy as np
+import scipy.sparse as sp
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_user_id(user_id):
+    """Get a user id as an int if it is one, like u.data's, or else as a string, like a Firebase uid"""
+    if isinstance(user_id, (int, np.integer)):
+        return int(user_id)
+    text = str(user_id)
+    return int(text) if text.isdigit() else text
+
+
+def unique_ids(ids):
+    """Get (sorted unique ids, each id's position in them); integer ids sort before string ids"""
+    ids = np.asarray(ids)
+    if ids.dtype != object:
+        return np.unique(ids, return_inverse=True)
+    unique = sorted(set(ids.tolist()), key=lambda value: (isinstance(value, str), value))
+    positions = {value: position for position, value in enumerate(unique)}
+    return (np.array(unique, dtype=object),
+            np.fromiter((positions[value] for value in ids.tolist()), dtype=np.int64, count=len(ids)))
+
+
+def overlay_ratings(matrix, rows, cols, values):
+    """Get a CSR copy of a matrix with the given entries set, replacing any already stored"""
+    matrix = matrix.tocoo()
+    n_cols = matrix.shape[1]
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    keep = ~np.isin(matrix.row.astype(np.int64) * n_cols + matrix.col, rows * n_cols + cols)
+    merged = sp.csr_matrix((np.concatenate([matrix.data[keep], np.asarray(values, dtype=np.float32)]),
+                            (np.concatenate([matrix.row[keep], rows]), np.concatenate([matrix.col[keep], cols]))),
+                           shape=matrix.shape, dtype=np.float32)
+    merged.sort_indices()
+    return merged
+
+
+class RatingsStore:
+    """User x item ratings held as a float32 CSR matrix plus id <-> row/column maps
+
+    New ratings go into an overlay of {row: {column: rating}} that every
+    read merges with the base matrix, so adding one is O(1). Once the overlay
+    holds compact_fraction of the base's ratings (at least min_compact) it is
+    folded into a new base matrix, keeping the amortized cost constant.
+    """
+
+    compact_fraction = 0.01
+    min_compact = 1000
+
+    def __init__(self, matrix, user_ids, item_ids):
+        matrix = sp.csr_matrix(matrix, dtype=np.float32)
+        matrix.sort_indices()
+        # The base matrix and its overlay are replaced together so reads always see a matching pair
+        self._state = (matrix, {})
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids)
+        self.user_index: Dict = {user_id: idx for idx, user_id in enumerate(self.user_ids.tolist())}
+        self.item_index: Dict = {item_id: idx for idx, item_id in enumerate(self.item_ids.tolist())}
+        self._csc = None
+
+    @classmethod
+    def from_ratings(cls, user_ids, item_ids, ratings) -> 'RatingsStore':
+        """Build a store from parallel (user, item, rating) arrays
+
+        Rows and columns follow the sorted unique ids, matching the layout of the
+        old pivot tables. Duplicate (user, item) pairs keep the last rating.
+        User ids may mix integers with strings such as Firebase uids.
+        """
+        unique_users, rows = unique_ids(user_ids)
+        unique_items, cols = np.unique(np.asarray(item_ids), return_inverse=True)
+        values = np.asarray(ratings, dtype=np.float32)
+
+        keys = rows.astype(np.int64) * len(unique_items) + cols
+        _, last_from_end = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last_from_end
+
+        matrix = sp.csr_matrix((values[keep], (rows[keep], cols[keep])),
+                               shape=(len(unique_users), len(unique_items)), dtype=np.float32)
+        return cls(matrix, unique_users, unique_items)
+
+    @classmethod
+    def from_frame(cls, frame) -> 'RatingsStore':
+        """Build a store from a MovieLens-style DataFrame (user_id, item_id, rating)"""
+        return cls.from_ratings(frame['user_id'].values, frame['item_id'].values, frame['rating'].values)
+
+    def to_arrays(self) -> Dict:
+        """Get the store's matrix, pending ratings included, and id arrays for saving
+
+        User ids that mix integers and strings are saved as text, which
+        from_arrays parses back.
+        """
+        self.compact()
+        user_ids = self.user_ids.astype(str) if self.user_ids.dtype == object else self.user_ids
+        return {'matrix': self.matrix, 'user_ids': user_ids, 'item_ids': self.item_ids}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'RatingsStore':
+        """Rebuild a store from arrays saved with to_arrays"""
+        user_ids = arrays['user_ids']
+        if user_ids.dtype.kind == 'U':
+            user_ids = np.array([parse_user_id(user_id) for user_id in user_ids.tolist()], dtype=object)
+        return cls(arrays['matrix'], user_ids, arrays['item_ids'])
+
+    @property
+    def matrix(self):
+        """Base CSR matrix without the pending ratings (rows() gives merged rows)"""
+        return self._state[0]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape
+
+    @property
+    def n_users(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def n_items(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nnz(self) -> int:
+        return self.matrix.nnz
+
+    @property
+    def n_pending(self) -> int:
+        """Number of ratings added since the last compaction"""
+        return self._pending
+
+    @property
+    def csc(self):
+        """Column-major copy of the base ratings, built on first use"""
+        return self._base_csc(self.matrix)
+
+    def _base_csc(self, matrix):
+        cached = self._csc
+        if cached is None or cached[0] is not matrix:
+            cached = self._csc = (matrix, matrix.tocsc())
+        return cached[1]
+
+    def has_user(self, user_id) -> bool:
+        return user_id in self.user_index
+
+    def has_item(self, item_id) -> bool:
+        return item_id in self.item_index
+
+    def user_row(self, user_id) -> Optional[int]:
+        """Get the matrix row for a user id, or None if unknown"""
+        return self.user_index.get(user_id)
+
+    def item_col(self, item_id) -> Optional[int]:
+        """Get the matrix column for an item id, or None if unknown"""
+        return self.item_index.get(item_id)
+
+    def add_rating(self, user_id, item_id, rating) -> bool:
+        """Set a user's rating for an item in the overlay; returns False for unknown users or items"""
+        user_idx = self.user_index.get(user_id)
+        item_idx = self.item_index.get(item_id)
+        if user_idx is None or item_idx is None:
+            return False
+
+        with self._lock:
+            overlay = self._state[1]
+            # Row dicts are replaced, never changed in place, so readers don't see one mid-update
+            row = dict(overlay.get(user_idx, {}))
+            row[item_idx] = float(rating)
+            overlay[user_idx] = row
+            self._pending += 1
+            due = self._pending >= max(self.min_compact, int(self.compact_fraction * self.matrix.nnz))
+
+        if due:
+            self.compact()
+        return True
+
+    def pending_ratings(self) -> List[Tuple]:
+        """Get the overlay as (user_id, item_id, rating) tuples"""
+        overlay = dict(self._state[1])
+        user_ids = self.user_ids.tolist()
+        return [(user_ids[user_idx], self.item_ids[item_idx].item(), rating)
+                for user_idx, row in overlay.items() for item_idx, rating in row.items()]
+
+    def compact(self):
+        """Fold the overlay into a new base matrix"""
+        with self._lock:
+            matrix, overlay = self._state
+            if not overlay:
+                return
+            rows, cols, values = zip(*[(user_idx, item_idx, rating) for user_idx, row in overlay.items()
+                                       for item_idx, rating in row.items()])
+            self._state = (overlay_ratings(matrix, rows, cols, values), {})
+            self._pending = 0
+
+    def rows(self, user_rows):
+        """Get the ratings of a block of users as a CSR matrix, pending ratings included"""
+        matrix, overlay = self._state
+        user_rows = np.asarray(user_rows)
+        block = matrix[user_rows]
+        if not overlay:
+            return block
+
+        entries = [(i, item_idx, rating) for i, user_idx in enumerate(user_rows.tolist())
+                   for item_idx, rating in overlay.get(user_idx, {}).items()]
+        if not entries:
+            return block
+        return overlay_ratings(block, *zip(*entries))
+
+    def user_ratings(self, user_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get (column indexes, ratings) of the items a user has rated"""
+        matrix, overlay = self._state
+        start, end = matrix.indptr[user_idx], matrix.indptr[user_idx + 1]
+        cols, values = matrix.indices[start:end], matrix.data[start:end]
+
+        row = overlay.get(user_idx)
+        if row:
+            cols, values = self._merge(cols, values, row)
+        return cols, values
+
+    def user_vector(self, user_idx: int) -> np.ndarray:
+        """Get a user's ratings as a dense vector over all items (0 = unrated)"""
+        vector = np.zeros(self.n_items, dtype=np.float32)
+        cols, values = self.user_ratings(user_idx)
+        vector[cols] = values
+        return vector
+
+    def seen_mask(self, user_idx: int) -> np.ndarray:
+        """Get a boolean mask over all items of the ones a user has rated"""
+        mask = np.zeros(self.n_items, dtype=bool)
+        mask[self.user_ratings(user_idx)[0]] = True
+        return mask
+
+    def seen_mask_rows(self, user_rows) -> np.ndarray:
+        """Get a users x items boolean mask of rated items for a block of users"""
+        block = self.rows(user_rows)
+        mask = np.zeros(block.shape, dtype=bool)
+        mask[np.repeat(np.arange(block.shape[0]), np.diff(block.indptr)), block.indices] = True
+        return mask
+
+    def user_products(self, vectors) -> np.ndarray:
+        """Get every user's ratings dotted with a vector over all items, pending ratings included
+
+        vectors may also be an items x m array, giving users x m products.
+        """
+        matrix, overlay = self._state
+        vectors = np.asarray(vectors, dtype=np.float32)
+        products = matrix @ vectors
+        if overlay:
+            changed = np.fromiter(list(overlay.keys()), dtype=np.int64)
+            products[changed] = self.rows(changed) @ vectors
+        return products
+
+    def item_ratings(self, item_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get (row indexes, ratings) of the users who rated an item"""
+        matrix, overlay = self._state
+        csc = self._base_csc(matrix)
+        start, end = csc.indptr[item_idx], csc.indptr[item_idx + 1]
+        rows, values = csc.indices[start:end], csc.data[start:end]
+
+        changed = {user_idx: row[item_idx] for user_idx, row in list(overlay.items()) if item_idx in row}
+        if changed:
+            rows, values = self._merge(rows, values, changed)
+        return rows, values
+
+    @staticmethod
+    def _merge(indices, values, updates):
+        """Merge {index: rating} updates into sorted (indices, values) arrays"""
+        new_indices = np.fromiter(updates.keys(), dtype=indices.dtype, count=len(updates))
+        new_values = np.fromiter(updates.values(), dtype=np.float32, count=len(updates))
+        keep = ~np.isin(indices, new_indices)
+        indices = np.concatenate([indices[keep], new_indices])
+        values = np.concatenate([values[keep], new_values])
+        order = np.argsort(indices, kind='stable')
+        return indices[order], values[order]
@@ -0,0 +1,307 @@
+"""
+Vectorized scoring engine for the recommendation models
+Every scorer returns one score per item; items a model cannot score are -inf
+"""
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import nnls
+from sklearn.preprocessing import normalize
+
+
+def top_neighbors(similarity, first_row=0, n_neighbors=20, min_similarity=0.1):
+    """Get (rows, columns, similarities) of the top-k entries above the threshold in each row of a block
+
+    The block holds rows first_row onwards of an items x items similarity
+    matrix; each row's own item is never its neighbor.
+    """
+    similarity = np.array(similarity, dtype=np.float32)
+    n_rows, n_items = similarity.shape
+    block_rows = np.arange(n_rows)
+    similarity[block_rows, first_row + block_rows] = -np.inf
+
+    k = min(n_neighbors, n_items - 1)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(similarity, top, axis=1)
+    keep = values > min_similarity
+    return np.repeat(first_row + block_rows, k)[keep.ravel()], top[keep], values[keep]
+
+
+def build_item_neighbors(similarity, n_neighbors=20, min_similarity=0.1):
+    """Keep each item's top-k most similar other items (above the threshold) as a sparse matrix
+
+    Row i of the result holds the similarities of item i's neighbors, so
+    neighbors @ ratings aggregates a user's ratings over every item's
+    neighborhood at once.
+    """
+    n_items = similarity.shape[0]
+    rows, cols, values = top_neighbors(similarity, 0, n_neighbors, min_similarity)
+    return sp.csr_matrix((values, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+
+
+def build_item_neighbors_blocked(ratings, n_neighbors=20, min_similarity=0.1, min_support=1, shrinkage=0.0,
+                                 block_size=256, n_threads=1):
+    """Build build_item_neighbors' sparse matrix from a users x items ratings matrix, a block of items at a time
+
+    Cosine similarities are computed for block_size items against the whole
+    catalog and cut down to their top k at once, so only a block x items
+    dense array per thread is ever held, never the items x items matrix.
+    Pairs of items rated by fewer than min_support common users are not
+    neighbors, and with shrinkage s a similarity from n common users is
+    scaled by n / (n + s), so neighbors resting on few users count for less.
+    Blocks are spread over n_threads threads; the result does not depend on it.
+    """
+    # Unit-length item rows in the ratings' precision, as cosine_similarity computes them
+    items = normalize(sp.csr_matrix(ratings).T.tocsr())
+    items_by_user = items.T.tocsr()
+    n_items = items.shape[0]
+    if min_support > 1 or shrinkage > 0:
+        rated = (items != 0).astype(np.float32)
+        rated_by_user = rated.T.tocsr()
+
+    def neighbors_of_block(start):
+        similarity = (items[start:start + block_size] @ items_by_user).toarray()
+        if min_support > 1 or shrinkage > 0:
+            support = (rated[start:start + block_size] @ rated_by_user).toarray()
+            if shrinkage > 0:
+                similarity *= support / (support + shrinkage)
+            similarity[support < min_support] = -np.inf
+        return top_neighbors(similarity, start, n_neighbors, min_similarity)
+
+    starts = range(0, n_items, block_size)
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            blocks = list(executor.map(neighbors_of_block, starts))
+    else:
+        blocks = [neighbors_of_block(start) for start in starts]
+
+    rows, cols, values = (np.concatenate(parts) for parts in zip(*blocks)) if blocks else ([], [], [])
+    return sp.csr_matrix((values, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+
+
+def similar_items(neighbors, item_idx, n=10):
+    """Get (item indexes, similarities) of an item's n most similar neighbors, most similar first"""
+    start, end = neighbors.indptr[item_idx], neighbors.indptr[item_idx + 1]
+    indices, values = neighbors.indices[start:end], neighbors.data[start:end]
+    order = np.argsort(-values, kind='stable')[:n]
+    return indices[order], values[order]
+
+
+def item_knn_scores(neighbors, user_vector):
+    """Score every item as the similarity-weighted average of the user's ratings on its neighbors
+
+    user_vector holds the user's rating for every item (0 = unrated). Both
+    the weighted rating sum and the similarity mass come out of a single
+    sparse product.
+    """
+    user_vector = np.asarray(user_vector, dtype=np.float32)
+    stacked = np.column_stack([user_vector, (user_vector > 0).astype(np.float32)])
+    numerator, denominator = (neighbors @ stacked).T
+
+    scores = np.full(len(user_vector), -np.inf, dtype=np.float32)
+    scored = denominator > 0
+    scores[scored] = numerator[scored] / denominator[scored]
+    return scores
+
+
+def item_knn_scores_block(neighbors, ratings_block):
+    """Item-KNN scores for a block of users at once (users x items)
+
+    ratings_block is a sparse users x items slice of the ratings matrix.
+    """
+    ratings_block = sp.csr_matrix(ratings_block, dtype=np.float32)
+    rated_block = ratings_block.copy()
+    rated_block.data = np.ones_like(rated_block.data)
+
+    numerator = (ratings_block @ neighbors.T).toarray()
+    denominator = (rated_block @ neighbors.T).toarray()
+
+    scores = np.full(numerator.shape, -np.inf, dtype=np.float32)
+    scored = denominator > 0
+    scores[scored] = numerator[scored] / denominator[scored]
+    return scores
+
+
+def user_neighbors_for_vector(ratings_matrix, user_vector, n_neighbors=20):
+    """Find the training users most similar to a rating vector as (indices, similarities)
+
+    Uses the same cosine similarity as the precomputed neighbor lists, in
+    descending order, so a user who is not in the matrix can be scored with
+    user_knn_scores.
+    """
+    user_vector = np.asarray(user_vector, dtype=np.float32)
+    row_norms = np.sqrt(np.asarray(ratings_matrix.multiply(ratings_matrix).sum(axis=1)).ravel())
+    norms = row_norms * np.linalg.norm(user_vector)
+    similarities = np.divide(ratings_matrix @ user_vector, norms, out=np.zeros(len(norms)), where=norms > 0)
+
+    k = min(n_neighbors, len(similarities))
+    top = np.argpartition(-similarities, k - 1)[:k]
+    top = top[np.argsort(-similarities[top], kind='stable')]
+    return top, similarities[top]
+
+
+def user_knn_scores(neighbor_ratings, neighbor_similarities, min_similarity=0.1, max_raters=10):
+    """Score every item as the similarity-weighted average rating of the user's neighbors
+
+    neighbor_ratings holds the neighbors' rating rows (sparse or dense) in
+    the order of neighbor_similarities. Only neighbors above min_similarity
+    count, and for each item only the max_raters most similar neighbors who
+    rated it contribute; all items are scored together.
+    """
+    keep = np.asarray(neighbor_similarities) > min_similarity
+    similarities = np.asarray(neighbor_similarities)[keep]
+    neighbor_ratings = neighbor_ratings[np.flatnonzero(keep)]
+    if sp.issparse(neighbor_ratings):
+        neighbor_ratings = neighbor_ratings.toarray()
+
+    # Neighbors are in descending similarity, so the first max_raters raters
+    # of each item are its most similar ones
+    rated = neighbor_ratings > 0
+    used = rated & (np.cumsum(rated, axis=0) <= max_raters)
+    weights = used * similarities[:, None]
+
+    numerator = (weights * neighbor_ratings).sum(axis=0)
+    denominator = weights.sum(axis=0)
+
+    scores = np.full(neighbor_ratings.shape[1], -np.inf, dtype=np.float32)
+    scored = denominator > 0
+    scores[scored] = numerator[scored] / denominator[scored]
+    return scores
+
+
+def align_item_features(features, feature_item_ids, item_index, n_items):
+    """Place feature rows on the ratings item axis and L2-normalize them
+
+    Items without features get an all-zero row; the returned mask marks the
+    ones that have features.
+    """
+    rows = np.array([item_index[item_id] for item_id in feature_item_ids], dtype=np.int64)
+    placement = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, np.arange(len(rows)))),
+                              shape=(n_items, len(rows)))
+    aligned = normalize(placement @ sp.csr_matrix(features, dtype=np.float32), norm='l2', axis=1)
+
+    has_features = np.zeros(n_items, dtype=bool)
+    has_features[rows] = True
+    return aligned.tocsr(), has_features
+
+
+def fold_in_user(item_factors, user_vector, nonnegative=False):
+    """Project a new user's ratings onto a factor model's item factors by least squares
+
+    Solves min ||r - u V|| for the user's zero-filled rating vector r, the
+    same fit the factor models make for their training users, so the folded
+    user scores like a trained one without a retrain. NMF users are solved
+    with non-negative least squares.
+    """
+    item_factors = np.asarray(item_factors, dtype=np.float64)
+    user_vector = np.asarray(user_vector, dtype=np.float64)
+    if nonnegative:
+        return nnls(item_factors.T, user_vector)[0]
+    return np.linalg.lstsq(item_factors.T, user_vector, rcond=None)[0]
+
+
+def content_profile(item_features, user_vector):
+    """Rating-weighted sum of the feature rows of the items a user rated"""
+    return np.asarray(item_features.T @ np.asarray(user_vector, dtype=np.float32)).ravel()
+
+
+def content_scores(item_features, user_vector, has_features=None):
+    """Score every item by cosine similarity between its features and the user's profile
+
+    Feature rows are unit length, so the cosine for all items is a single
+    sparse product with the normalized profile.
+    """
+    profile = content_profile(item_features, user_vector)
+    norm = np.linalg.norm(profile)
+    if norm > 0:
+        scores = np.asarray(item_features @ (profile / norm), dtype=np.float32).ravel()
+    else:
+        scores = np.zeros(item_features.shape[0], dtype=np.float32)
+
+    if has_features is not None:
+        scores[~has_features] = -np.inf
+    return scores
+
+
+def standardize_scores(scores, candidates):
+    """Z-score a model's scores over the candidate items it can score; all other items get 0
+
+    Works on one score vector or on a users x items block (row by row).
+    """
+    scored = candidates & np.isfinite(scores)
+    counts = np.maximum(scored.sum(axis=-1, keepdims=True), 1)
+    mean = np.where(scored, scores, 0).sum(axis=-1, keepdims=True) / counts
+    deviations = np.where(scored, scores - mean, 0)
+    spread = np.sqrt((deviations ** 2).sum(axis=-1, keepdims=True) / counts)
+    return np.where(scored & (spread > 0), deviations / np.where(spread > 0, spread, 1), 0).astype(np.float32)
+
+
+def combine_scores(model_scores, weights, candidates):
+    """Blend full-catalog score vectors from several models into one ensemble score per item
+
+    Each model's vector is standardized over the candidates so models on
+    different scales are comparable; items a model cannot score count as
+    that model's average. Non-candidate items come out as -inf. Accepts
+    single-user vectors or users x items blocks.
+    """
+    combined = np.zeros(candidates.shape, dtype=np.float32)
+    total_weight = sum(weights[name] for name in model_scores)
+    for name, scores in model_scores.items():
+        combined += weights[name] * standardize_scores(scores, candidates)
+    if total_weight > 0:
+        combined /= total_weight
+    combined[~candidates] = -np.inf
+    return combined
+
+
+def content_scores_block(item_features, ratings_block, has_features=None):
+    """Content scores for a block of users at once (users x items)"""
+    profiles = np.asarray((sp.csr_matrix(ratings_block, dtype=np.float32) @ item_features).todense())
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    profiles = np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+    scores = np.asarray(item_features @ profiles.T, dtype=np.float32).T
+
+    if has_features is not None:
+        scores[:, ~has_features] = -np.inf
+    return scores
+
+
+def top_k(scores, k, seen_mask=None, exclude=None):
+    """Get the k best (indices, scores) of a score vector in descending order
+
+    Items in seen_mask (boolean, one per item) or in exclude (item indexes)
+    are skipped, as are items the model cannot score (-inf). A partition
+    finds the k-th best score so only the items at or above it are sorted;
+    ties are broken by the lower index.
+    """
+    scores = np.asarray(scores)
+    if seen_mask is not None or (exclude is not None and len(exclude)):
+        scores = scores.copy()
+        if seen_mask is not None:
+            scores[seen_mask] = -np.inf
+        if exclude is not None and len(exclude):
+            scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), scores[:0]
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero((scores >= threshold) & np.isfinite(scores))
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    top = candidates[order]
+    return top, scores[top]
+
+
+def top_k_per_row(scores, k, seen_mask=None, exclude=None):
+    """Get each row's k best (indices, scores) for a users x items block
+
+    seen_mask is a users x items boolean block; exclude is an optional list
+    with one array of item indexes per row.
+    """
+    return [top_k(row, k,
+                  seen_mask[i] if seen_mask is not None else None,
+                  exclude[i] if exclude is not None else None)
+            for i, row in enumerate(scores)]
@@ -0,0 +1,52 @@
+"""
+Tests for the ALS trainer
+"""
+import sys
+import os
+import numpy as np
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from als_trainer import AlternatingLeastSquares, solve_factors
+
+def test_solve_factors_match_per_row_solve(random_ratings):
+    """Blocked, threaded solves equal a direct ridge solve over each row's rated items"""
+    dense = random_ratings().toarray()
+    dense[3] = 0  # A row with no ratings
+    ratings = sp.csr_matrix(dense)
+    factors = np.random.default_rng(1).normal(size=(40, 5)).astype(np.float32)
+
+    solved = solve_factors(ratings, factors, 0.1, n_threads=3, block_size=7)
+
+    for row in range(ratings.shape[0]):
+        cols = ratings[row].indices
+        rated = factors[cols].astype(np.float64)
+        expected = np.linalg.solve(rated.T @ rated + 0.1 * max(len(cols), 1) * np.eye(5),
+                                   rated.T @ ratings[row].data)
+        assert np.allclose(solved[row], expected, atol=1e-4)
+    assert not solved[3].any()
+
+def test_fit_ignores_missing_ratings():
+    """A low-rank matrix is recovered from its observed cells; zeros are not fitted"""
+    rng = np.random.default_rng(2)
+    full = 1 + 4 * (rng.random((80, 3)) @ rng.random((3, 50))) / 3
+    observed = rng.random(full.shape) < 0.5
+    ratings = sp.csr_matrix(full * observed, dtype=np.float32)
+
+    model = AlternatingLeastSquares(n_factors=3, n_iter=30, regularization=0.001, n_threads=2).fit(ratings)
+    predicted = model.user_factors_ @ model.components_
+
+    assert model.rmse(ratings) < 0.05
+    assert np.sqrt(np.mean((predicted - full)[~observed] ** 2)) < 0.1
+    assert model.components_.shape == (3, 50)
+
+def test_transform_matches_fit_and_threads(random_ratings):
+    """transform reproduces the fitted user factors, whatever the thread count"""
+    ratings = random_ratings(seed=3)
+    one = AlternatingLeastSquares(n_factors=4, n_iter=5, n_threads=1).fit(ratings)
+    many = AlternatingLeastSquares(n_factors=4, n_iter=5, n_threads=4).fit(ratings)
+
+    assert np.array_equal(one.user_factors_, many.user_factors_)
+    assert np.allclose(one.transform(ratings[:5]), one.user_factors_[:5], atol=1e-5)
@@ -0,0 +1,79 @@
+"""
+Tests for the approximate inner product index
+"""
+import sys
+import os
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ann_index import InnerProductIndex, exact_search, measure_recall
+from quantization import quantize_rows, dequantize_rows
+
+def clustered_vectors(n_items=600, n_dims=8, seed=0):
+    """Item vectors drawn around a few directions with varying norms"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(12, n_dims))
+    vectors = centers[rng.integers(0, 12, n_items)] + 0.2 * rng.normal(size=(n_items, n_dims))
+    return vectors * rng.uniform(0.5, 2.0, size=(n_items, 1))
+
+def test_lists_partition_the_catalog():
+    """Every item lands in exactly one list"""
+    index = InnerProductIndex(clustered_vectors(), n_lists=10)
+
+    assert index.list_offsets[-1] == 600
+    assert sorted(index.list_items.tolist()) == list(range(600))
+
+def test_probing_every_list_is_exact():
+    """Scanning all lists returns the exact top k, skipping seen and excluded items"""
+    vectors = clustered_vectors(seed=1)
+    index = InnerProductIndex(vectors, n_lists=10)
+    query = np.random.default_rng(2).normal(size=8)
+    seen = np.zeros(600, dtype=bool)
+    seen[exact_search(vectors, query, 3)[0]] = True
+    exclude = exact_search(vectors, query, 5)[0][3:]
+
+    items, scores = index.search(query, 10, seen_mask=seen, exclude=exclude, n_probe=10)
+
+    expected = exact_search(vectors, query, 15)[0][5:]
+    assert items.tolist() == expected.tolist()
+    assert np.allclose(scores, vectors[expected] @ query, atol=1e-4)
+
+def test_recall_on_clustered_data():
+    """A few probes find most of the true top k while scanning a fraction of the catalog"""
+    vectors = clustered_vectors(seed=3)
+    index = InnerProductIndex(vectors, n_lists=24, n_probe=6)
+    queries = np.random.default_rng(4).normal(size=(50, 8))
+
+    report = measure_recall(index, queries, k=10)
+
+    assert report['recall_at_k'] > 0.8
+    assert report['fraction_scanned'] < 0.5
+
+def test_loaded_index_searches_int8_vectors():
+    """An index loaded with int8 vectors and scales scores items like the dequantized vectors"""
+    vectors = clustered_vectors(seed=5)
+    codes, scales = quantize_rows(vectors)
+    index = InnerProductIndex.from_arrays(dict(InnerProductIndex(vectors, n_lists=10).to_arrays(),
+                                               item_vectors=codes, item_scales=scales))
+    query = np.random.default_rng(6).normal(size=8)
+
+    items, scores = index.search(query, 10, n_probe=10)
+
+    expected_items, expected_scores = exact_search(dequantize_rows(codes, scales), query, 10)
+    assert items.tolist() == expected_items.tolist()
+    assert np.allclose(scores, expected_scores, atol=1e-4)
+
+def test_recall_skips_seen_items():
+    """Recall compares both searches over each query's unseen items"""
+    vectors = clustered_vectors(seed=7)
+    index = InnerProductIndex(vectors, n_lists=10)
+    queries = np.random.default_rng(8).normal(size=(20, 8))
+    seen_masks = np.zeros((20, 600), dtype=bool)
+    for row, query in enumerate(queries):
+        seen_masks[row, exact_search(vectors, query, 5)[0]] = True
+
+    report = measure_recall(index, queries, k=10, n_probe=10, seen_masks=seen_masks)
+
+    assert report['recall_at_k'] == 1.0
@@ -0,0 +1,61 @@
+"""
+Tests for the biased matrix factorization trainer
+"""
+import sys
+import os
+import numpy as np
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from biased_mf import BiasedMatrixFactorization, scatter_add, fold_in_biased_user
+
+def biased_ratings(seed=0, n_users=120, n_items=80, density=0.4):
+    """Ratings made of a global mean, user and item biases and rank-2 factors, partly observed"""
+    rng = np.random.default_rng(seed)
+    full = (3.5 + rng.normal(0, 0.4, (n_users, 1)) + rng.normal(0, 0.4, (1, n_items))
+            + rng.normal(0, 0.5, (n_users, 2)) @ rng.normal(0, 0.5, (2, n_items)))
+    observed = rng.random(full.shape) < density
+    return full, observed, sp.csr_matrix(full * observed, dtype=np.float32)
+
+def test_scatter_add_matches_add_at():
+    """Repeated indices are summed, for 1-D and 2-D targets"""
+    rng = np.random.default_rng(1)
+    indices = rng.integers(0, 10, 50)
+    for shape in ((50,), (50, 3)):
+        updates = rng.normal(size=shape)
+        expected = np.zeros((10,) + shape[1:])
+        np.add.at(expected, indices, updates)
+        target = np.zeros((10,) + shape[1:])
+        scatter_add(target, indices, updates)
+        assert np.allclose(target, expected)
+
+def test_fit_learns_held_out_ratings():
+    """Unobserved cells are predicted well and training stops early"""
+    full, observed, ratings = biased_ratings()
+    model = BiasedMatrixFactorization(n_factors=4, learning_rate=0.02, regularization=0.02,
+                                      batch_size=128, max_epochs=300, patience=3).fit(ratings)
+    user_vectors, item_vectors = model.serving_factors()
+    predicted = user_vectors @ item_vectors
+
+    assert np.sqrt(np.mean((predicted - full)[~observed] ** 2)) < 0.3
+    assert model.n_epochs_ < 300
+    assert model.best_validation_rmse_ == min(epoch['validation_rmse'] for epoch in model.history_)
+    assert model.ratings_per_second_ > 0
+
+def test_serving_factors_and_fold_in():
+    """Serving dot products equal the biased prediction; a fold-in scores like the trained user"""
+    full, observed, ratings = biased_ratings(seed=2)
+    model = BiasedMatrixFactorization(n_factors=3, max_epochs=40).fit(ratings)
+    user_vectors, item_vectors = model.serving_factors()
+
+    users, items = np.meshgrid(np.arange(5), np.arange(80), indexing='ij')
+    expected = model._predict(users.ravel(), items.ravel()).reshape(5, 80)
+    assert np.allclose(user_vectors[:5] @ item_vectors, expected, atol=1e-4)
+
+    folded = fold_in_biased_user(item_vectors, ratings[0].toarray().ravel())
+    assert folded[-3] == 1 and folded[-1] == 1
+    trained_error = np.abs(user_vectors[0] @ item_vectors - full[0])[~observed[0]].mean()
+    folded_error = np.abs(folded @ item_vectors - full[0])[~observed[0]].mean()
+    assert folded_error < trained_error + 0.2
@@ -0,0 +1,68 @@
+"""
+Tests for versioned model bundles
+"""
+import sys
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from model_store import bundle_key, latest_bundle_key, save_bundle, load_bundle
+
+def test_bundle_round_trip(tmp_path):
+    """Dense arrays, sparse matrices and metadata load back unchanged"""
+    neighbors = sp.random(20, 20, density=0.2, random_state=0, format='csr', dtype=np.float32)
+    arrays = {'svd.user_factors': np.arange(12, dtype=np.float32).reshape(3, 4),
+              'item_knn.neighbors': neighbors}
+
+    save_bundle(str(tmp_path), 'abc123', arrays, {'movie_titles': {'1': 'Toy Story (1995)'}})
+    loaded, meta = load_bundle(str(tmp_path), 'abc123')
+
+    assert np.array_equal(loaded['svd.user_factors'], arrays['svd.user_factors'])
+    assert sp.isspmatrix_csr(loaded['item_knn.neighbors'])
+    assert (loaded['item_knn.neighbors'] != neighbors).nnz == 0
+    assert meta['movie_titles'] == {'1': 'Toy Story (1995)'}
+    assert [name for name in os.listdir(tmp_path)] == ['abc123']
+
+def test_missing_bundle_is_none(tmp_path):
+    """An unknown key loads as None so the caller trains instead"""
+    assert load_bundle(str(tmp_path), 'missing') is None
+
+def test_key_tracks_data_and_config(tmp_path):
+    """The key changes when the data file or the training config changes"""
+    data_file = tmp_path / 'u.data'
+    data_file.write_text('1\t1\t5\t0\n')
+    key = bundle_key([str(data_file)], {'factor_components': 50})
+
+    assert bundle_key([str(data_file)], {'factor_components': 50}) == key
+    assert bundle_key([str(data_file)], {'factor_components': 20}) != key
+    data_file.write_text('1\t1\t4\t0\n')
+    assert bundle_key([str(data_file)], {'factor_components': 50}) != key
+
+def test_latest_bundle_for_data_key(tmp_path):
+    """The newest bundle with a data key is found; other data keys and non-bundle directories are ignored"""
+    arrays = {'x': np.zeros(2)}
+    save_bundle(str(tmp_path), 'older', arrays, {'data_key': 'data1'})
+    time.sleep(0.01)
+    save_bundle(str(tmp_path), 'newer', arrays, {'data_key': 'data1'})
+    save_bundle(str(tmp_path), 'other', arrays, {'data_key': 'data2'})
+    os.makedirs(tmp_path / 'top_n')
+
+    assert latest_bundle_key(str(tmp_path), 'data1') == 'newer'
+    assert latest_bundle_key(str(tmp_path), 'data3') is None
+    assert latest_bundle_key(str(tmp_path / 'missing'), 'data1') is None
+
+def test_bundle_loads_as_read_only_memory_maps(tmp_path):
+    """Loaded arrays map the bundle files instead of copying them"""
+    neighbors = sp.random(10, 10, density=0.3, random_state=1, format='csr', dtype=np.float32)
+    save_bundle(str(tmp_path), 'mapped', {'factors': np.ones((4, 3)), 'neighbors': neighbors}, {})
+
+    loaded, _ = load_bundle(str(tmp_path), 'mapped')
+
+    assert isinstance(loaded['factors'], np.memmap)
+    assert not loaded['factors'].flags.writeable
+    assert not loaded['neighbors'].data.flags.writeable
+    assert not isinstance(load_bundle(str(tmp_path), 'mapped', mmap=False)[0]['factors'], np.memmap)
@@ -0,0 +1,55 @@
+"""
+Tests for the popularity model
+"""
+import sys
+import os
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from popularity import PopularityModel, SECONDS_PER_DAY
+
+def test_scores_match_per_item_loops(random_rating_log):
+    """Counts, means and Bayesian averages match computing them one item at a time"""
+    item_ids, ratings, timestamps = random_rating_log()
+    model = PopularityModel(np.arange(1, 31), prior_count=5).fit(item_ids, ratings, timestamps)
+    global_mean = ratings.mean()
+
+    bayesian = model.scores('bayesian')
+    for idx, item_id in enumerate(range(1, 31)):
+        item_ratings = ratings[item_ids == item_id]
+        assert model.counts[idx] == len(item_ratings)
+        assert np.isclose(bayesian[idx], (5 * global_mean + item_ratings.sum()) / (5 + len(item_ratings)))
+        if len(item_ratings):
+            assert np.isclose(model.item_stats(item_id)[0], item_ratings.mean())
+
+def test_incremental_ratings_match_refit(random_rating_log):
+    """Adding and replacing ratings one at a time gives the scores of fitting on the final ratings"""
+    item_ids, ratings, timestamps = random_rating_log()
+    model = PopularityModel(np.arange(1, 31)).fit(item_ids[:400], ratings[:400], timestamps[:400])
+    for item_id, rating, timestamp in zip(item_ids[400:], ratings[400:], timestamps[400:]):
+        model.add_rating(item_id, rating, timestamp)
+    # Replace an early rating with a newer one
+    model.add_rating(item_ids[0], 1.0, 400 * SECONDS_PER_DAY, previous=ratings[0], previous_timestamp=timestamps[0])
+    final_ratings, final_timestamps = ratings.copy(), timestamps.copy()
+    final_ratings[0], final_timestamps[0] = 1.0, 400 * SECONDS_PER_DAY
+
+    expected = PopularityModel(np.arange(1, 31)).fit(item_ids, final_ratings, final_timestamps)
+    for kind in PopularityModel.KINDS:
+        assert np.allclose(model.scores(kind), expected.scores(kind))
+    assert list(model.top_items(10)[0]) == list(expected.top_items(10)[0])
+
+def test_top_items_rank_damped_and_recent():
+    """A single 5-star rating loses to many 4.5s, recent ratings win the recent ranking, and exclusions are skipped"""
+    day = SECONDS_PER_DAY
+    model = PopularityModel([1, 2, 3, 4], prior_count=5, half_life_days=30).fit(
+        [1] + [2] * 20 + [3] * 20, [5.0] + [4.5] * 20 + [2.0] * 10 + [5.0] * 10,
+        [0.0] + [0.0] * 20 + [0.0] * 10 + [300.0 * day] * 10)
+
+    assert list(model.top_items(4, 'bayesian')[0]) == [2, 1, 3]
+    assert list(model.top_items(4, 'recent')[0])[0] == 3
+    assert list(model.top_items(2, exclude_ids=[2])[0]) == [1, 3]
+    assert model.item_stats(4) == (0.0, 0)
+    assert model.item_stats(99) is None
+    assert not model.add_rating(99, 5.0, 0.0)
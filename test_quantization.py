@@ -0,0 +1,54 @@
+"""
+Tests for int8 quantization of factor vectors
+"""
+import sys
+import os
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from quantization import quantize_rows, dequantize_rows, quantized_scores, precision_report
+
+def test_rows_round_trip_within_half_a_step():
+    """Each entry comes back within half its row's scale, and zero rows stay zero"""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8)) * rng.uniform(0.01, 10, size=(50, 1))
+    vectors[3] = 0
+
+    codes, scales = quantize_rows(vectors)
+
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.all(np.abs(dequantize_rows(codes, scales) - vectors) <= scales[:, None] / 2 + 1e-6)
+    assert not dequantize_rows(codes, scales)[3].any()
+
+def test_quantized_scores_match_dequantized_dot_products():
+    """Scores for one query or a block of queries equal dot products with the dequantized rows"""
+    rng = np.random.default_rng(1)
+    codes, scales = quantize_rows(rng.normal(size=(40, 6)))
+    queries = rng.normal(size=(5, 6))
+    expected = queries @ dequantize_rows(codes, scales).T
+
+    assert np.allclose(quantized_scores(codes, scales, queries), expected, atol=1e-4)
+    assert np.allclose(quantized_scores(codes, scales, queries[0]), expected[0], atol=1e-4)
+
+def test_quantized_scores_are_the_same_in_blocks():
+    """Scoring in blocks that do not divide the rows evenly gives the single-block scores"""
+    rng = np.random.default_rng(3)
+    codes, scales = quantize_rows(rng.normal(size=(40, 6)))
+    queries = rng.normal(size=(5, 6))
+
+    whole = quantized_scores(codes, scales, queries, block_rows=40)
+    assert np.allclose(quantized_scores(codes, scales, queries, block_rows=7), whole)
+    assert np.allclose(quantized_scores(codes, scales, queries[1], block_rows=7), whole[1])
+
+def test_precision_report_compares_against_float64():
+    """float32 is all but exact, and int8 stays close on RMSE and top-k overlap"""
+    rng = np.random.default_rng(2)
+    report = precision_report(rng.normal(size=(30, 10)), rng.normal(size=(200, 10)), k=10)
+
+    assert report['n_users'] == 30 and report['k'] == 10
+    assert report['float32']['rmse'] < 1e-5
+    assert report['float32']['top_k_overlap'] == 1.0
+    assert report['int8']['rmse'] < 0.05
+    assert report['int8']['top_k_overlap'] > 0.8
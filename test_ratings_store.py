@@ -0,0 +1,125 @@
+"""
+Tests for the sparse ratings store
+"""
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ratings_store import RatingsStore, parse_user_id
+
+def make_store():
+    """Small store with non-contiguous ids"""
+    frame = pd.DataFrame({
+        'user_id': [10, 10, 20, 30, 30, 30],
+        'item_id': [7, 3, 3, 7, 9, 3],
+        'rating': [5, 3, 4, 1, 2, 5]
+    })
+    return RatingsStore.from_frame(frame)
+
+def test_matches_pivot_table():
+    """Store layout matches the dense pivot table it replaces"""
+    data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml-100k', 'u1.base')
+    frame = pd.read_csv(data_file, sep='\t', names=['user_id', 'item_id', 'rating', 'timestamp'])
+    store = RatingsStore.from_frame(frame)
+    pivot = frame.pivot_table(index='user_id', columns='item_id', values='rating', fill_value=0)
+
+    assert list(store.user_ids) == list(pivot.index)
+    assert list(store.item_ids) == list(pivot.columns)
+    assert store.matrix.dtype == np.float32
+    assert np.array_equal(store.matrix.toarray(), pivot.values.astype(np.float32))
+
+def test_id_maps():
+    """Ids map to rows and columns in both directions"""
+    store = make_store()
+
+    assert store.shape == (3, 3)
+    assert store.user_row(20) == 1
+    assert store.item_col(9) == 2
+    assert store.user_row(99) is None
+    assert store.has_item(7) and not store.has_item(8)
+    assert store.user_ids[store.user_row(30)] == 30
+
+def test_user_and_item_access():
+    """Row and column accessors return the stored ratings"""
+    store = make_store()
+    user_idx = store.user_row(30)
+
+    cols, values = store.user_ratings(user_idx)
+    assert list(store.item_ids[cols]) == [3, 7, 9]
+    assert list(values) == [5, 1, 2]
+    assert list(store.user_vector(store.user_row(10))) == [3, 5, 0]
+    assert list(store.seen_mask(store.user_row(20))) == [True, False, False]
+
+    rows, values = store.item_ratings(store.item_col(3))
+    assert list(store.user_ids[rows]) == [10, 20, 30]
+    assert list(values) == [3, 4, 5]
+
+def test_duplicate_ratings_keep_last():
+    """A re-rated item keeps the latest rating"""
+    store = RatingsStore.from_ratings([1, 1, 2], [5, 5, 5], [2, 4, 3])
+
+    assert store.nnz == 2
+    assert store.user_vector(store.user_row(1))[0] == 4
+
+def test_pending_ratings_are_visible():
+    """Added ratings show up in every read before compaction"""
+    store = make_store()
+
+    assert store.add_rating(20, 9, 4)
+    assert store.add_rating(10, 7, 2)
+    assert not store.add_rating(99, 9, 4)
+    assert store.n_pending == 2
+
+    expected = store.matrix.toarray()
+    expected[store.user_row(20), store.item_col(9)] = 4
+    expected[store.user_row(10), store.item_col(7)] = 2
+    assert np.array_equal(store.rows([0, 1, 2]).toarray(), expected)
+    assert np.array_equal(store.user_vector(store.user_row(20)), expected[store.user_row(20)])
+    assert np.array_equal(store.seen_mask_rows([0, 1, 2]), expected > 0)
+    rows, values = store.item_ratings(store.item_col(9))
+    assert list(rows) == [1, 2] and list(values) == [4, 2]
+    assert np.allclose(store.user_products([1, 2, 3]), expected @ [1, 2, 3])
+    assert sorted(store.pending_ratings()) == [(10, 7, 2.0), (20, 9, 4.0)]
+
+def test_compaction_matches_rebuild():
+    """Compacting the overlay gives the matrix a full rebuild would"""
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'user_id': rng.integers(0, 40, 400), 'item_id': rng.integers(0, 30, 400),
+                          'rating': rng.integers(1, 6, 400)})
+    store = RatingsStore.from_frame(frame.iloc[:300])
+    store.min_compact = 25
+
+    for row in frame.iloc[300:].itertuples():
+        if store.has_user(row.user_id) and store.has_item(row.item_id):
+            store.add_rating(row.user_id, row.item_id, row.rating)
+    store.compact()
+
+    known = frame[frame['user_id'].isin(store.user_ids) & frame['item_id'].isin(store.item_ids)]
+    rebuilt = RatingsStore.from_frame(known)
+    assert store.n_pending == 0
+    assert np.array_equal(store.matrix.toarray(), rebuilt.matrix.toarray())
+    assert np.array_equal(store.csc.toarray(), rebuilt.matrix.toarray())
+
+def test_string_user_ids():
+    """Firebase-style string uids sit after the integer ids and survive saving and pending ratings"""
+    frame = pd.DataFrame({
+        'user_id': [10, 'uid-b', 20, 'uid-a', 10],
+        'item_id': [7, 3, 3, 7, 9],
+        'rating': [5, 3, 4, 1, 2]
+    })
+    store = RatingsStore.from_frame(frame)
+    assert store.user_ids.tolist() == [10, 20, 'uid-a', 'uid-b']
+    assert store.user_row('uid-b') == 3 and store.user_row(20) == 1
+
+    store.add_rating('uid-a', 9, 4.0)
+    assert store.pending_ratings() == [('uid-a', 9, 4.0)]
+    arrays = store.to_arrays()
+    assert arrays['user_ids'].dtype.kind == 'U'
+    restored = RatingsStore.from_arrays(arrays)
+    assert restored.user_ids.tolist() == [10, 20, 'uid-a', 'uid-b']
+    assert np.array_equal(restored.matrix.toarray(), store.matrix.toarray())
+    assert parse_user_id('42') == 42 and parse_user_id('uid-42') == 'uid-42'
@@ -0,0 +1,217 @@
+"""
+Tests for the vectorized recommendation scorers
+"""
+import sys
+import os
+import numpy as np
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.decomposition import TruncatedSVD, NMF
+from recommender_engine import (build_item_neighbors, build_item_neighbors_blocked, similar_items,
+                                item_knn_scores, user_knn_scores,
+                                align_item_features, content_scores, combine_scores,
+                                item_knn_scores_block, content_scores_block, top_k, top_k_per_row,
+                                fold_in_user, user_neighbors_for_vector)
+
+def random_similarity(n_items, seed=0):
+    """Symmetric similarity matrix with a unit diagonal"""
+    rng = np.random.default_rng(seed)
+    similarity = rng.random((n_items, n_items))
+    similarity = (similarity + similarity.T) / 2
+    np.fill_diagonal(similarity, 1.0)
+    return similarity
+
+def test_item_neighbors_keep_top_k_above_threshold():
+    """Each row keeps its k most similar other items above the threshold"""
+    similarity = random_similarity(30)
+    neighbors = build_item_neighbors(similarity, n_neighbors=5, min_similarity=0.3)
+
+    for item in range(30):
+        row = neighbors.getrow(item)
+        others = np.delete(np.arange(30), item)
+        expected = others[np.argsort(-similarity[item, others])[:5]]
+        expected = set(j for j in expected if similarity[item, j] > 0.3)
+
+        assert set(row.indices) == expected
+        assert item not in row.indices
+
+def test_blocked_item_neighbors_match_dense_build(random_ratings):
+    """Building in blocks, on one thread or several, gives the dense builder's neighbors"""
+    ratings = random_ratings(n_items=45, density=0.2)
+    expected = build_item_neighbors(cosine_similarity(ratings.T), n_neighbors=6, min_similarity=0.1)
+
+    for block_size, n_threads in ((7, 1), (16, 3), (100, 1)):
+        neighbors = build_item_neighbors_blocked(ratings, n_neighbors=6, min_similarity=0.1,
+                                                 block_size=block_size, n_threads=n_threads)
+        assert np.allclose(neighbors.toarray(), expected.toarray(), atol=1e-6)
+
+def test_blocked_item_neighbors_apply_support_and_shrinkage(random_ratings):
+    """Pairs with too few common raters are dropped and the rest are shrunk by n / (n + s)"""
+    ratings = random_ratings(n_items=45, density=0.2, seed=1)
+    rated = (ratings != 0).astype(np.float32)
+    support = (rated.T @ rated).toarray()
+    shrunk = cosine_similarity(ratings.T) * support / (support + 5)
+    shrunk[support < 3] = 0
+    expected = build_item_neighbors(shrunk, n_neighbors=6, min_similarity=0.05)
+
+    neighbors = build_item_neighbors_blocked(ratings, n_neighbors=6, min_similarity=0.05, min_support=3,
+                                             shrinkage=5, block_size=10)
+
+    assert np.allclose(neighbors.toarray(), expected.toarray(), atol=1e-6)
+    assert np.all(support[neighbors.nonzero()] >= 3)
+
+def test_similar_items_are_most_similar_first():
+    """An item's similar items are its stored neighbors in descending similarity"""
+    neighbors = build_item_neighbors(random_similarity(30, seed=9), n_neighbors=8, min_similarity=0.2)
+
+    items, similarities = similar_items(neighbors, 4, n=5)
+
+    row = neighbors[4].toarray().ravel()
+    assert len(items) == min(5, np.count_nonzero(row))
+    assert np.all(np.diff(similarities) <= 0)
+    assert np.allclose(similarities, np.sort(row[row > 0])[::-1][:5])
+    assert np.allclose(row[items], similarities)
+
+def test_item_knn_scores_match_loop():
+    """Vectorized scores equal the per-item weighted average over rated neighbors"""
+    similarity = random_similarity(40, seed=1)
+    neighbors = build_item_neighbors(similarity, n_neighbors=8, min_similarity=0.2)
+    user_vector = np.zeros(40, dtype=np.float32)
+    user_vector[[1, 4, 9, 17, 23, 31]] = [5, 3, 4, 1, 2, 5]
+
+    scores = item_knn_scores(neighbors, user_vector)
+
+    dense = neighbors.toarray()
+    for item in range(40):
+        weights = dense[item] * (user_vector > 0)
+        if weights.sum() > 0:
+            assert np.isclose(scores[item], (weights * user_vector).sum() / weights.sum())
+        else:
+            assert scores[item] == -np.inf
+
+def test_user_knn_scores_match_loop():
+    """Vectorized scores equal the per-item loop over the neighbor list"""
+    rng = np.random.default_rng(2)
+    ratings = rng.integers(1, 6, size=(25, 60)) * (rng.random((25, 60)) < 0.3)
+    similarity = random_similarity(25, seed=3)
+    neighbor_indices = np.argsort(similarity, axis=1)[:, ::-1][:, 1:13]
+    neighbor_similarities = np.take_along_axis(similarity, neighbor_indices, axis=1)
+
+    user = 4
+    scores = user_knn_scores(sp.csr_matrix(ratings, dtype=np.float32)[neighbor_indices[user]],
+                             neighbor_similarities[user],
+                             min_similarity=0.4, max_raters=3)
+
+    similar_users = [(other, sim) for other, sim in zip(neighbor_indices[user], neighbor_similarities[user])
+                     if sim > 0.4]
+    for item in range(60):
+        raters = sorted(((sim, ratings[other, item]) for other, sim in similar_users
+                         if ratings[other, item] > 0), reverse=True)[:3]
+        if raters:
+            expected = sum(sim * rating for sim, rating in raters) / sum(sim for sim, _ in raters)
+            assert np.isclose(scores[item], expected)
+        else:
+            assert scores[item] == -np.inf
+
+def test_content_scores_match_cosine_similarity():
+    """Profile and scores from sparse products equal the per-item cosine loop over unit-length rows"""
+    features = sp.random(20, 7, density=0.4, random_state=5, format='csr')
+    features.data += 0.1
+    feature_item_ids = [100 + i for i in range(20) if i != 6]
+    item_index = {100 + i: i for i in range(20)}
+    content_matrix, has_features = align_item_features(features[[i for i in range(20) if i != 6]],
+                                                       feature_item_ids, item_index, 20)
+    user_vector = np.zeros(20, dtype=np.float32)
+    user_vector[[0, 3, 6, 11]] = [4, 2, 5, 3]
+
+    scores = content_scores(content_matrix, user_vector, has_features)
+
+    assert not has_features[6] and scores[6] == -np.inf
+    dense = features.toarray()
+    dense = dense / np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+    profile = sum(dense[i] * user_vector[i] for i in [0, 3, 11])
+    for item in range(20):
+        if item != 6:
+            assert np.isclose(scores[item], cosine_similarity([profile], [dense[item]])[0][0], atol=1e-6)
+
+def test_combine_scores_is_scale_free():
+    """Rescaling one model's scores does not change the blended ranking"""
+    rng = np.random.default_rng(6)
+    candidates = rng.random(50) < 0.8
+    svd_scores = rng.normal(size=50)
+    knn_scores = rng.uniform(1, 5, size=50)
+    knn_scores[::7] = -np.inf
+    weights = {'svd': 0.6, 'item_knn': 0.4}
+
+    combined = combine_scores({'svd': svd_scores, 'item_knn': knn_scores}, weights, candidates)
+    rescaled = combine_scores({'svd': svd_scores * 10 + 3, 'item_knn': knn_scores}, weights, candidates)
+
+    assert np.all(combined[~candidates] == -np.inf)
+    assert np.all(np.isfinite(combined[candidates]))
+    assert np.allclose(combined[candidates], rescaled[candidates], atol=1e-5)
+
+def test_block_scores_match_single_user(random_ratings):
+    """Scoring a block of users gives the same rows as scoring each user alone"""
+    ratings = random_ratings(n_users=6, n_items=30, seed=7)
+    neighbors = build_item_neighbors(random_similarity(30, seed=8), n_neighbors=6, min_similarity=0.3)
+    features, has_features = align_item_features(sp.random(30, 5, density=0.5, random_state=9, format='csr'),
+                                                 list(range(30)), {i: i for i in range(30)}, 30)
+
+    knn_block = item_knn_scores_block(neighbors, ratings)
+    content_block = content_scores_block(features, ratings, has_features)
+    for user in range(6):
+        user_vector = ratings[user].toarray().ravel()
+        assert np.allclose(knn_block[user], item_knn_scores(neighbors, user_vector))
+        assert np.allclose(content_block[user], content_scores(features, user_vector, has_features), atol=1e-6)
+
+def test_top_k_skips_seen_excluded_and_unscored_items():
+    """Best scores come back in descending order, lower index first on ties, without masked items"""
+    scores = np.array([1.0, 3.0, 3.0, -np.inf, 2.0, 4.0, 0.5])
+    seen = np.zeros(7, dtype=bool)
+    seen[5] = True
+
+    indices, values = top_k(scores, 3, seen_mask=seen)
+    assert indices.tolist() == [1, 2, 4]
+    assert values.tolist() == [3.0, 3.0, 2.0]
+
+    indices, _ = top_k(scores, 10, seen_mask=seen, exclude=[2, 0])
+    assert indices.tolist() == [1, 4, 6]
+    assert scores[5] == 4.0
+
+def test_top_k_per_row_matches_top_k():
+    """Block selection returns each row's own top k"""
+    rng = np.random.default_rng(10)
+    scores = rng.random((4, 50))
+    seen = rng.random((4, 50)) < 0.3
+
+    for row, (indices, values) in enumerate(top_k_per_row(scores, 5, seen)):
+        expected = [i for i in np.argsort(-scores[row]) if not seen[row, i]][:5]
+        assert indices.tolist() == expected
+        assert np.allclose(values, scores[row, expected])
+
+def test_fold_in_reproduces_trained_users(random_ratings):
+    """Folding in a training user's own ratings gives back their factor vector"""
+    ratings = random_ratings(n_users=40, n_items=30, density=0.4, seed=11)
+    svd = TruncatedSVD(n_components=5, random_state=0).fit(ratings)
+    nmf = NMF(n_components=5, random_state=0, max_iter=1000).fit(ratings)
+    user_vector = ratings[3].toarray().ravel()
+
+    assert np.allclose(fold_in_user(svd.components_, user_vector), svd.transform(ratings[3])[0], atol=1e-4)
+    folded = fold_in_user(nmf.components_, user_vector, nonnegative=True)
+    assert np.all(folded >= 0)
+    assert np.allclose(folded @ nmf.components_, nmf.transform(ratings[3])[0] @ nmf.components_, atol=1e-2)
+
+def test_user_neighbors_for_vector_match_cosine(random_ratings):
+    """Neighbors of an outside rating vector are the most cosine-similar rows, best first"""
+    ratings = random_ratings(n_users=30, n_items=20, density=0.4, seed=12)
+    user_vector = np.random.default_rng(13).integers(0, 6, size=20).astype(np.float32)
+
+    indices, similarities = user_neighbors_for_vector(ratings, user_vector, n_neighbors=5)
+
+    expected = cosine_similarity(ratings, user_vector[None, :]).ravel()
+    assert indices.tolist() == np.argsort(-expected, kind='stable')[:5].tolist()
+    assert np.allclose(similarities, expected[indices])
@@ -0,0 +1,362 @@
+"""
+Tests for serving recommendations and predictions from the trained app
+"""
+import sys
+import os
+import threading
+import time
+import numpy as np
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TOP_N = 20
+
+@pytest.fixture(scope='module')
+def stored_app(trained_app):
+    """The trained app serving recommendations from a top-N store of TOP_N items per user and model"""
+    app = trained_app
+    app.refresh_user_neighbors()
+    app.build_top_n_store(n=TOP_N, processes=1)
+    app.top_n_checked_at = 0
+    serving_mode, app.SERVING_MODE = app.SERVING_MODE, 'precomputed'
+    yield app
+    app.SERVING_MODE = serving_mode
+
+def add_app_ratings(app, user_id, ratings):
+    """Save a user's {movie_id: rating} ratings straight to the app's database"""
+    for movie_id, rating in ratings.items():
+        app.rating_db.add_rating(user_id, movie_id, rating)
+
+def test_fold_in_covers_models_published_later(trained_app):
+    """An app-only user folded in while a model trains is served by that model once it is published"""
+    app = trained_app
+    client = app.app.test_client()
+    add_app_ratings(app, 9001, {1: 5, 2: 4, 3: 2})
+
+    svd = app.live.models['svd']
+    app.live.models['svd'] = None
+    try:
+        assert client.get('/recommendations/9001?n=5&model=content').status_code == 200
+        assert 'svd' not in app.live.folded_users[9001]['factors']
+    finally:
+        app.live.models['svd'] = svd
+
+    response = client.get('/recommendations/9001?n=5&model=svd')
+    assert response.status_code == 200
+    recommended = [movie['item_id'] for movie in response.get_json()['recommendations']]
+    assert len(recommended) == 5 and not {1, 2, 3} & set(recommended)
+
+def test_rating_stats_are_shared_through_the_database(trained_app):
+    """A rating shows in its movie's stats at once, and one saved by another worker after the next refresh"""
+    app = trained_app
+    client = app.app.test_client()
+
+    response = client.post('/movies/7/rate', json={'user_id': 9101, 'rating': 4})
+    assert response.get_json()['average_rating'] == 4.0 and response.get_json()['total_ratings'] == 1
+    assert app.get_rating_stats(7) == (4.0, 1)
+
+    add_app_ratings(app, 9102, {7: 2})
+    app.rating_stats_loaded_at = 0
+    assert app.get_rating_stats(7) == (3.0, 2)
+    assert app.get_rating_stats(8) == (0.0, 0)
+
+def test_rating_replaces_the_u_data_rating_in_popularity(trained_app):
+    """Rating a movie a user already rated in u.data swaps that rating out of the popularity model"""
+    app = trained_app
+    user_id, movie_id, old_rating = (int(value) for value in app.live.data.iloc[0][['user_id', 'item_id', 'rating']])
+    new_rating = 1 if old_rating != 1 else 5
+    item_idx = app.live.popularity.item_index[movie_id]
+    count, total = app.live.popularity.counts[item_idx], app.live.popularity.sums[item_idx]
+
+    client = app.app.test_client()
+    assert client.post(f'/movies/{movie_id}/rate', json={'user_id': user_id, 'rating': new_rating}).status_code == 200
+    assert app.live.popularity.counts[item_idx] == count
+    assert app.live.popularity.sums[item_idx] == total - old_rating + new_rating
+
+def test_popularity_takes_in_other_workers_ratings(trained_app):
+    """Ratings saved by another worker reach the popularity rankings at the next rebuild"""
+    app = trained_app
+    popularity = app.get_popularity()
+    count = popularity.item_stats(9)[1]
+
+    add_app_ratings(app, 9401, {9: 5})
+    assert app.get_popularity().item_stats(9)[1] == count
+    app.popularity_loaded_at = 0
+    assert app.get_popularity().item_stats(9)[1] == count + 1
+
+def test_unknown_users_get_popular_movies(trained_app):
+    """Users with no ratings anywhere are recommended the most popular movies, less their exclusions"""
+    app = trained_app
+    client = app.app.test_client()
+    popular = [int(item_id) for item_id in app.get_popularity().top_items(6)[0]]
+
+    response = client.get('/recommendations/uid-9501?n=5&model=svd')
+    assert response.status_code == 200
+    assert response.get_json()['model'] == 'popular' and response.get_json()['served_from'] == 'popular'
+    assert [movie['item_id'] for movie in response.get_json()['recommendations']] == popular[:5]
+
+    app.rating_db.add_to_watchlist('uid-9501', popular[0])
+    response = client.get('/recommendations/uid-9501?n=5&model=svd&exclude=watchlist')
+    assert [movie['item_id'] for movie in response.get_json()['recommendations']] == popular[1:6]
+
+def test_ratings_refresh_neighbor_lists_off_the_request_path(trained_app, monkeypatch):
+    """A rating queues its user for the background neighbor list refresh instead of refreshing on the request"""
+    app = trained_app
+    refresh_user_neighbors = app.refresh_user_neighbors
+    monkeypatch.setattr(app, 'refresh_user_neighbors', lambda: 0)
+    client = app.app.test_client()
+    user_idx = app.live.train_ratings.user_index[30]
+    before = [np.array(array) for array in app.live.models['user_knn']['index'].neighbors(user_idx)]
+
+    unseen = np.flatnonzero(~app.live.train_ratings.seen_mask(user_idx))[:10]
+    for item_id in app.live.train_ratings.item_ids[unseen]:
+        assert client.post(f'/movies/{item_id}/rate', json={'user_id': 30, 'rating': 5}).status_code == 200
+    assert all(np.array_equal(array, held) for array, held in
+               zip(app.live.models['user_knn']['index'].neighbors(user_idx), before))
+
+    assert refresh_user_neighbors() >= 1
+    assert not np.array_equal(app.live.models['user_knn']['index'].neighbors(user_idx)[1], before[1])
+
+def test_string_user_ids_are_served(trained_app):
+    """Users with Firebase-style string uids can rate, are folded in and keep their ids in retraining data"""
+    app = trained_app
+    client = app.app.test_client()
+    for movie_id, rating in ((1, 5), (2, 4), (3, 1)):
+        response = client.post(f'/movies/{movie_id}/rate', json={'user_id': 'uid-9301', 'rating': rating})
+        assert response.status_code == 200
+    assert client.post('/movies/1/rate', json={'user_id': 1.5, 'rating': 3}).status_code == 400
+
+    response = client.get('/recommendations/uid-9301?n=5&model=svd')
+    assert response.status_code == 200
+    assert not {1, 2, 3} & {movie['item_id'] for movie in response.get_json()['recommendations']}
+    batch = client.post('/recommendations/batch', json={'user_ids': ['uid-9301'], 'n': 5, 'model': 'svd'})
+    assert [movie['item_id'] for movie in batch.get_json()['recommendations']['uid-9301']] \
+        == [movie['item_id'] for movie in response.get_json()['recommendations']]
+
+    single = client.get('/predict?user_id=uid-9301&item_id=8&model=svd')
+    batch = client.post('/predict/batch', json={'model': 'svd', 'pairs': [{'user_id': 'uid-9301', 'item_id': 8}]})
+    assert single.status_code == 200 and batch.status_code == 200
+    assert batch.get_json()['predictions'][0]['predicted_rating'] == single.get_json()['predicted_rating']
+
+    app_ratings = app.load_app_ratings()
+    assert set(app_ratings.loc[app_ratings['user_id'] == 'uid-9301', 'item_id']) == {1, 2, 3}
+    assert app.RatingsStore.from_frame(app_ratings).has_user('uid-9301')
+    assert app.current_bundle_key(app_ratings)
+
+def test_admin_routes_require_the_admin_token(trained_app, monkeypatch):
+    """POST /admin/retrain is refused without ADMIN_TOKEN set, and without it as the bearer token"""
+    app = trained_app
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'start_background_retrain', lambda: False)
+    assert client.post('/admin/retrain').status_code == 403
+
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/retrain').status_code == 401
+    assert client.post('/admin/retrain', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.post('/admin/retrain', headers={'Authorization': 'Bearer secret'}).status_code == 409
+
+def test_models_that_are_not_ready_fall_back_in_priority_order(trained_app, monkeypatch):
+    """A request for a model that is not ready is served by the first ready model in MODEL_PRIORITY"""
+    app = trained_app
+    client = app.app.test_client()
+
+    down = []
+    for model in app.MODEL_PRIORITY[:2]:
+        down.append(model)
+        monkeypatch.setattr(app, 'live', app.live.with_model(model, None))
+        monkeypatch.setitem(app.model_states, model, {'state': 'training'})
+        expected = next(name for name in app.MODEL_PRIORITY if name not in down)
+
+        response = client.get(f'/recommendations/2?n=5&model={down[0]}').get_json()
+        assert response['model'] == expected
+        assert response['fallback'] == {'requested_model': down[0], 'served_model': expected,
+                                        'reason': f'{down[0]} is not ready yet'}
+        assert response['recommendations'][0]['model'] == app.MODEL_LABELS[expected]
+
+    # /predict only falls back to models that predict single ratings
+    supported = app.FACTOR_MODELS + ('content',)
+    expected = next(name for name in app.MODEL_PRIORITY if name not in down and name in supported)
+    response = client.get(f'/predict?user_id=2&item_id=8&model={down[0]}').get_json()
+    assert response['model'] == expected and response['fallback']['served_model'] == expected
+
+def test_batch_predictions_match_single_predictions(trained_app):
+    """Every model predicts a batch, with a folded-in user and unknown users and items, as it does pair by pair"""
+    app = trained_app
+    client = app.app.test_client()
+    add_app_ratings(app, 9201, {4: 5, 5: 3, 6: 1})
+    pairs = [(user_id, item_id) for user_id in (2, 3, 9201, 99999) for item_id in (8, 9, 11, 999)]
+
+    for model in app.FACTOR_MODELS + ('content', 'ensemble'):
+        response = client.post('/predict/batch', json={'model': model, 'pairs': [
+            {'user_id': user_id, 'item_id': item_id} for user_id, item_id in pairs]})
+        assert response.status_code == 200 and response.get_json()['model'] == model
+        for (user_id, item_id), batch in zip(pairs, response.get_json()['predictions']):
+            single = client.get(f'/predict?user_id={user_id}&item_id={item_id}&model={model}')
+            if user_id == 99999 or item_id == 999:
+                assert single.status_code == 404 and batch['error'] == single.get_json()['error']
+            else:
+                assert single.status_code == 200 and batch['predicted_rating'] == single.get_json()['predicted_rating']
+
+def test_batch_recommendations_match_single_user_requests(trained_app):
+    """/recommendations/batch lists what /recommendations does for training, app-only and unknown users"""
+    app = trained_app
+    client = app.app.test_client()
+    add_app_ratings(app, 9601, {4: 5, 5: 3, 6: 1})
+    user_ids = [2, 3, 9601, 'uid-9602']
+
+    for model in ('svd', 'item_knn', 'user_knn', 'content', 'ensemble'):
+        batch = client.post('/recommendations/batch', json={'user_ids': user_ids, 'n': 5, 'model': model})
+        assert batch.status_code == 200
+        for user_id in user_ids:
+            single = client.get(f'/recommendations/{user_id}?n=5&model={model}').get_json()['recommendations']
+            listed = batch.get_json()['recommendations'][str(user_id)]
+            assert [movie['item_id'] for movie in listed] == [movie['item_id'] for movie in single]
+            assert np.allclose([movie['predicted_rating'] for movie in listed],
+                               [movie['predicted_rating'] for movie in single], atol=0.011)
+
+def test_factor_predictions_are_user_item_dot_products(trained_app):
+    """Factor models predict a pair as the clipped dot product of its user's and item's vectors"""
+    app = trained_app
+    add_app_ratings(app, 9202, {4: 2, 7: 5})
+    users = [app.resolve_user(3), app.resolve_user(9202)]
+    item_indices = np.array([app.live.train_ratings.item_index[item_id] for item_id in (8, 12)])
+
+    for model in app.FACTOR_MODELS:
+        user_factors = np.stack([app.live.models[model]['user_factors'][users[0][0]],
+                                 app.get_folded_factors(model, users[1][1])])
+        expected = np.clip(np.einsum('ij,ji->i', user_factors, app.get_item_factors(model)[:, item_indices]), 1, 5)
+        assert np.allclose(app.predict_pairs(model, users, item_indices), expected, atol=1e-4)
+
+def test_only_poster_search_models_search_tmdb(trained_app, monkeypatch):
+    """Models outside POSTER_SEARCH_MODELS show cached posters only and never search TMDB"""
+    app = trained_app
+    searched = []
+    monkeypatch.setattr(app.tmdb_client, 'search_movie', lambda title, *args: searched.append(title))
+
+    for model in app.MODEL_LABELS:
+        del searched[:]
+        recommendations = app.get_user_recommendations(2, 3, model)
+        assert all(movie['poster_url'] is None for movie in recommendations)
+        assert len(searched) == (3 if model in app.POSTER_SEARCH_MODELS else 0)
+
+def test_stored_recommendations_match_online(stored_app):
+    """The top-N store lists the items and scores each model's online scoring gives"""
+    app = stored_app
+    assert set(app.get_top_n_store()[2]['models']) == set(app.MODEL_PRIORITY) | {'ensemble'}
+    user_ids = [user_id for user_id in range(10, 20) if user_id not in app.live.dirty_users]
+
+    for model in app.get_top_n_store()[2]['models']:
+        for user_id in user_ids:
+            stored = app.get_stored_recommendations(user_id, 10, model)
+            online = app.get_user_recommendations(user_id, 10, model)
+            assert [movie['item_id'] for movie in stored] == [movie['item_id'] for movie in online]
+            assert np.allclose([movie['predicted_rating'] for movie in stored],
+                               [movie['predicted_rating'] for movie in online], atol=0.011)
+
+    response = app.app.test_client().get(f'/recommendations/{user_ids[0]}?n=10&model=svd')
+    assert response.get_json()['served_from'] == 'precomputed'
+
+def test_stored_recommendations_look_up_posters_as_online(stored_app, monkeypatch):
+    """Stored recommendations search TMDB for posters only for the models whose online recommendations do"""
+    app = stored_app
+    searched = []
+    monkeypatch.setattr(app.tmdb_client, 'search_movie', lambda title, *args: searched.append(title))
+    user_id = next(user_id for user_id in range(10, 20) if user_id not in app.live.dirty_users)
+
+    for model in app.get_top_n_store()[2]['models']:
+        del searched[:]
+        assert len(app.get_stored_recommendations(user_id, 3, model)) == 3
+        assert len(searched) == (3 if model in app.POSTER_SEARCH_MODELS else 0)
+
+def test_stored_recommendations_fall_back_to_online(stored_app):
+    """Users who rated since the store was built, and exclusions that cut a full list below n, are scored online"""
+    app = stored_app
+    client = app.app.test_client()
+    user_id = 21
+    stored = app.get_stored_recommendations(user_id, 10, 'svd')
+    stored_items = [app.live.train_ratings.item_index[movie['item_id']] for movie in stored]
+
+    assert [movie['item_id'] for movie in app.get_stored_recommendations(user_id, 10, 'svd', stored_items[:5])] \
+        == [movie['item_id'] for movie in app.get_user_recommendations(user_id, 10, 'svd', stored_items[:5])]
+    full_list = app.get_top_n_store()[1]['svd.item_ids'][app.live.train_ratings.user_index[user_id]]
+    excluded = [app.live.train_ratings.item_index[item_id] for item_id in full_list[:TOP_N - 5]]
+    assert app.get_stored_recommendations(user_id, 10, 'svd', excluded) is None
+
+    assert client.post(f'/movies/{stored[0]["item_id"]}/rate', json={'user_id': user_id, 'rating': 1}).status_code == 200
+    assert app.get_stored_recommendations(user_id, 10, 'svd') is None
+    response = client.get(f'/recommendations/{user_id}?n=10&model=svd')
+    assert response.get_json()['served_from'] == 'online'
+    assert stored[0]['item_id'] not in [movie['item_id'] for movie in response.get_json()['recommendations']]
+
+def test_short_top_n_lists_are_padded(stored_app):
+    """Users with fewer unseen items than n get their list followed by -1 item ids and NaN scores"""
+    app = stored_app
+    n = app.live.train_ratings.n_items
+    unseen = n - app.live.train_ratings.seen_mask_rows(np.arange(5)).sum(axis=1)
+
+    for model in ('svd', 'ensemble'):
+        block = app.compute_top_n_block(model, 0, 5, n)
+        assert block['item_ids'].shape == (5, n)
+        for row, length in enumerate(unseen):
+            assert (block['item_ids'][row, :length] >= 0).all() and np.isfinite(block['scores'][row, :length]).all()
+            assert (block['item_ids'][row, length:] == -1).all() and np.isnan(block['scores'][row, length:]).all()
+
+def test_compare_reports_slow_models_as_timed_out(trained_app, monkeypatch):
+    """A model past its deadline is reported as timed out while the others' results come back"""
+    app = trained_app
+    get_user_recommendations = app.get_user_recommendations
+    release, finished = threading.Event(), threading.Event()
+
+    def slow_nmf(user_id, n_recommendations=10, model='ensemble', *args):
+        if model == 'nmf':
+            release.wait(5)
+            finished.set()
+        return get_user_recommendations(user_id, n_recommendations, model, *args)
+
+    monkeypatch.setattr(app, 'get_user_recommendations', slow_nmf)
+    response = app.app.test_client().get('/compare/2?n=5&deadline=0.5').get_json()
+    release.set()
+    finished.wait(5)
+
+    assert response['partial'] and response['total_seconds'] < 1
+    assert response['comparison']['nmf']['timed_out'] and response['timings']['nmf']['status'] == 'timeout'
+    for model, timing in response['timings'].items():
+        if model != 'nmf':
+            assert timing['status'] == 'ok' and len(response['comparison'][model]) == 5
+
+def test_compare_models_run_on_the_request_bundle(trained_app):
+    """Compare tasks serve from the bundle they are given, and give up on starting past their deadline"""
+    app = trained_app
+    bundle = app.live.with_model('svd', None)
+
+    result, _ = app.run_compare_model(bundle, 2, 5, 'svd', time.time() + 5)
+    assert result == {'error': 'SVD model not trained'}
+    assert app.current_bundle() is app.live
+    assert app.run_compare_model(app.live, 2, 5, 'svd', time.time() - 1) == (None, None)
+
+def test_requests_finish_on_the_bundle_they_started_on(trained_app):
+    """A swap does not wait for running requests, and they keep serving from the bundle they started on"""
+    app = trained_app
+    old = app.live
+    started, release = threading.Event(), threading.Event()
+    served = []
+
+    def request():
+        with app.app.test_request_context('/'):
+            app.app.preprocess_request()
+            started.set()
+            release.wait(5)
+            served.append(app.current_bundle())
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    started.wait(5)
+    app.swap_bundle(*app.load_bundle(app.ARTIFACT_DIR, old.info['version']), source='loaded')
+    assert thread.is_alive() and app.live is not old
+
+    release.set()
+    thread.join()
+    assert served == [old]
+    assert app.current_bundle() is app.live
@@ -0,0 +1,114 @@
+"""
+Tests for the blocked user neighbor index
+"""
+import sys
+import os
+import pickle
+import numpy as np
+import scipy.sparse as sp
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sklearn.metrics.pairwise import cosine_similarity
+from ratings_store import RatingsStore
+from user_neighbors import UserNeighborIndex
+
+def expected_neighbors(ratings, k):
+    """Each user's top k other users by cosine similarity, from the dense matrix"""
+    similarity = cosine_similarity(ratings)
+    np.fill_diagonal(similarity, -np.inf)
+    order = np.argsort(-similarity, axis=1, kind='stable')[:, :k]
+    return order, np.take_along_axis(similarity, order, axis=1)
+
+def test_blocked_build_matches_dense_similarity(random_ratings):
+    """Any block size and thread count gives each user's top k by cosine similarity"""
+    ratings = random_ratings(n_users=50).toarray()
+    _, expected_similarities = expected_neighbors(ratings, 8)
+
+    for block_size, n_threads in ((7, 1), (16, 3), (100, 1)):
+        index = UserNeighborIndex.build(sp.csr_matrix(ratings), n_neighbors=8,
+                                        block_size=block_size, n_threads=n_threads)
+        assert index.neighbor_indices.shape == (50, 8)
+        assert np.allclose(index.neighbor_similarities, expected_similarities, atol=1e-6)
+        similarity = cosine_similarity(ratings)
+        assert np.allclose(np.take_along_axis(similarity, index.neighbor_indices.astype(np.int64), axis=1),
+                           index.neighbor_similarities, atol=1e-6)
+
+def test_refresh_follows_new_ratings(random_ratings):
+    """After a user rates, their list and the lists they now belong in match a rebuild once refreshed"""
+    ratings = random_ratings(n_users=50, seed=1).toarray()
+    store = RatingsStore(sp.csr_matrix(ratings), np.arange(50), np.arange(40))
+    index = UserNeighborIndex.from_arrays(UserNeighborIndex.build(store.matrix, n_neighbors=5).to_arrays())
+
+    # Make user 3 a copy of user 10 so they must enter user 10's list at the top
+    for item in range(40):
+        if ratings[10, item] != ratings[3, item]:
+            store.add_rating(3, item, ratings[10, item] or 0)
+    ratings[3] = ratings[10]
+    index.queue_user(3)
+    assert index.neighbor_indices[10][0] != 3
+    assert index.refresh(store) == 1 and index.refresh(store) == 0
+
+    rebuilt_indices, rebuilt_similarities = expected_neighbors(ratings, 5)
+    assert np.allclose(index.neighbor_similarities[3], rebuilt_similarities[3], atol=1e-5)
+    assert index.neighbor_indices[10][0] == 3
+    assert np.isclose(index.neighbor_similarities[10][0], 1.0, atol=1e-5)
+    for user in range(50):
+        assert np.all(np.diff(index.neighbor_similarities[user]) <= 1e-7)
+
+def test_refresh_leaves_built_arrays(random_ratings):
+    """Refreshes leave a loaded index's read-only arrays, and lists readers already hold, unchanged"""
+    ratings = random_ratings(n_users=50, seed=2).toarray()
+    store = RatingsStore(sp.csr_matrix(ratings), np.arange(50), np.arange(40))
+    arrays = UserNeighborIndex.build(store.matrix, n_neighbors=5).to_arrays()
+    for value in arrays.values():
+        value.flags.writeable = False
+    index = UserNeighborIndex.from_arrays(arrays)
+    held = [np.array(value) for value in index.neighbors(0)]
+    held_views = index.neighbors(0)
+
+    for item in range(40):
+        store.add_rating(0, item, 5.0)
+    index.queue_user(0)
+    index.refresh(store)
+
+    assert all(np.array_equal(view, copy) for view, copy in zip(held_views, held))
+    assert not np.array_equal(index.neighbors(0)[1], held[1])
+    assert np.array_equal(index.neighbor_similarities[0], index.neighbors(0)[1])
+
+def test_batched_refresh_matches_a_rebuild(random_ratings):
+    """Users refreshed together get a rebuild's lists, and their current similarity wherever they are listed"""
+    ratings = random_ratings(n_users=60, seed=4).toarray()
+    store = RatingsStore(sp.csr_matrix(ratings), np.arange(60), np.arange(40))
+    index = UserNeighborIndex.build(store.matrix, n_neighbors=6)
+    rng = np.random.default_rng(4)
+    users = [7, 21, 22, 40]
+    for user in users:
+        for item in rng.choice(40, 8, replace=False):
+            ratings[user, item] = rng.integers(1, 6)
+            store.add_rating(user, item, float(ratings[user, item]))
+        index.queue_user(user)
+    assert index.refresh(store) == len(users)
+
+    _, rebuilt_similarities = expected_neighbors(ratings, 6)
+    similarity = cosine_similarity(ratings)
+    for user in users:
+        assert np.allclose(index.neighbors(user)[1], rebuilt_similarities[user], atol=1e-5)
+        rows, cols = np.nonzero(index.neighbor_indices == user)
+        assert np.allclose(index.neighbor_similarities[rows, cols], similarity[rows, user], atol=1e-5)
+    for user in range(60):
+        assert np.all(np.diff(index.neighbor_similarities[user]) <= 1e-7)
+
+def test_built_index_pickles(random_ratings):
+    """A built index survives pickling, as when a training process sends it back, and still updates"""
+    ratings = random_ratings(n_users=50, seed=3).toarray()
+    store = RatingsStore(sp.csr_matrix(ratings), np.arange(50), np.arange(40))
+    index = UserNeighborIndex.build(store.matrix, n_neighbors=5)
+
+    restored = pickle.loads(pickle.dumps(index))
+    for name in UserNeighborIndex.ARRAYS:
+        assert np.array_equal(getattr(restored, name), getattr(index, name))
+    store.add_rating(0, 1, 5.0)
+    restored.queue_user(0)
+    restored.refresh(store)
@@ -0,0 +1,208 @@
+"""
+Top-k user neighbor lists by cosine similarity, built in blocks and refreshed in batches of users
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+
+class UserNeighborIndex:
+    """Each user's most similar other users, as (n_users x k) index and similarity arrays
+
+    Lists are in descending similarity. build computes the similarities of
+    block_size users against all users at a time and keeps only their top
+    k, so memory stays at one block x users array per thread rather than
+    the users x users matrix.
+
+    Users whose ratings change are queued with queue_user and brought up to
+    date together by refresh: their own lists are rebuilt, their similarity
+    is refreshed in the lists they appear in, and they enter any list whose
+    last neighbor they now beat. A list they drop down in keeps them until
+    the next build, since finding who should replace them would mean
+    recomputing that list.
+    """
+
+    # Arrays that fully describe a built index
+    ARRAYS = ('neighbor_indices', 'neighbor_similarities', 'user_norms')
+
+    def __init__(self, neighbor_indices, neighbor_similarities, user_norms):
+        # The built arrays are never changed, so a loaded index stays memory-mapped; refreshed
+        # lists go to an overlay of (rows, indices, similarities, {row: norm}) replaced in one step
+        self._arrays = (neighbor_indices, neighbor_similarities, user_norms)
+        self._overlay = self._empty_overlay(neighbor_indices.shape[1])
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, as when a training pool sends a built index back
+        return {'arrays': self._arrays, 'overlay': self._overlay, 'queued': self._queued}
+
+    def __setstate__(self, state):
+        self._arrays, self._overlay, self._queued = state['arrays'], state['overlay'], state['queued']
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @staticmethod
+    def _empty_overlay(k):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, k), dtype=np.int32), np.zeros((0, k), dtype=np.float32), {}
+
+    @property
+    def neighbor_indices(self):
+        rows, row_indices, _, _ = self._overlay
+        return self._patched(self._arrays[0], rows, row_indices)
+
+    @property
+    def neighbor_similarities(self):
+        rows, _, row_similarities, _ = self._overlay
+        return self._patched(self._arrays[1], rows, row_similarities)
+
+    @property
+    def user_norms(self):
+        norms = self._overlay[3]
+        return self._patched(self._arrays[2], np.fromiter(norms, dtype=np.int64, count=len(norms)),
+                             np.fromiter(norms.values(), dtype=np.float32, count=len(norms)))
+
+    @staticmethod
+    def _patched(array, rows, values):
+        """Get a built array with the overlay's rows written over it, copying it only if there are any"""
+        if not len(rows):
+            return array
+        array = np.array(array)
+        array[rows] = values
+        return array
+
+    @classmethod
+    def build(cls, ratings, n_neighbors=20, block_size=256, n_threads=1):
+        """Build the index from a users x items ratings matrix; the result does not depend on n_threads"""
+        ratings = sp.csr_matrix(ratings)
+        n_users = ratings.shape[0]
+        user_norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=1)).ravel()).astype(np.float32)
+        # Unit-length user rows in the ratings' precision, as cosine_similarity computes them
+        users = normalize(ratings)
+        users_by_item = users.T.tocsr()
+
+        k = max(min(n_neighbors, n_users - 1), 0)
+        neighbor_indices = np.zeros((n_users, k), dtype=np.int32)
+        neighbor_similarities = np.zeros((n_users, k), dtype=np.float32)
+
+        def build_block(start):
+            similarity = (users[start:start + block_size] @ users_by_item).toarray()
+            block_rows = np.arange(similarity.shape[0])
+            similarity[block_rows, start + block_rows] = -np.inf
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            values = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-values, axis=1, kind='stable')
+            neighbor_indices[start:start + block_size] = np.take_along_axis(top, order, axis=1)
+            neighbor_similarities[start:start + block_size] = np.take_along_axis(values, order, axis=1)
+
+        if k > 0:
+            starts = range(0, n_users, block_size)
+            if n_threads > 1:
+                with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                    list(executor.map(build_block, starts))
+            else:
+                for start in starts:
+                    build_block(start)
+        return cls(neighbor_indices, neighbor_similarities, user_norms)
+
+    def to_arrays(self):
+        """Get the index's arrays for saving"""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index from arrays saved with to_arrays"""
+        return cls(*(arrays[name] for name in cls.ARRAYS))
+
+    def neighbors(self, user_idx):
+        """Get (user indexes, similarities) of a user's neighbors, most similar first"""
+        neighbor_indices, neighbor_similarities, _ = self._arrays
+        rows, row_indices, row_similarities, _ = self._overlay
+        position = np.searchsorted(rows, user_idx)
+        if position < len(rows) and rows[position] == user_idx:
+            return row_indices[position], row_similarities[position]
+        return neighbor_indices[user_idx], neighbor_similarities[user_idx]
+
+    def queue_user(self, user_idx):
+        """Queue a user whose ratings changed for the next refresh"""
+        with self._lock:
+            self._queued.add(int(user_idx))
+
+    def refresh(self, ratings):
+        """Bring the lists up to date with the ratings of every queued user; returns how many were queued
+
+        ratings is the RatingsStore the index was built from, pending
+        ratings included. The queued users are scored against all users in
+        one sparse product, and the lists they change go to a new overlay
+        that replaces the old one in one step, so requests reading neighbor
+        lists meanwhile see either the old lists or the new ones.
+        """
+        with self._lock:
+            users, self._queued = sorted(self._queued), set()
+        if not users:
+            return 0
+        vectors = np.stack([ratings.user_vector(user_idx) for user_idx in users])
+        products = ratings.user_products(vectors.T)
+
+        with self._refresh_lock:
+            neighbor_indices, neighbor_similarities, user_norms = self._arrays
+            rows, row_indices, row_similarities, norms = self._overlay
+            norms = {**norms, **dict(zip(users, np.linalg.norm(vectors, axis=1).astype(np.float32).tolist()))}
+            k = neighbor_indices.shape[1]
+            if k > 0:
+                user_norms = np.array(user_norms, dtype=np.float64)
+                user_norms[list(norms)] = list(norms.values())
+                for column, user_idx in enumerate(users):
+                    rows, row_indices, row_similarities = self._refresh_user(
+                        user_idx, products[:, column], user_norms, rows, row_indices, row_similarities)
+            self._overlay = (rows, row_indices, row_similarities, norms)
+        return len(users)
+
+    def _refresh_user(self, user_idx, products, user_norms, rows, row_indices, row_similarities):
+        """Get the overlay (rows, indices, similarities) with one user's lists refreshed"""
+        neighbor_indices, neighbor_similarities, _ = self._arrays
+        k = neighbor_indices.shape[1]
+        norms = user_norms * user_norms[user_idx]
+        similarities = np.divide(products, norms, out=np.zeros(len(norms)), where=norms > 0).astype(np.float32)
+        similarities[user_idx] = -np.inf
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+
+        # The lists the user is in, and those whose last neighbor they now beat, as they stand now
+        listed = (neighbor_indices == user_idx).any(axis=1)
+        listed[rows] = (row_indices == user_idx).any(axis=1)
+        last = np.array(neighbor_similarities[:, -1])
+        last[rows] = row_similarities[:, -1]
+        entering = ~listed & (similarities > last)
+        changed = np.flatnonzero(listed | entering)
+        changed_indices = np.array(neighbor_indices[changed])
+        changed_similarities = np.array(neighbor_similarities[changed])
+        in_overlay = np.isin(changed, rows)
+        positions = np.searchsorted(rows, changed[in_overlay])
+        changed_indices[in_overlay] = row_indices[positions]
+        changed_similarities[in_overlay] = row_similarities[positions]
+
+        # Refresh the user's similarity where they are listed, and let them into
+        # lists whose last neighbor they now beat
+        listed_rows, listed_cols = np.nonzero(changed_indices == user_idx)
+        changed_similarities[listed_rows, listed_cols] = similarities[changed[listed_rows]]
+        entered = entering[changed]
+        changed_indices[entered, -1] = user_idx
+        changed_similarities[entered, -1] = similarities[changed[entered]]
+        order = np.argsort(-changed_similarities, axis=1, kind='stable')
+        changed_indices = np.take_along_axis(changed_indices, order, axis=1)
+        changed_similarities = np.take_along_axis(changed_similarities, order, axis=1)
+
+        # The user never lists themselves, so their own list is a row of its own
+        changed = np.append(changed, user_idx)
+        changed_indices = np.vstack([changed_indices, top[None].astype(np.int32)])
+        changed_similarities = np.vstack([changed_similarities, similarities[top][None]])
+
+        kept = ~np.isin(rows, changed)
+        rows = np.concatenate([rows[kept], changed])
+        order = np.argsort(rows, kind='stable')
+        return (rows[order], np.concatenate([row_indices[kept], changed_indices])[order],
+                np.concatenate([row_similarities[kept], changed_similarities])[order])